@@ -0,0 +1,86 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80; -*-
+
+"""Compare saving and loading service data as registries and as literals.
+
+Santiago used to save data with ``str`` and load it with ``ast.literal_eval``.
+This times both that and the ``registry`` format, on generated data, without
+any encryption (which costs the same either way).  Run it from ``src``::
+
+    $ PYTHONPATH=. python benchmarks/bench_registry.py --clients 10000
+
+"""
+
+import ast
+from optparse import OptionParser
+import sys
+import time
+
+import registry
+
+
+def build_tree(clients, services, locations):
+    """Make hosting data with the given number of entries at each level."""
+
+    return dict(
+        ("{0:040X}".format(client), dict(
+                ("service-{0}".format(service),
+                 ["https://{0}.{1}.example:{2}".format(client, service, port)
+                  for port in range(locations)])
+                for service in range(services)))
+        for client in range(clients))
+
+def best_time(function, repeat):
+    """The fastest of ``repeat`` runs, in seconds."""
+
+    best = None
+
+    for i in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def run(clients, services, locations, repeat):
+    tree = build_tree(clients, services, locations)
+
+    literal = str(tree)
+    lines = registry.dumps(tree)
+
+    assert ast.literal_eval(literal) == registry.loads(lines) == tree
+
+    results = (
+        ("literal save", best_time(lambda: str(tree), repeat), len(literal)),
+        ("literal load", best_time(lambda: ast.literal_eval(literal), repeat),
+         len(literal)),
+        ("registry save", best_time(lambda: registry.dumps(tree), repeat),
+         len(lines)),
+        ("registry load", best_time(lambda: registry.loads(lines), repeat),
+         len(lines)),
+        )
+
+    print("{0} clients, {1} services each, {2} locations each:".format(
+            clients, services, locations))
+    for name, seconds, size in results:
+        print("  {0:<14} {1:>9.4f}s {2:>12} bytes".format(name, seconds, size))
+
+def parse_args(args):
+    parser = OptionParser()
+    parser.add_option("-c", "--clients", dest="clients", type="int",
+                      default=1000, help="Number of clients.")
+    parser.add_option("-s", "--services", dest="services", type="int",
+                      default=5, help="Number of services per client.")
+    parser.add_option("-l", "--locations", dest="locations", type="int",
+                      default=3, help="Number of locations per service.")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int",
+                      default=3, help="Take the best of this many runs.")
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    (options, args) = parse_args(sys.argv[1:])
+
+    run(options.clients, options.services, options.locations, options.repeat)
@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80; -*-
+
+"""Time unwrapping onion-signed messages with the ``pgpprocessor.Unwrapper``.
+
+The signatures aren't real and aren't checked: this only times finding and
+unwrapping each layer, which is the Unwrapper's own work.  Run it from
+``src``::
+
+    $ PYTHONPATH=. python benchmarks/bench_unwrapper.py --layers 5 --size 65536
+
+"""
+
+from optparse import OptionParser
+import sys
+import time
+
+import pgpprocessor
+
+
+class Verified(object):
+    valid = True
+
+class FakeGpg(object):
+    """Accepts every signature, without calling gpg."""
+
+    def verify(self, data, **kwargs):
+        return Verified()
+
+    decrypt = verify
+
+def sign(message):
+    """Clearsign the message with a fake signature, dash-escaping its lines."""
+
+    escaped = "".join(("- " + line if line.startswith("-") else line)
+                      for line in message.splitlines(True))
+
+    return "".join((pgpprocessor.Unwrapper.SIG_HEAD, "Hash: SHA1\n\n",
+                    escaped, "\n",
+                    pgpprocessor.Unwrapper.SIG_FOOTER,
+                    "iEYEARECAAYFAk9mZ0YACgkQXXXXXXXXXXXXXXXXXXXXXXXXXXXX\n",
+                    "=abcd\n",
+                    pgpprocessor.Unwrapper.SIG_END))
+
+def build_message(layers, size):
+    """Make a message of about ``size`` bytes, signed ``layers`` times."""
+
+    line = "https://{0:040X}.example:8080\n"
+    message = "".join(line.format(i) for i in range(size // len(line.format(0))))
+
+    for i in range(layers):
+        message = sign(message)
+
+    return message
+
+def best_time(function, repeat):
+    """The fastest of ``repeat`` runs, in seconds."""
+
+    best = None
+
+    for i in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def unwrap_all(message, gpg):
+    return len(list(pgpprocessor.Unwrapper(message, gpg)))
+
+def run(layers, size, count, repeat):
+    gpg = FakeGpg()
+    message = build_message(layers, size)
+
+    assert unwrap_all(message, gpg) == layers
+
+    seconds = best_time(
+        lambda: [unwrap_all(message, gpg) for i in range(count)], repeat)
+
+    print("{0} messages of {1} bytes, {2} layers each:".format(
+            count, len(message), layers))
+    print("  {0:>9.4f}s {1:>9.2f} MB/s {2:>9.1f} messages/s".format(
+            seconds, count * len(message) / seconds / 2 ** 20,
+            count / seconds))
+
+def parse_args(args):
+    parser = OptionParser()
+    parser.add_option("-l", "--layers", dest="layers", type="int",
+                      default=3, help="Number of signatures on each message.")
+    parser.add_option("-s", "--size", dest="size", type="int",
+                      default=4096, help="Bytes in the innermost message.")
+    parser.add_option("-c", "--count", dest="count", type="int",
+                      default=1000, help="Number of messages to unwrap.")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int",
+                      default=3, help="Take the best of this many runs.")
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    (options, args) = parse_args(sys.argv[1:])
+
+    run(options.layers, options.size, options.count, options.repeat)
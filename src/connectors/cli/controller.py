@@ -13,7 +13,6 @@ There's no way to proxy requests or send requests over anything that isn't
 HTTP(S).
 
 :FIXME: add proxying.
-:FIXME: Fix the timeout
 :TODO: unit test the below:
 
 If key or service isn't specified: quit.
@@ -24,20 +23,11 @@ quit.
 If query == False: skip querying the host and just pull the list of locations
 they host for me from the cache and quit.
 
-Until I implement active-request polling and between-request timeouts:
+Until I implement between-request timeouts:
 
     query the host.
 
-    wait the timeout.
-
-    report the locations of the (now) locally known services and quit.
-
-After I implement active-request polling:
-
-    query the host.
-
-    poll the list of active requests until the active request is handled or the
-    timeout elapses.
+    wait until the host replies or the timeout elapses, whichever's first.
 
     report the locations of the (now) locally known services and quit.
 
@@ -68,10 +58,11 @@ import httplib
 import json
 from optparse import OptionParser
 import sys
-import time
 import urllib
 
-#import santiago
+import connectors.https.controller as httpcontroller
+import santiago
+from tracing import trace
 import sys
 sys.path.append("/home/nick/programs/freedombox/bjsonrpc")
 import bjsonrpc
@@ -179,7 +170,7 @@ class Monitor(santiago.SantiagoMonitor, bjsonrpc.handlers.BaseHandler):
 
     """
     def __init__(self, aSantiago, **kwargs):
-        santiago.debug_log("Initializing Monitor.")
+        trace("cli.monitor.create")
 
         super(Monitor, self).__init__(aSantiago, **kwargs)
 
@@ -203,7 +194,8 @@ def stop(*args, **kwargs):
     pass
 
 
-def query_remotely(address, port, key, service, params=None, timeout=1):
+def query_remotely(address, port, key, service, params=None, timeout=1,
+                   force=False):
     """Query the remote FreedomBuddy to learn new services, then report back.
 
     :conn: The HTTP(S) connection to send the request along.  Requires
@@ -213,6 +205,12 @@ def query_remotely(address, port, key, service, params=None, timeout=1):
 
     :service: The particular data to ask the other FBuddy for.
 
+    :timeout: The most seconds to wait for the other FBuddy to reply.  We
+      report back as soon as it does.
+
+    :force: Ask the other FBuddy even if my FreedomBuddy service asked it
+      recently, or is still waiting for it to reply.
+
     For example, if I wanted to ask Dave (who's key was "0x3") for his
     "wikipedia" service (he makes parody articles, he's a funny guy), I'd have
     to ask my FreedomBuddy service to find him:
@@ -227,14 +225,18 @@ def query_remotely(address, port, key, service, params=None, timeout=1):
     """
     # FIXME use socket, not http, especially since it doesn't validate certs.
     conn = httplib.HTTPSConnection(address, port)
-    query(conn, "learn", key, service, "POST")
+    body = {"host": key, "service": service}
+    if force:
+        body["force"] = 1
+    query(conn, "learn", key, service, "POST", body=body)
     conn.close()
 
-    time.sleep(timeout)
+    params = dict(params or {})
+    params["timeout"] = timeout
 
     # FIXME use socket, not http, especially since it doesn't validate certs.
     conn = httplib.HTTPSConnection(address, port)
-    locations = query(conn, "consuming", key, service, params=params)
+    locations = query(conn, "wait", key, service, params=params)
     conn.close()
 
     return locations
@@ -273,7 +275,9 @@ if __name__ == "__main__":
     #                      options.service, options.action, params=params)
     # else:
     #     response = query_remotely(options.address, options.port, options.key,
-    #                               options.service, params=params)
+    #                               options.service, params=params,
+    #                               timeout=options.timeout,
+    #                               force=bool(options.query))
 
     # conn.close()
 
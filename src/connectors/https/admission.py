@@ -0,0 +1,178 @@
+"""Admission control for the HTTPS listener, before any crypto happens.
+
+Anybody who can reach the listener can make it parse and decrypt whatever they
+send.  Before a request is queued for decryption, it has to get past:
+
+- The token bucket: the listener accepts ``rate`` requests per second, in
+  bursts of up to ``burst``.  Behind Tor, every request comes from 127.0.0.1,
+  so by default there's one bucket for everyone.  Listeners that see their
+  peers' real addresses can give each remote IP its own bucket instead, with
+  ``per_source``.
+- The body size limit: bodies over ``max_body`` bytes aren't read past that.
+- The decrypt budget: at most ``max_decrypts`` requests may be queued or
+  decrypting at once.
+
+Requests that don't get past are shed silently: the sender hears the same
+nothing it would otherwise.  Each decision is counted in ``stats``.
+
+Who sent a request is only known once it's decrypted, so sharing the handling
+fairly between friends is left to the ``scheduler``.
+
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class TokenBucket(object):
+    """Allows ``rate`` events per second, in bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst, now):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated = now
+
+    def take(self, now):
+        """Take a token, if there's one to take."""
+
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+class Admission(object):
+    """Decides which requests are worth decrypting."""
+
+    DECISIONS = (ADMITTED, RATE_LIMITED, TOO_LARGE, OVERLOADED) = (
+        "admitted", "rate_limited", "too_large", "overloaded")
+
+    def __init__(self, rate=20, burst=100, max_body=64 * 1024,
+                 max_decrypts=16, max_sources=4096, per_source=False,
+                 clock=time.time):
+        """Prepare the limits.
+
+        :rate: requests per second allowed, from everyone or each remote IP.
+
+        :burst: requests allowed at once, after it's been quiet.
+
+        :max_body: the largest request body read, in bytes.
+
+        :max_decrypts: the most requests queued or decrypting at once.
+
+        :max_sources: the most IPs to track.  The least recently seen are
+          forgotten first, which gives them a full bucket again.
+
+        :per_source: give each remote IP its own bucket, instead of sharing
+          one.  Only useful when the listener isn't behind a proxy.
+
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_body = int(max_body)
+        self.max_decrypts = int(max_decrypts)
+        self.max_sources = max(1, int(max_sources))
+        self.per_source = per_source
+        self.clock = clock
+
+        self.buckets = OrderedDict()
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.counters = dict((decision, 0) for decision in Admission.DECISIONS)
+
+    def allow_source(self, ip):
+        """Take a token from the IP's bucket, or the shared one.
+
+        Returns False (and counts it) when the bucket's empty.
+
+        """
+        now = self.clock()
+
+        if not self.per_source:
+            ip = None
+
+        with self.lock:
+            bucket = self.buckets.pop(ip, None)
+
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst, now)
+
+            self.buckets[ip] = bucket
+
+            while len(self.buckets) > self.max_sources:
+                self.buckets.popitem(last=False)
+
+            if bucket.take(now):
+                return True
+
+            self.counters[Admission.RATE_LIMITED] += 1
+            return False
+
+    def read_body(self, body, length=None):
+        """Read a request body, unless it's too large.
+
+        :body: the body's file-like object.
+
+        :length: the body's declared Content-Length, if there is one.
+
+        Returns None (and counts it) if the body is larger than ``max_body``.
+        No more than ``max_body`` + 1 bytes are ever read.
+
+        """
+        try:
+            declared = int(length) if length is not None else None
+        except ValueError:
+            declared = None
+
+        if declared is not None and declared > self.max_body:
+            data = None
+        else:
+            data = body.read(self.max_body + 1)
+
+            if len(data) > self.max_body:
+                data = None
+
+        if data is None:
+            with self.lock:
+                self.counters[Admission.TOO_LARGE] += 1
+
+        return data
+
+    def acquire(self):
+        """Reserve a decryption, if the budget allows one.
+
+        Every successful ``acquire`` must be matched by a ``release``.
+
+        """
+        with self.lock:
+            if self.in_flight >= self.max_decrypts:
+                self.counters[Admission.OVERLOADED] += 1
+                return False
+
+            self.in_flight += 1
+            self.counters[Admission.ADMITTED] += 1
+            return True
+
+    def release(self, *args):
+        """Return a decryption to the budget.
+
+        Takes (and ignores) any arguments, so it can be called back with the
+        finished request.
+
+        """
+        with self.lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = self.in_flight
+            stats["sources"] = len(self.buckets)
+
+        return stats
@@ -4,11 +4,16 @@ FIXME: add real authentication.
 
 """
 
+import inbound
 import santiago
+from connectors.https.admission import Admission
+from connectors.https.pool import HttpPool
+from connectors.https.templatecache import TemplateCache
+from tracing import trace
 
-from Cheetah.Template import Template
 import cherrypy
 import httplib2, socks
+import json
 import urllib, urlparse
 import sys
 import logging
@@ -32,7 +37,7 @@ def allow_ips(ips = None):
         ips = [ "127.0.0.1" ]
 
     if cherrypy.request.remote.ip not in ips:
-        santiago.debug_log("Request from non-local IP.  Forbidden.")
+        trace("https.forbidden_ip", ip=cherrypy.request.remote.ip)
         raise cherrypy.HTTPError(403)
 
 def allow_requests(requests = None):
@@ -49,7 +54,7 @@ def allow_requests(requests = None):
         requests = [requests]
 
     if cherrypy.request.method not in requests:
-        santiago.debug_log("Request of improper type.  Forbidden.")
+        trace("https.forbidden_method", method=cherrypy.request.method)
         raise cherrypy.HTTPError(405)
 
 cherrypy.tools.ip_filter = cherrypy.Tool('before_handler', allow_ips)
@@ -73,12 +78,40 @@ def stop(*args, **kwargs):
 class Listener(santiago.SantiagoListener):
 
     def __init__(self, my_santiago, socket_port=0,
-                 ssl_certificate="", ssl_private_key="", **kwargs):
+                 ssl_certificate="", ssl_private_key="",
+                 queue_depth=128, queue_workers=2,
+                 queue_policy=inbound.InboundQueue.DROP_OLDEST,
+                 rate_limit=20, rate_burst=100, max_body_size=64 * 1024,
+                 max_decrypts=16, max_sources=4096, per_source_limit=False,
+                 **kwargs):
+        """Create the HTTPS listener.
+
+        Incoming requests are queued and handled by ``queue_workers`` threads,
+        so the listener never waits on decryption.  At most ``queue_depth``
+        requests wait in the queue.  After that, ``queue_policy`` decides
+        whether the oldest or newest request is dropped.
 
-        santiago.debug_log("Creating Listener.")
+        Before it's queued, a request must be admitted: the listener accepts
+        ``rate_limit`` requests per second, in bursts of ``rate_burst``, of up
+        to ``max_body_size`` bytes each.  At most ``max_decrypts`` requests may
+        be queued or handled at once.  With ``per_source_limit``, each IP gets
+        its own rate limit instead, which only helps if the listener isn't
+        behind Tor.  See ``admission.Admission``.
+
+        """
+        trace("https.listener.create")
 
         super(santiago.SantiagoListener, self).__init__(my_santiago, **kwargs)
 
+        self.admission = Admission(float(rate_limit), float(rate_burst),
+                                   int(max_body_size), int(max_decrypts),
+                                   int(max_sources), boolean(per_source_limit))
+
+        self.queue = inbound.InboundQueue(self.handle_queued,
+                                          queue_depth, queue_workers,
+                                          queue_policy,
+                                          dropped=self.admission.release)
+
         cherrypy.server.socket_port = int(socket_port)
         cherrypy.server.ssl_certificate = ssl_certificate
         cherrypy.server.ssl_private_key = ssl_private_key
@@ -89,34 +122,86 @@ class Listener(santiago.SantiagoListener):
         cherrypy.tree.mount(cherrypy.Application(self), "",
                             {"/": {"request.dispatch": d}})
 
-        santiago.debug_log("Listener Created.")
+        trace("https.listener.created")
+
+    def start(self, *args, **kwargs):
+        self.queue.start()
+
+    def stop(self, *args, **kwargs):
+        self.queue.stop()
+
+    def stats(self):
+        return { "admission": self.admission.stats(),
+                 "queue": self.queue.stats() }
 
     @cherrypy.tools.ip_filter()
     @cherrypy.tools.request_filter(requests = "POST")
     def index(self):
-        """Receive an incoming Santiago request from another Santiago client."""
+        """Receive an incoming Santiago request from another Santiago client.
+
+        The request is queued for decryption and handling, so we reply
+        immediately.  Requests that aren't admitted are silently dropped.
 
+        """
         try:
-            body = cherrypy.request.body.read()
-            santiago.debug_log("Received request {0}".format(str(body)))
+            ip = cherrypy.request.remote.ip
+
+            if not self.admission.allow_source(ip):
+                trace("https.listener.rate_limited", ip=ip)
+                return
+
+            body = self.admission.read_body(
+                cherrypy.request.body,
+                cherrypy.request.headers.get("Content-Length"))
+
+            if body is None:
+                trace("https.listener.too_large", ip=ip)
+                return
+
+            trace("https.listener.received", body=body)
 
-            kwargs = urlparse.parse_qs(body)
+            request = urlparse.parse_qs(body)["request"]
 
-            self.incoming_request(kwargs["request"])
+            if not self.admission.acquire():
+                trace("https.listener.overloaded", ip=ip)
+                return
+
+            self.queue.put(request)
         except Exception as e:
             logging.exception(e)
 
+    def handle_queued(self, request):
+        """Handle a queued request, then return its decryption budget."""
+
+        try:
+            self.incoming_request(request)
+        finally:
+            self.admission.release()
+
 class Sender(santiago.SantiagoSender):
 
     def __init__(self, my_santiago,
                  proxy_type = socks.PROXY_TYPE_SOCKS5,
                  proxy_host = "",
                  proxy_port = 0,
+                 timeout = 30,
+                 max_per_host = 4,
+                 idle_timeout = 60,
                  **kwargs):
+        """Create the HTTPS sender.
 
+        ``timeout`` is the socket timeout, in seconds, for each connection, so
+        a dead peer can't hold a sending thread forever.
+
+        Connections are kept alive and reused for later requests to the same
+        destination.  At most ``max_per_host`` connections are kept to each
+        destination, and they're closed after ``idle_timeout`` seconds unused.
+
+        """
         super(santiago.SantiagoSender, self).__init__(my_santiago, **kwargs)
 
         self.proxy = None
+        self.timeout = float(timeout) if timeout else None
 
         # FIXME Fix proxying.  There's bitrot or version skew here.
         if proxy_type and proxy_host and proxy_port:
@@ -130,11 +215,21 @@ class Sender(santiago.SantiagoSender):
                 self.proxy = httplib2.ProxyInfo(proxy_type, proxy_host,
                                                 int(proxy_port))
 
+        # every pooled connection goes through the same proxy.
+        self.pool = HttpPool(
+            lambda: httplib2.Http(proxy_info = self.proxy,
+                                  timeout = self.timeout),
+            max_per_host, idle_timeout)
+
+    def stop(self, *args, **kwargs):
+        self.pool.clear()
+
     @cherrypy.tools.ip_filter()
     def outgoing_request(self, request, destination):
         """Send an HTTPS request to each Santiago client.
 
-        Don't queue, just immediately send the reply to each location we know.
+        Don't queue, just immediately send the reply to each location we know,
+        over a pooled connection.
 
         It's both simple and as reliable as possible.
 
@@ -142,23 +237,47 @@ class Sender(santiago.SantiagoSender):
         transport across the protocol.
 
         """
-        santiago.debug_log("request {0}".format(str(request)))
+        trace("https.sender.send", destination=destination, request=request)
 
         body = urllib.urlencode({ "request": request })
 
         if self.proxy:
             destination = str(destination)
 
-        connection = httplib2.Http(proxy_info = self.proxy)
-        connection.request(destination, "POST", body)
+        self.pool.request(destination, "POST", body, timeout = self.timeout)
+
+def boolean(value):
+    """Read a boolean setting, which comes from the config file as a string."""
+
+    if isinstance(value, basestring):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+
+    return bool(value)
+
+TEMPLATES = TemplateCache("connectors/https/templates")
 
 class Monitor(santiago.SantiagoMonitor):
 
-    def __init__(self, aSantiago, **kwargs):
-        santiago.debug_log("Creating Monitor.")
+    def __init__(self, aSantiago, warm_templates=True, check_templates=False,
+                 compress_responses=False, **kwargs):
+        """Create the HTTPS monitor.
+
+        Templates are compiled once and cached.  ``warm_templates`` compiles
+        them all now, instead of on their first request.  ``check_templates``
+        recompiles templates when their files change, for development.
+
+        ``compress_responses`` gzips HTML and JSON responses for clients that
+        accept it.
+
+        """
+        trace("https.monitor.create")
 
         super(Monitor, self).__init__(aSantiago, **kwargs)
 
+        TEMPLATES.check_mtime = boolean(check_templates)
+        if boolean(warm_templates):
+            TEMPLATES.warm()
+
         try:
             d = cherrypy.tree.apps[""].config["/"]["request.dispatch"]
         except KeyError:
@@ -174,6 +293,12 @@ class Monitor(santiago.SantiagoMonitor):
             ('/consuming/:host', HttpConsumedHost(self.santiago)),
             ('/consuming', HttpConsuming(self.santiago)),
             ('/learn/:host/:service', HttpLearn(self.santiago)),
+            ('/wait/:host/:service', HttpWait(self.santiago)),
+            ('/services/:service/clients', HttpServedClients(self.santiago)),
+            ('/services/:service/hosts', HttpServingHosts(self.santiago)),
+            ('/locations', HttpLocationClients(self.santiago)),
+            ('/scheduler', HttpScheduling(self.santiago)),
+            ('/requests', HttpRequests(self.santiago)),
             ("/stop", HttpStop(self.santiago)),
             ("/freedombuddy", root),
             )
@@ -181,9 +306,15 @@ class Monitor(santiago.SantiagoMonitor):
         for location, handler in routing_pairs:
             Monitor.rest_connect(d, location, handler)
 
-        cherrypy.tree.mount(root, "", {"/": {"request.dispatch": d}})
+        config = {"request.dispatch": d}
+        if boolean(compress_responses):
+            config.update({ "tools.gzip.on": True,
+                            "tools.gzip.mime_types": ["text/html",
+                                                      "application/json"] })
 
-        santiago.debug_log("Monitor Created.")
+        cherrypy.tree.mount(root, "", {"/": config})
+
+        trace("https.monitor.created")
 
     @classmethod
     def rest_connect(cls, dispatcher, location, controller, trailing_slash=True):
@@ -212,45 +343,46 @@ class HttpMonitor(object):
 
     # http://ha.ckers.org/xss.html
 
+    # JSON responses hold only this value, or every value if it's None.
+    json_value = None
+
     def __init__(self, *args, **kwargs):
         super(HttpMonitor, self).__init__()
-        self.relative_path = "connectors/https/templates"
+        self.templates = TEMPLATES
 
-    def _parse_query(self, query_input):
-        """Split a URL into its query string.
+    def respond(self, template, values, encoding="html", **kwargs):
+        """Fill in the template, or serialize the values for JSON requests.
 
-        Might raise any of: ValueError, TypeError, NameError
+        The encoding comes from the request's query, which CherryPy passes to
+        the handler, which passes it here.
 
         """
-        query = ""
+        if encoding == "json":
+            cherrypy.response.headers["Content-Type"] = "application/json"
+            return [self.to_json(values)]
 
-        if query_input:
-            query_input = query_input[query_input.find("?")+1:]
-            query = dict([item.split("=") for item in query_input.split("&")])
+        return [self.templates.render(encoding, self.santiago.locale,
+                                      template, values)]
 
-        return query
+    def to_json(self, values):
+        if self.json_value is not None:
+            values = values[self.json_value]
 
-    def respond(self, template, values, encoding="html"):
-        try:
-            query = self._parse_query(cherrypy.request.query_string)
-        except (ValueError, TypeError, NameError):
-            return
+        return json.dumps(values, default=HttpMonitor.json_default)
 
-        if query:
-            try:
-                encoding = query["encoding"]
-            except KeyError:
-                pass
+    @classmethod
+    def json_default(cls, value):
+        """Serialize the (ordered) sets that locations are kept in."""
 
-        return [str(Template(
-                    file="/".join((self.relative_path, encoding,
-                                   self.santiago.locale, template)),
-                    searchList = [dict(values)]))]
+        try:
+            return list(value)
+        except TypeError:
+            raise TypeError(repr(value) + " is not JSON serializable")
 
 class HttpRoot(santiago.SantiagoMonitor, HttpMonitor):
     @cherrypy.tools.ip_filter()
     def GET(self, **kwargs):
-        return self.respond("root.tmpl", {})
+        return self.respond("root.tmpl", {}, **kwargs)
 
 class HttpStop(santiago.Stop, HttpMonitor):
     @cherrypy.tools.ip_filter()
@@ -260,10 +392,25 @@ class HttpStop(santiago.Stop, HttpMonitor):
 
 class HttpLearn(santiago.Learn, HttpMonitor):
     @cherrypy.tools.ip_filter()
-    def POST(self, host, service):
-        super(HttpLearn, self).POST(host, service)
+    def POST(self, host, service, force="", **kwargs):
+        super(HttpLearn, self).POST(host, service, boolean(force))
+
+        # batches are shown with the rest of the host's services.
+        if service == santiago.Santiago.ALL_SERVICES or "," in service:
+            raise cherrypy.HTTPRedirect("/consuming/%s" % host)
+
         raise cherrypy.HTTPRedirect("/consuming/%s/%s" % (host, service))
 
+class HttpWait(santiago.Wait, HttpMonitor):
+    json_value = "locations"
+
+    @cherrypy.tools.ip_filter()
+    def GET(self, host, service, **kwargs):
+        return self.respond(
+            "consumedService.tmpl",
+            super(HttpWait, self).GET(host, service, **kwargs),
+            **kwargs)
+
 class HttpHosting(santiago.Hosting, HttpMonitor):
     @cherrypy.tools.ip_filter()
     def GET(self, **kwargs):
@@ -312,6 +459,8 @@ class HttpHostedClient(santiago.HostedClient, HttpMonitor):
         super(HttpHostedClient, self).DELETE(client, service)
 
 class HttpHostedService(santiago.HostedService, HttpMonitor):
+    json_value = "locations"
+
     @cherrypy.tools.ip_filter()
     def GET(self, client, service, **kwargs):
         return self.respond(
@@ -337,6 +486,50 @@ class HttpHostedService(santiago.HostedService, HttpMonitor):
         super(HttpHostedService, self).DELETE(client, service, location,
                                               **kwargs)
 
+class HttpServedClients(santiago.ServedClients, HttpMonitor):
+    json_value = "clients"
+
+    @cherrypy.tools.ip_filter()
+    def GET(self, service, **kwargs):
+        return self.respond(
+            "servedClients.tmpl",
+            super(HttpServedClients, self).GET(service, **kwargs),
+            **kwargs)
+
+class HttpServingHosts(santiago.ServingHosts, HttpMonitor):
+    json_value = "hosts"
+
+    @cherrypy.tools.ip_filter()
+    def GET(self, service, **kwargs):
+        return self.respond(
+            "servingHosts.tmpl",
+            super(HttpServingHosts, self).GET(service, **kwargs),
+            **kwargs)
+
+class HttpLocationClients(santiago.LocationClients, HttpMonitor):
+    json_value = "clients"
+
+    @cherrypy.tools.ip_filter()
+    def GET(self, location="", **kwargs):
+        return self.respond(
+            "locationClients.tmpl",
+            super(HttpLocationClients, self).GET(location, **kwargs),
+            **kwargs)
+
+class HttpScheduling(santiago.Scheduling, HttpMonitor):
+    @cherrypy.tools.ip_filter()
+    def GET(self, **kwargs):
+        return self.respond("scheduling.tmpl",
+                            super(HttpScheduling, self).GET(**kwargs),
+                            **kwargs)
+
+class HttpRequests(santiago.Requests, HttpMonitor):
+    @cherrypy.tools.ip_filter()
+    def GET(self, **kwargs):
+        return self.respond("requests.tmpl",
+                            super(HttpRequests, self).GET(**kwargs),
+                            **kwargs)
+
 class HttpConsuming(santiago.Consuming, HttpMonitor):
     @cherrypy.tools.ip_filter()
     def GET(self, **kwargs):
@@ -387,6 +580,8 @@ class HttpConsumedHost(santiago.ConsumedHost, HttpMonitor):
         super(HttpConsumedHost, self).DELETE(host, service, **kwargs)
 
 class HttpConsumedService(santiago.ConsumedService, HttpMonitor):
+    json_value = "locations"
+
     @cherrypy.tools.ip_filter()
     def GET(self, host, service, **kwargs):
         return self.respond(
@@ -431,12 +626,14 @@ def query(conn, type="", id="", service="",
 
     :params: the request parameters.  defaults to {}
 
-    :body: the request's body.  ignored unless posting.
+    :body: the request's body.  ignored unless posting.  It's sent as a form,
+    so the controller gets its values as arguments.
 
     """
     if params is None:
         params = {}
     params = urllib.urlencode(params)
+    headers = {}
 
     if action not in ("GET", "POST", "PUT", "DELETE"):
         return
@@ -447,12 +644,14 @@ def query(conn, type="", id="", service="",
         else:
             body = urllib.urlencode(body)
 
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+
     if url:
         location = url % locals()
     else:
         location = "/{0}/{1}/{2}?{3}".format(type, id, service, params)
 
-    conn.request(action, location, body)
+    conn.request(action, location, body, headers)
 
     response = conn.getresponse()
     data = response.read()
@@ -0,0 +1,201 @@
+"""Persistent HTTPS connections, pooled by destination.
+
+Santiagi talk to the same few friends over and over, so there's no sense in
+paying for a new TCP connection and TLS handshake on every message.  Each
+``httplib2.Http`` object keeps its connections alive between requests, so the
+pool hands out ``Http`` objects per destination, never to more than one thread
+at a time.
+
+Pooled connections are dropped when they've been idle too long or when the
+other end has closed them.
+
+"""
+
+import logging
+import select
+import threading
+import time
+import urlparse
+
+
+class PoolExhaustedError(Exception):
+    """Every connection to this destination stayed busy for too long."""
+
+    pass
+
+class HttpPool(object):
+    """A pool of ``httplib2.Http`` objects, keyed by scheme and host.
+
+    At most ``max_per_host`` connections to each destination exist at once,
+    whether they're in use or idle: new connections are only made when there
+    are no idle ones left to reuse.
+
+    """
+    def __init__(self, factory, max_per_host=4, idle_timeout=60):
+        """Create the pool.
+
+        :factory: makes a new ``httplib2.Http``, with any proxy settings.
+
+        :max_per_host: the most connections to keep to any one destination.
+
+        :idle_timeout: the seconds an unused connection is kept alive.
+
+        """
+        self.factory = factory
+        self.max_per_host = max(1, int(max_per_host))
+        self.idle_timeout = float(idle_timeout)
+        self.available = threading.Condition()
+        self.idle = dict()
+        self.busy = dict()
+        self.counters = { "created": 0, "reused": 0, "expired": 0,
+                          "unhealthy": 0 }
+
+    @classmethod
+    def key(cls, destination):
+        o = urlparse.urlparse(destination)
+        return (o.scheme, o.netloc)
+
+    def acquire(self, destination, timeout=None):
+        """Check out a connection to the destination.
+
+        Waits up to ``timeout`` seconds for one to become available.  Raises a
+        ``PoolExhaustedError`` if none do.
+
+        """
+        key = HttpPool.key(destination)
+        give_up = time.time() + timeout if timeout is not None else None
+
+        with self.available:
+            while True:
+                self._expire(key)
+                idle = self.idle.get(key, [])
+
+                while idle:
+                    connection, last_used = idle.pop()
+                    if HttpPool.healthy(connection):
+                        self.busy[key] = self.busy.get(key, 0) + 1
+                        self.counters["reused"] += 1
+                        return connection
+
+                    HttpPool.close(connection)
+                    self.counters["unhealthy"] += 1
+
+                if self.busy.get(key, 0) < self.max_per_host:
+                    self.busy[key] = self.busy.get(key, 0) + 1
+                    self.counters["created"] += 1
+                    break
+
+                remaining = give_up - time.time() if give_up else None
+                if remaining is not None and remaining <= 0:
+                    raise PoolExhaustedError(destination)
+
+                self.available.wait(remaining)
+
+        try:
+            return self.factory()
+        except:
+            self.release(destination, None)
+            raise
+
+    def release(self, destination, connection, healthy=True):
+        """Return a connection to the pool.
+
+        Unhealthy connections (ones that raised errors) are closed instead.
+
+        """
+        key = HttpPool.key(destination)
+
+        with self.available:
+            self.busy[key] = max(0, self.busy.get(key, 0) - 1)
+
+            if connection is not None:
+                if healthy:
+                    self.idle.setdefault(key, []).append(
+                        (connection, time.time()))
+                else:
+                    HttpPool.close(connection)
+                    self.counters["unhealthy"] += 1
+
+            self.available.notify()
+
+    def request(self, destination, method="GET", body=None, headers=None,
+                timeout=None):
+        """Send a request over a pooled connection."""
+
+        connection = self.acquire(destination, timeout)
+
+        try:
+            response = connection.request(destination, method, body, headers)
+        except:
+            self.release(destination, connection, healthy=False)
+            raise
+
+        self.release(destination, connection)
+
+        return response
+
+    def _expire(self, key):
+        """Close the destination's connections that have been idle too long.
+
+        The most recently used connections are at the end of the idle list.
+
+        """
+        now = time.time()
+        idle = self.idle.get(key, [])
+
+        while idle and now - idle[0][1] > self.idle_timeout:
+            HttpPool.close(idle.pop(0)[0])
+            self.counters["expired"] += 1
+
+        if not idle and key in self.idle:
+            del self.idle[key]
+
+    def clear(self):
+        """Close every idle connection."""
+
+        with self.available:
+            for connections in self.idle.itervalues():
+                for connection, last_used in connections:
+                    HttpPool.close(connection)
+            self.idle = dict()
+
+    def stats(self):
+        with self.available:
+            stats = dict(self.counters)
+            stats["idle"] = sum(len(x) for x in self.idle.itervalues())
+            stats["busy"] = sum(self.busy.itervalues())
+
+        return stats
+
+    @classmethod
+    def healthy(cls, connection):
+        """Whether each of the ``Http``'s open sockets is still usable.
+
+        An idle socket that's readable has either been closed by the other end
+        or has data nobody asked for.  Either way, it can't be reused.
+
+        """
+        for conn in getattr(connection, "connections", {}).itervalues():
+            sock = getattr(conn, "sock", None)
+            if sock is None:
+                continue
+
+            try:
+                readable, writable, errored = select.select([sock], [], [sock],
+                                                            0)
+            except (select.error, ValueError, TypeError) as e:
+                logging.debug(e)
+                return False
+
+            if readable or errored:
+                return False
+
+        return True
+
+    @classmethod
+    def close(cls, connection):
+        for conn in getattr(connection, "connections", {}).itervalues():
+            try:
+                conn.close()
+            except Exception as e:
+                logging.debug(e)
@@ -0,0 +1,105 @@
+"""A cache of compiled Cheetah templates for the HTTPS monitor.
+
+Building a ``Template(file=...)`` reads and compiles the template on every
+request.  Instead, each template is compiled to a class once, keyed by its
+(encoding, locale, template) and every later request just instantiates that
+class.
+
+If ``make templates`` has precompiled a template into a Python module next to
+it, that module is loaded instead of compiling the template at all.
+
+While developing, set ``check_mtime`` to recompile templates whenever their
+files change.
+
+"""
+
+import imp
+import logging
+import os
+import threading
+
+from Cheetah.Template import Template
+
+
+class TemplateCache(object):
+    """Compiled template classes, by (encoding, locale, template)."""
+
+    EXTENSION = ".tmpl"
+
+    def __init__(self, root, check_mtime=False):
+        self.root = root
+        self.check_mtime = check_mtime
+        self.classes = dict()
+        self.lock = threading.Lock()
+
+    def path(self, encoding, locale, template):
+        return "/".join((self.root, encoding, locale, template))
+
+    def get(self, encoding, locale, template):
+        """Return the template's compiled class, compiling it if necessary."""
+
+        key = (encoding, locale, template)
+        cached = self.classes.get(key)
+
+        if cached is not None and not self.check_mtime:
+            return cached[0]
+
+        path = self.path(encoding, locale, template)
+        mtime = os.path.getmtime(path) if self.check_mtime else None
+
+        if cached is not None and cached[1] == mtime:
+            return cached[0]
+
+        compiled = TemplateCache.load(path, key)
+
+        with self.lock:
+            self.classes[key] = (compiled, mtime)
+
+        return compiled
+
+    def render(self, encoding, locale, template, values):
+        """Fill in the template with the values."""
+
+        return str(self.get(encoding, locale, template)(
+                searchList = [dict(values)]))
+
+    def warm(self):
+        """Compile every template under the root, so no request has to."""
+
+        for directory, subdirectories, files in os.walk(self.root):
+            parts = os.path.relpath(directory, self.root).split(os.sep)
+            if len(parts) != 2:
+                continue
+
+            encoding, locale = parts
+            for template in files:
+                if template.endswith(TemplateCache.EXTENSION):
+                    try:
+                        self.get(encoding, locale, template)
+                    except Exception as e:
+                        logging.exception(e)
+
+    def clear(self):
+        with self.lock:
+            self.classes = dict()
+
+    @classmethod
+    def load(cls, path, key):
+        """Load the precompiled template module, or compile the template.
+
+        Precompiled modules are only used if they're newer than the template.
+
+        """
+        module_path = path[:-len(TemplateCache.EXTENSION)] + ".py"
+        class_name = os.path.basename(path)[:-len(TemplateCache.EXTENSION)]
+
+        try:
+            if os.path.getmtime(module_path) >= os.path.getmtime(path):
+                module = imp.load_source(
+                    "_".join(("fbuddy_template",) + key).replace(".", "_"),
+                    module_path)
+                return getattr(module, class_name)
+        except (OSError, IOError, ImportError, AttributeError) as e:
+            logging.debug(e)
+
+        return Template.compile(file=path)
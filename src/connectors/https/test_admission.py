@@ -0,0 +1,92 @@
+"""Tests for the HTTPS listener's admission control."""
+
+import StringIO
+import unittest
+
+from connectors.https.admission import Admission
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class AdmissionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.admission = Admission(rate=1, burst=2, max_body=10,
+                                   max_decrypts=2, max_sources=2,
+                                   per_source=True, clock=self.clock)
+
+    def test_burst(self):
+        """Each source may send a burst, then it's rate limited."""
+
+        allowed = [self.admission.allow_source("1.1.1.1") for i in range(3)]
+
+        self.assertEqual(allowed, [True, True, False])
+        self.assertTrue(self.admission.allow_source("2.2.2.2"))
+        self.assertEqual(self.admission.stats()["rate_limited"], 1)
+
+    def test_shared_bucket(self):
+        """Without per-source buckets, every source shares one."""
+
+        shared = Admission(rate=1, burst=2, clock=self.clock)
+
+        allowed = [shared.allow_source(ip)
+                   for ip in ("1.1.1.1", "2.2.2.2", "3.3.3.3")]
+
+        self.assertEqual(allowed, [True, True, False])
+        self.assertEqual(shared.stats()["sources"], 1)
+
+    def test_refill(self):
+        for i in range(3):
+            self.admission.allow_source("1.1.1.1")
+
+        self.clock.now += 1
+
+        self.assertTrue(self.admission.allow_source("1.1.1.1"))
+        self.assertFalse(self.admission.allow_source("1.1.1.1"))
+
+    def test_sources_bounded(self):
+        for ip in ("1.1.1.1", "2.2.2.2", "3.3.3.3"):
+            self.admission.allow_source(ip)
+
+        self.assertEqual(list(self.admission.buckets), ["2.2.2.2", "3.3.3.3"])
+
+    def test_body(self):
+        self.assertEqual(
+            self.admission.read_body(StringIO.StringIO("request=a"), "9"),
+            "request=a")
+
+    def test_body_too_large(self):
+        """Large bodies aren't read past the limit."""
+
+        body = StringIO.StringIO("request=" + "a" * 100)
+
+        self.assertEqual(self.admission.read_body(body), None)
+        self.assertEqual(body.tell(), 11)
+
+    def test_declared_too_large(self):
+        """Bodies declared too large aren't read at all."""
+
+        body = StringIO.StringIO("request=a")
+
+        self.assertEqual(self.admission.read_body(body, "1000"), None)
+        self.assertEqual(body.tell(), 0)
+        self.assertEqual(self.admission.stats()["too_large"], 1)
+
+    def test_decrypt_budget(self):
+        self.assertEqual([self.admission.acquire() for i in range(3)],
+                         [True, True, False])
+
+        self.admission.release()
+
+        self.assertTrue(self.admission.acquire())
+        self.assertEqual(self.admission.stats()["overloaded"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
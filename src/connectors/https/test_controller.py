@@ -8,6 +8,7 @@ import sys
 import time
 import unittest
 
+import connectors.cli.controller as cli
 import connectors.https.controller as controller
 import santiago
 import utilities
@@ -103,46 +104,33 @@ class HttpMonitorTest(unittest.TestCase):
     def setUp(self):
         self.monitor = controller.HttpMonitor(None)
 
-class HttpMonitorQueryTest(HttpMonitorTest):
-    """Test HttpMonitor's Queries."""
+class HttpMonitorJsonTest(HttpMonitorTest):
+    """JSON responses are serialized directly, without templates."""
 
-    def test_full_urls(self):
-        url = "https://localhost:8080/index?something=somethingelse"
-        self.assertEqual( { "something": "somethingelse" },
-                          self.monitor._parse_query(url) )
+    def test_all_values(self):
+        self.assertEqual(
+            json.loads(self.monitor.to_json({ "hosts": ["a", "b"] })),
+            { "hosts": ["a", "b"] })
 
-    def test_query_strings(self):
-        url = "something=somethingelse"
-        self.assertEqual( { "something": "somethingelse" },
-                          self.monitor._parse_query(url) )
+    def test_one_value(self):
+        """Some monitors only return one value, like a service's locations."""
 
-    def test_with_question(self):
-        url = "?something=somethingelse"
-        self.assertEqual( { "something": "somethingelse" },
-                          self.monitor._parse_query(url) )
+        self.monitor.json_value = "locations"
 
-    def test_multiple_url_queries(self):
-        url = "https://localhost:8080/index?something=somethingelse&this=that&1=2"
-        self.assertEqual( { "something": "somethingelse",
-                            "this": "that",
-                            "1": "2" },
-                          self.monitor._parse_query(url) )
+        self.assertEqual(
+            json.loads(self.monitor.to_json({ "service": "vpn",
+                                              "locations": ["https://1"] })),
+            ["https://1"])
 
-    def test_multiple_string_queries(self):
-        url = "?something=somethingelse&this=that&1=2"
-        self.assertEqual( { "something": "somethingelse",
-                            "this": "that",
-                            "1": "2" },
-                          self.monitor._parse_query(url) )
+    def test_ordered_sets(self):
+        locations = utilities.OrderedSet(["https://2", "https://1"])
 
-class HttpMonitorRespondTest(HttpMonitorTest):
-    """Nothing I can think of testing here.
+        self.assertEqual(
+            json.loads(self.monitor.to_json({ "vpn": locations })),
+            { "vpn": ["https://2", "https://1"] })
 
-    It's really just verifying Cheetah's Templates.  Worthwhile, perhaps?
-    Still, not a high priority.
-
-    """
-    pass
+    def test_unserializable(self):
+        self.assertRaises(TypeError, self.monitor.to_json, { "a": object() })
 
 class StopTest(MonitorTest):
     def test_post(self):
@@ -180,6 +168,20 @@ class Learn(MonitorTest):
             self.santiago.get_client_locations(self.santiago.me, self.service),
             self.value)
 
+    def test_forced_query(self):
+        """Forced queries from the command line reach the Santiago."""
+
+        forced = list()
+        self.santiago.query = (lambda host, service, force=False:
+                                   forced.append(force))
+
+        cli.query_remotely(self.conn.host, self.conn.port, self.santiago.me,
+                           self.service, timeout=0, force=True)
+        cli.query_remotely(self.conn.host, self.conn.port, self.santiago.me,
+                           self.service, timeout=0)
+
+        self.assertEqual(forced, [True, False])
+
     def test_redirected_to_service(self):
         """The HTTPS controller redirects to the learned service's location."""
 
@@ -191,6 +193,16 @@ This resource can be found at <a href='https://{0}:{1}/consuming/{2}/{3}'>\
 """.format(self.conn.host, self.conn.port, self.santiago.me, self.service),
                       data)
 
+    def test_batch_redirected_to_host(self):
+        """Several services are shown with the rest of the host's services."""
+
+        data = controller.query(self.conn, "learn", self.santiago.me,
+                                self.service + ",other", action="POST")
+
+        self.assertIn("""\
+This resource can be found at <a href='https://{0}:{1}/consuming/{2}'>\
+""".format(self.conn.host, self.conn.port, self.santiago.me), data)
+
 class Listener(MonitorTest):
     """External incoming-request listener.
 
@@ -261,6 +273,32 @@ class Listener(MonitorTest):
 
         self.assertTrue(self.kwargs["request"])
 
+    def test_admission_monitored(self):
+        """Admission decisions are reported by the scheduling monitor."""
+
+        controller.query(self.conn, "/", action="POST", body=self.request)
+
+        time.sleep(1)
+
+        stats = santiago.Scheduling(self.santiago).GET()
+
+        self.assertEqual(stats["listeners"]["https"]["admission"]["admitted"],
+                         1)
+
+    def test_queue_monitored(self):
+        """The inbound queue's depth and drops are reported."""
+
+        controller.query(self.conn, "/", action="POST", body=self.request)
+
+        time.sleep(1)
+
+        queue = santiago.Scheduling(self.santiago).GET()["listeners"]["https"][
+            "queue"]
+
+        self.assertEqual(queue["enqueued"], 1)
+        self.assertEqual(queue["depth"], 0)
+        self.assertEqual(queue["dropped_oldest"] + queue["dropped_newest"], 0)
+
 
 
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+"""Tests for the HTTPS connection pool."""
+
+import time
+import unittest
+
+from connectors.https.pool import HttpPool, PoolExhaustedError
+
+
+class FakeHttp(object):
+    """Stands in for ``httplib2.Http``, without any open sockets."""
+
+    def __init__(self):
+        self.connections = {}
+        self.requests = []
+
+    def request(self, destination, method, body, headers):
+        self.requests.append((destination, method, body))
+        if destination.endswith("/broken"):
+            raise IOError("connection reset")
+        return "response"
+
+class HttpPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = HttpPool(FakeHttp, max_per_host=2, idle_timeout=60)
+        self.destination = "https://localhost:8080/"
+
+    def test_connections_reused(self):
+        """Sequential requests to one host share a connection."""
+
+        self.pool.request(self.destination, "POST", "a")
+        self.pool.request(self.destination, "POST", "b")
+
+        self.assertEqual(self.pool.stats()["created"], 1)
+        self.assertEqual(self.pool.stats()["reused"], 1)
+
+    def test_pooled_by_host(self):
+        self.pool.request(self.destination, "POST", "a")
+        self.pool.request("https://elsewhere:8080/", "POST", "b")
+
+        self.assertEqual(self.pool.stats()["created"], 2)
+
+    def test_max_per_host(self):
+        """Don't make more connections to a host than allowed."""
+
+        self.pool.acquire(self.destination)
+        self.pool.acquire(self.destination)
+
+        self.assertRaises(PoolExhaustedError, self.pool.acquire,
+                          self.destination, 0.01)
+
+    def test_idle_expiry(self):
+        self.pool.idle_timeout = 0
+        self.pool.request(self.destination, "POST", "a")
+
+        time.sleep(0.01)
+        self.pool.request(self.destination, "POST", "b")
+
+        self.assertEqual(self.pool.stats()["expired"], 1)
+        self.assertEqual(self.pool.stats()["created"], 2)
+
+    def test_failed_connections_dropped(self):
+        self.assertRaises(IOError, self.pool.request,
+                          self.destination + "broken", "POST", "a")
+
+        stats = self.pool.stats()
+        self.assertEqual((stats["idle"], stats["busy"], stats["unhealthy"]),
+                         (0, 0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Tests for the compiled template cache."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from connectors.https.templatecache import TemplateCache
+
+
+class TemplateCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "json", "en"))
+        self.path = os.path.join(self.root, "json", "en", "service.tmpl")
+        self.write("$locations\n")
+
+        self.cache = TemplateCache(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, text, age=0):
+        with open(self.path, "w") as template:
+            template.write(text)
+
+        then = time.time() - age
+        os.utime(self.path, (then, then))
+
+    def render(self):
+        return self.cache.render("json", "en", "service.tmpl",
+                                 { "locations": [1] })
+
+    def test_render(self):
+        self.assertEqual(self.render(), "[1]\n")
+
+    def test_compiled_once(self):
+        self.assertIs(self.cache.get("json", "en", "service.tmpl"),
+                      self.cache.get("json", "en", "service.tmpl"))
+
+    def test_unchanged_without_mtime_checks(self):
+        self.render()
+        self.write("changed\n", -10)
+
+        self.assertEqual(self.render(), "[1]\n")
+
+    def test_mtime_invalidation(self):
+        self.cache.check_mtime = True
+        self.render()
+        self.write("changed\n", -10)
+
+        self.assertEqual(self.render(), "changed\n")
+
+    def test_warm(self):
+        self.cache.warm()
+
+        self.assertEqual(list(self.cache.classes),
+                         [("json", "en", "service.tmpl")])
+
+    def test_precompiled(self):
+        """Precompiled modules are used instead of the template."""
+
+        self.write("$locations\n", 10)
+        with open(self.path[:-len(".tmpl")] + ".py", "w") as module:
+            module.write("class service(object):\n"
+                         "    def __init__(self, searchList):\n"
+                         "        pass\n"
+                         "    def __str__(self):\n"
+                         "        return 'precompiled'\n")
+
+        self.assertEqual(self.render(), "precompiled")
+
+    def test_stale_precompiled_ignored(self):
+        with open(self.path[:-len(".tmpl")] + ".py", "w") as module:
+            module.write("broken = True\n")
+        self.write("$locations\n", -10)
+
+        self.assertEqual(self.render(), "[1]\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
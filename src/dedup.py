@@ -0,0 +1,101 @@
+"""Drops byte-identical messages seen again within a short window.
+
+Peers send each request to every one of our reply locations, and retry on
+other addresses, so the same ciphertext often arrives several times in a few
+seconds.  Each copy would cost a decryption.  The ``DuplicateFilter`` keeps a
+digest of every message seen in the last ``window`` seconds and drops the
+copies::
+
+    >>> duplicates = DuplicateFilter(window=60)
+    >>> duplicates.seen(request)
+    False
+    >>> duplicates.seen(request)
+    True
+
+At most ``size`` digests are kept.  When there are more, the oldest are
+forgotten early.
+
+"""
+
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+
+class DuplicateFilter(object):
+    """A time-windowed, bounded set of message digests."""
+
+    def __init__(self, window=60, size=4096, clock=time.time):
+        """Prepare the filter.
+
+        :window: the seconds a message is remembered for.
+
+        :size: the most messages remembered at once.
+
+        :clock: returns the current time, in seconds.
+
+        """
+        self.window = float(window)
+        self.size = max(1, int(size))
+        self.clock = clock
+        self.digests = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.counters = { "checked": 0, "duplicates": 0, "expired": 0,
+                          "evicted": 0 }
+
+    def seen(self, message):
+        """Whether the message was seen within the window.
+
+        Messages that weren't are remembered from now on.  Duplicates don't
+        extend the window.
+
+        """
+        digest = hashlib.sha256(message).digest()
+        now = self.clock()
+
+        with self.lock:
+            self.counters["checked"] += 1
+            self._expire(now)
+
+            if digest in self.digests:
+                self.counters["duplicates"] += 1
+                return True
+
+            self.digests[digest] = now
+
+            while len(self.digests) > self.size:
+                self.digests.popitem(last=False)
+                self.counters["evicted"] += 1
+
+        return False
+
+    def _expire(self, now):
+        """Forget the digests older than the window.
+
+        Digests are kept in the order they were seen, so only the oldest need
+        checking.
+
+        """
+        horizon = now - self.window
+
+        while self.digests:
+            digest, when = next(self.digests.iteritems())
+
+            if when > horizon:
+                break
+
+            del self.digests[digest]
+            self.counters["expired"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.digests.clear()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self.digests)
+
+            return stats
@@ -0,0 +1,243 @@
+"""When the services we consume expire, and refreshing them before they do.
+
+Hosts say how long each service's locations are good for.  ``ServiceExpiry``
+remembers when each (host, service) expires, so fresh locations can be used
+without asking the host again::
+
+    >>> expiry = ServiceExpiry(refresh, fraction=0.75)
+    >>> expiry.set("host", "wiki", 3600)
+    >>> expiry.fresh("host", "wiki")
+    True
+
+Once started, it also refreshes each service in the background, by calling
+``refresh(host, service)`` once ``fraction`` of its TTL has passed, so it's
+relearned before it lapses.  If the service isn't set again within ``retry``
+seconds, because the host's reply was lost, it's refreshed again, waiting twice
+as long before each retry.  Once it's expired, or been retried ``retries``
+times, the host is given up on until the service is set again.
+
+Services we were never given a TTL for are never fresh, and never refreshed.
+Expiry times are absolute, so they can be saved with the services' locations
+and set again, with ``expires``, when they're loaded.
+
+"""
+
+import heapq
+import logging
+import threading
+import time
+
+
+class ServiceExpiry(object):
+    """Expiry times for consumed services, and a thread that refreshes them."""
+
+    def __init__(self, refresh, fraction=0.75, retry=300, retries=5,
+                 clock=time.time):
+        """Prepare the table.
+
+        :refresh: called with each (host, service) to refresh, from the
+          refreshing thread.
+
+        :fraction: how much of each TTL passes before the service is
+          refreshed, from 0 to 1.
+
+        :retry: the seconds to wait for a refreshed service to be set again,
+          before refreshing it again.  Each later retry waits twice as long.
+
+        :retries: how many times an unanswered refresh is retried.
+
+        :clock: returns the current time, in seconds.
+
+        """
+        self.refresh = refresh
+        self.fraction = min(max(float(fraction), 0), 1)
+        self.retry = max(float(retry), 1e-3)
+        self.retries = max(int(retries), 0)
+        self.clock = clock
+
+        # (host, service): (refresh at, expires, ttl, unanswered refreshes), and
+        # the refresh times in a heap.  Heap entries that don't match the table
+        # are stale.  Services given up on are refreshed at None.
+        self.times = dict()
+        self.heap = list()
+        self.changed = threading.Condition()
+        self.thread = None
+        self.live = False
+
+        self.counters = { "set": 0, "refreshed": 0, "failed": 0,
+                          "abandoned": 0 }
+
+    def set(self, host, service, ttl, expires=None):
+        """The service's locations are good for another ``ttl`` seconds.
+
+        :expires: when they expire instead, like when they're loaded.  They're
+          refreshed the same fraction of the TTL before then.
+
+        Returns when they expire.
+
+        """
+        ttl = float(ttl)
+
+        if expires is None:
+            expires = self.clock() + ttl
+
+        expires = float(expires)
+        refresh = expires - ttl * (1 - self.fraction)
+
+        with self.changed:
+            self.counters["set"] += 1
+            self._schedule((host, service), refresh, expires, ttl, 0)
+            self.changed.notify()
+
+        return expires
+
+    def _schedule(self, key, refresh, expires, ttl, misses):
+        self.times[key] = (refresh, expires, ttl, misses)
+
+        if refresh is None:
+            return
+
+        heapq.heappush(self.heap, (refresh, key))
+
+        # don't let re-set services fill the heap with stale entries.
+        if len(self.heap) > 2 * len(self.times) + 16:
+            self.heap = [(times[0], key) for key, times
+                         in self.times.iteritems() if times[0] is not None]
+            heapq.heapify(self.heap)
+
+    def forget(self, host, service=None):
+        """Stop tracking the service, or all of the host's services."""
+
+        with self.changed:
+            for key in self.times.keys():
+                if key[0] == host and service in (None, key[1]):
+                    del self.times[key]
+
+    def expires(self, host, service):
+        """When the service expires, or None if it has no TTL."""
+
+        with self.changed:
+            try:
+                return self.times[(host, service)][1]
+            except KeyError:
+                return None
+
+    def fresh(self, host, service):
+        """Whether the service's locations haven't expired yet."""
+
+        expires = self.expires(host, service)
+
+        return expires is not None and self.clock() < expires
+
+    def records(self):
+        """Return { (host, service): { "expires": ..., "ttl": ... } }, to save."""
+
+        with self.changed:
+            return dict((key, { "expires": expires, "ttl": ttl })
+                        for key, (refresh, expires, ttl, misses)
+                        in self.times.iteritems())
+
+    def due(self):
+        """Take the services that are due for a refresh.
+
+        Each is due again after ``retry`` seconds, doubled for every retry
+        before it, unless it's set again first, when its host replies.  Services
+        that expired, or were retried ``retries`` times, without a reply are
+        given up on instead.
+
+        """
+        now = self.clock()
+        due = list()
+
+        with self.changed:
+            while self.heap and self.heap[0][0] <= now:
+                refresh, key = heapq.heappop(self.heap)
+
+                try:
+                    when, expires, ttl, misses = self.times[key]
+                except KeyError:
+                    continue
+
+                if when != refresh:
+                    continue
+
+                if misses and (misses > self.retries or now >= expires):
+                    self.counters["abandoned"] += 1
+                    self._schedule(key, None, expires, ttl, misses)
+                    continue
+
+                due.append(key)
+                self._schedule(key, now + self.retry * 2 ** misses, expires,
+                               ttl, misses + 1)
+
+        return due
+
+    def refresh_due(self):
+        """Refresh the services that are due."""
+
+        for host, service in self.due():
+            try:
+                self.refresh(host, service)
+            except Exception as e:
+                logging.exception(e)
+                outcome = "failed"
+            else:
+                outcome = "refreshed"
+
+            with self.changed:
+                self.counters[outcome] += 1
+
+    def start(self):
+        """Start refreshing services in the background."""
+
+        with self.changed:
+            if self.live:
+                return
+            self.live = True
+
+        self.thread = threading.Thread(target=self._run,
+                                       name="service-refresher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=1):
+        """Stop refreshing, waiting up to ``timeout`` seconds for the thread."""
+
+        with self.changed:
+            self.live = False
+            self.changed.notify_all()
+
+        thread, self.thread = self.thread, None
+
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _run(self):
+        """Refresh services as they come due, until stopped."""
+
+        while True:
+            with self.changed:
+                if not self.live:
+                    return
+
+                if self.heap:
+                    delay = self.heap[0][0] - self.clock()
+                else:
+                    delay = None
+
+                if delay is None or delay > 0:
+                    self.changed.wait(delay)
+                    continue
+
+            self.refresh_due()
+
+    def stats(self):
+        now = self.clock()
+
+        with self.changed:
+            stats = dict(self.counters)
+            stats["services"] = len(self.times)
+            stats["fresh"] = len([expires for refresh, expires, ttl, misses
+                                  in self.times.itervalues() if now < expires])
+
+        return stats
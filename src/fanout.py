@@ -0,0 +1,103 @@
+"""Send one message to many destinations at once.
+
+Santiago sends each request to every location it knows for the other party's
+Santiago.  Some of those are bound to be slow or dead (especially through Tor),
+so each send gets its own thread and the caller only waits as long as the
+deadlines allow.
+
+"""
+
+import logging
+import threading
+import time
+
+
+RESULTS = (PENDING, SENT, FAILED, TIMED_OUT, NOT_SENT) = (
+    "pending", "sent", "failed", "timed out", "not sent")
+
+
+def fan_out(destinations, send, send_deadline=None, overall_deadline=None,
+            max_concurrent=8):
+    """Call ``send(destination)`` for each destination, concurrently.
+
+    At most ``max_concurrent`` sends run at once.  Each send may take up to
+    ``send_deadline`` seconds from the time it starts, and the whole fan-out
+    gives up after ``overall_deadline`` seconds.  A deadline of None never
+    expires.
+
+    Returns a summary of what happened to each destination::
+
+        { "https://a.host": "sent",
+          "https://b.host": "failed",
+          "https://c.host": "timed out",    # started, but didn't finish in time
+          "https://d.host": "not sent" }    # never got a chance to start
+
+    Sends that time out keep running in the background.  Their eventual
+    results don't change the summary.
+
+    """
+    destinations = list(destinations)
+    results = dict((destination, PENDING) for destination in destinations)
+    started = dict()
+    changed = threading.Condition()
+    slots = threading.Semaphore(max(1, int(max_concurrent)))
+
+    def deliver(destination):
+        with slots:
+            with changed:
+                if results[destination] != PENDING:
+                    return
+                started[destination] = time.time()
+                changed.notify_all()
+
+            try:
+                send(destination)
+            except Exception as e:
+                logging.exception(e)
+                outcome = FAILED
+            else:
+                outcome = SENT
+
+            with changed:
+                if results[destination] == PENDING:
+                    results[destination] = outcome
+                changed.notify_all()
+
+    for destination in destinations:
+        sender = threading.Thread(target=deliver, args=(destination,),
+                                  name="fan-out {0}".format(destination))
+        sender.daemon = True
+        sender.start()
+
+    start = time.time()
+    give_up = start + overall_deadline if overall_deadline is not None else None
+
+    with changed:
+        while PENDING in results.itervalues():
+            now = time.time()
+
+            if give_up is not None and now >= give_up:
+                for destination, result in results.iteritems():
+                    if result == PENDING:
+                        results[destination] = (TIMED_OUT if destination in
+                                                started else NOT_SENT)
+                break
+
+            deadlines = [give_up] if give_up is not None else []
+
+            if send_deadline is not None:
+                for destination, began in started.iteritems():
+                    if results[destination] != PENDING:
+                        continue
+                    if now >= began + send_deadline:
+                        results[destination] = TIMED_OUT
+                    else:
+                        deadlines.append(began + send_deadline)
+
+            if PENDING not in results.itervalues():
+                break
+
+            # wake up for the next deadline, or when a send starts or finishes.
+            changed.wait(max(0, min(deadlines) - now) if deadlines else None)
+
+    return dict(results)
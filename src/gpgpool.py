@@ -0,0 +1,227 @@
+"""A shared pool of long-lived GnuPG workers.
+
+Every ``gnupg.GPG`` instance checks the gpg binary's version when it's created
+and each Santiago or Unwrapper used to make its own.  Instead, the pool keeps a
+bounded number of worker threads alive, each owning a single ``gnupg.GPG``
+instance (and its keyring settings), and hands them encrypt, decrypt, verify
+and sign jobs from any thread.
+
+The pool looks like a ``gnupg.GPG`` object to its callers, so it can be passed
+anywhere one is expected::
+
+    >>> pool = gpgpool.get_pool(use_agent = True)
+    >>> signed = str(pool.sign("hi", keyid = "0928D23A"))
+    >>> job = pool.submit("verify", signed)
+    >>> job.result().valid
+    True
+
+Each job's latency is recorded per operation, so the pool can be sized to the
+load it actually sees.
+
+"""
+
+import gnupg
+import logging
+import Queue
+import threading
+import time
+
+
+class Job(object):
+    """A single operation waiting for, or completed by, a GPG worker."""
+
+    def __init__(self, operation, args, kwargs):
+        self.operation = operation
+        self.args = args
+        self.kwargs = kwargs
+        self.value = None
+        self.error = None
+        self.done = threading.Event()
+
+    def result(self, timeout=None):
+        """Wait for the job to finish and return its result.
+
+        Re-raises any exception raised by the worker.  Returns None if the job
+        hasn't finished within the timeout.
+
+        """
+        if not self.done.wait(timeout):
+            return None
+
+        if self.error is not None:
+            raise self.error
+
+        return self.value
+
+class GpgPool(object):
+    """A bounded pool of threads, each with its own ``gnupg.GPG`` instance.
+
+    Jobs are run in the order they're submitted.  When every worker is busy,
+    jobs wait in the queue.  When the queue is full, ``submit`` blocks.
+
+    """
+    OPERATIONS = ("encrypt", "decrypt", "verify", "sign",
+                  "encrypt_file", "decrypt_file", "verify_file",
+                  "list_keys", "import_keys", "delete_keys")
+
+    def __init__(self, size=4, queue_size=0, gpg_factory=None, **gnupg_new):
+        """Create a pool of ``size`` workers.
+
+        :size: the number of concurrent GPG workers.
+
+        :queue_size: the most jobs that may wait for a worker.  0 is unbounded.
+
+        :gpg_factory: creates each worker's GPG instance.  Defaults to
+          ``gnupg.GPG``, called with the ``gnupg_new`` keyword arguments.
+
+        """
+        if gpg_factory is None:
+            gpg_factory = gnupg.GPG
+
+        self.size = max(1, int(size))
+        self.gnupg_new = gnupg_new
+        self.gpg_factory = gpg_factory
+        self.jobs = Queue.Queue(int(queue_size))
+        self.workers = list()
+        self.lock = threading.Lock()
+        self.latency = dict()
+
+    def start(self):
+        """Start any workers that aren't yet running."""
+
+        with self.lock:
+            while len(self.workers) < self.size:
+                worker = threading.Thread(target=self._work,
+                                          name="gpg-worker-{0}".format(
+                                              len(self.workers)))
+                worker.daemon = True
+                self.workers.append(worker)
+                worker.start()
+
+    def stop(self):
+        """Tell every worker to quit after finishing its current job."""
+
+        with self.lock:
+            workers, self.workers = self.workers, list()
+
+        for worker in workers:
+            self.jobs.put(None)
+
+    def submit(self, operation, *args, **kwargs):
+        """Queue an operation for the next free worker.
+
+        ``operation`` is the name of a ``gnupg.GPG`` method.  Returns the
+        ``Job``, which will hold the result when the worker's done.
+
+        """
+        if operation not in GpgPool.OPERATIONS:
+            raise ValueError("Operation must be one of: {0}".format(
+                    ", ".join(GpgPool.OPERATIONS)))
+
+        if not self.workers:
+            self.start()
+
+        job = Job(operation, args, kwargs)
+        self.jobs.put(job)
+
+        return job
+
+    def _work(self):
+        """Run jobs until told to stop."""
+
+        gpg = self.gpg_factory(**self.gnupg_new)
+
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+
+            start = time.time()
+            try:
+                job.value = getattr(gpg, job.operation)(*job.args,
+                                                         **job.kwargs)
+            except Exception as e:
+                logging.exception(e)
+                job.error = e
+            finally:
+                self._record(job.operation, time.time() - start)
+                job.done.set()
+
+    def _record(self, operation, elapsed):
+        with self.lock:
+            count, total, longest = self.latency.get(operation, (0, 0.0, 0.0))
+            self.latency[operation] = (count + 1, total + elapsed,
+                                       max(longest, elapsed))
+
+    def stats(self):
+        """Return each operation's count, mean, and maximum latency.
+
+        Also reports the number of workers and jobs waiting for a worker::
+
+            { "workers": 4, "queued": 0,
+              "operations": { "decrypt": { "count": 2, "mean": 0.05,
+                                           "max": 0.06 }}}
+
+        """
+        with self.lock:
+            latency = dict(self.latency)
+
+        return {
+            "workers": len(self.workers),
+            "queued": self.jobs.qsize(),
+            "operations": dict(
+                (operation, { "count": count, "mean": total / count,
+                              "max": longest })
+                for operation, (count, total, longest) in latency.iteritems())}
+
+    # the gnupg.GPG interface, run through the pool.
+
+    def encrypt(self, *args, **kwargs):
+        return self.submit("encrypt", *args, **kwargs).result()
+
+    def decrypt(self, *args, **kwargs):
+        return self.submit("decrypt", *args, **kwargs).result()
+
+    def verify(self, *args, **kwargs):
+        return self.submit("verify", *args, **kwargs).result()
+
+    def sign(self, *args, **kwargs):
+        return self.submit("sign", *args, **kwargs).result()
+
+    def encrypt_file(self, *args, **kwargs):
+        return self.submit("encrypt_file", *args, **kwargs).result()
+
+    def decrypt_file(self, *args, **kwargs):
+        return self.submit("decrypt_file", *args, **kwargs).result()
+
+    def verify_file(self, *args, **kwargs):
+        return self.submit("verify_file", *args, **kwargs).result()
+
+    def list_keys(self, *args, **kwargs):
+        return self.submit("list_keys", *args, **kwargs).result()
+
+    def import_keys(self, *args, **kwargs):
+        return self.submit("import_keys", *args, **kwargs).result()
+
+    def delete_keys(self, *args, **kwargs):
+        return self.submit("delete_keys", *args, **kwargs).result()
+
+
+_POOLS = dict()
+_POOLS_LOCK = threading.Lock()
+
+def get_pool(size=4, **gnupg_new):
+    """Return the process-wide pool for the given GPG settings.
+
+    Every caller asking for the same ``gnupg.GPG`` settings shares one pool, so
+    a Santiago and all of its Unwrappers use the same workers.  ``size`` only
+    applies when the pool is first created.
+
+    """
+    key = tuple(sorted(gnupg_new.iteritems()))
+
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = GpgPool(size, **gnupg_new)
+
+        return _POOLS[key]
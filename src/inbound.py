@@ -0,0 +1,165 @@
+"""A bounded queue between listeners and the Santiago that handles requests.
+
+Listeners shouldn't hold their connection open while a request is decrypted and
+handled.  Instead, they drop the raw request into an ``InboundQueue`` and
+return.  The queue's workers pass each request along to the handler.
+
+When the queue is full, requests are dropped, either the oldest waiting request
+or the new one, depending on the queue's policy.  Either way, the sender hears
+nothing about it.
+
+"""
+
+import collections
+import logging
+import threading
+
+
+class InboundQueue(object):
+    """A bounded, multi-worker request queue.
+
+    The counters are available through ``stats``.
+
+    """
+    POLICIES = (DROP_OLDEST, DROP_NEWEST) = ("drop-oldest", "drop-newest")
+
+    def __init__(self, handler, depth=128, workers=2, policy=DROP_OLDEST,
+                 dropped=None):
+        """Prepare the queue.
+
+        :handler: called with each queued item, in a worker thread.
+
+        :depth: the most items that may wait in the queue.
+
+        :workers: the number of threads that drain the queue.
+
+        :policy: what to drop when the queue's full: ``drop-oldest`` or
+          ``drop-newest``.
+
+        :dropped: called with each item that's dropped instead of handled,
+          including those discarded when the queue stops.
+
+        """
+        if policy not in InboundQueue.POLICIES:
+            raise ValueError("Policy must be one of: {0}".format(
+                    ", ".join(InboundQueue.POLICIES)))
+
+        self.handler = handler
+        self.dropped = dropped
+        self.depth = max(1, int(depth))
+        self.worker_count = max(1, int(workers))
+        self.policy = policy
+
+        self.items = collections.deque()
+        self.ready = threading.Condition()
+        self.workers = list()
+        self.live = False
+
+        self.counters = { "enqueued": 0, "handled": 0, "failed": 0,
+                          "dropped_oldest": 0, "dropped_newest": 0,
+                          "max_depth": 0 }
+
+    def start(self):
+        """Start the worker threads."""
+
+        with self.ready:
+            if self.live:
+                return
+            self.live = True
+
+        for i in range(self.worker_count):
+            worker = threading.Thread(target=self._work,
+                                      name="inbound-worker-{0}".format(i))
+            worker.daemon = True
+            self.workers.append(worker)
+            worker.start()
+
+    def stop(self):
+        """Stop the workers once they finish their current item.
+
+        Anything still queued is discarded.
+
+        """
+        with self.ready:
+            self.live = False
+            discarded = list(self.items)
+            self.items.clear()
+            self.ready.notify_all()
+
+        for item in discarded:
+            self._drop(item)
+
+        self.workers = list()
+
+    def put(self, item):
+        """Queue an item for the workers.  Never blocks.
+
+        Returns False if the new item was dropped.
+
+        """
+        lost = None
+
+        with self.ready:
+            if len(self.items) >= self.depth:
+                if self.policy == InboundQueue.DROP_NEWEST:
+                    self.counters["dropped_newest"] += 1
+                    lost = item
+                else:
+                    lost = self.items.popleft()
+                    self.counters["dropped_oldest"] += 1
+
+            if lost is not item:
+                self.items.append(item)
+                self.counters["enqueued"] += 1
+                self.counters["max_depth"] = max(self.counters["max_depth"],
+                                                 len(self.items))
+                self.ready.notify()
+
+        if lost is not None:
+            self._drop(lost)
+
+        return lost is not item
+
+    def _drop(self, item):
+        """Tell whoever's interested that the item won't be handled."""
+
+        if self.dropped is None:
+            return
+
+        try:
+            self.dropped(item)
+        except Exception as e:
+            logging.exception(e)
+
+    def _work(self):
+        """Hand queued items to the handler until the queue is stopped."""
+
+        while True:
+            with self.ready:
+                while self.live and not self.items:
+                    self.ready.wait()
+
+                if not self.live:
+                    return
+
+                item = self.items.popleft()
+
+            try:
+                self.handler(item)
+            except Exception as e:
+                logging.exception(e)
+                outcome = "failed"
+            else:
+                outcome = "handled"
+
+            with self.ready:
+                self.counters[outcome] += 1
+
+    def stats(self):
+        """Return the queue's counters and its current depth."""
+
+        with self.ready:
+            stats = dict(self.counters)
+            stats["depth"] = len(self.items)
+
+        return stats
@@ -0,0 +1,229 @@
+"""An append-only, encrypted journal of changes to Santiago's services.
+
+Santiago normally saves its hosting and consuming data as a single signed and
+encrypted snapshot when it shuts down.  With a journal, each change is also
+written to disk as soon as it's made, so a crash loses (almost) nothing.
+
+Changes are group-committed: records made within ``interval`` seconds of one
+another (or up to ``batch_size`` of them) are signed and encrypted together as a
+single PGP message, which is then appended to the journal file and synced to
+disk.  That costs one gpg run and one fsync per group instead of per change.
+
+The journal is compacted by writing a fresh snapshot and truncating the
+journal, once it holds more than ``compact_after`` records.  At startup, the
+journal is replayed over the last snapshot.
+
+Records must be idempotent.  A change made while the journal's being compacted
+may be in both the snapshot and the new journal, so it might be replayed over
+data that already includes it.
+
+"""
+
+import json
+import logging
+import os
+import threading
+
+import pgpprocessor
+from tracing import trace
+from utilities import SignatureError
+
+
+class Journal(object):
+    """Group-commits records to an encrypted, append-only file."""
+
+    END_LINE = pgpprocessor.Unwrapper.CRYPT_END
+
+    def __init__(self, path, gpg, key, interval=1.0, batch_size=64,
+                 compact_after=1000, compact=None):
+        """Prepare the journal.
+
+        :path: the journal file.
+
+        :gpg: the ``gnupg.GPG`` (or pool) to sign and encrypt records with.
+
+        :key: the key records are signed by and encrypted to.
+
+        :interval: the most seconds a record waits before it's committed.
+
+        :batch_size: commit as soon as this many records are waiting.
+
+        :compact_after: call ``compact`` when the journal holds this many
+          committed records.
+
+        :compact: writes a snapshot of the current data.  The journal is
+          truncated after it returns.
+
+        """
+        self.path = path
+        self.gpg = gpg
+        self.key = key
+        self.interval = float(interval)
+        self.batch_size = max(1, int(batch_size))
+        self.compact_after = int(compact_after)
+        self.compact_callback = compact
+
+        self.pending = list()
+        self.committed = 0
+        self.lock = threading.RLock()
+        self.wake = threading.Condition(threading.Lock())
+        self.committer = None
+        self.live = False
+
+    def start(self):
+        """Start committing records in the background."""
+
+        with self.wake:
+            if self.live:
+                return
+            self.live = True
+
+        self.committer = threading.Thread(target=self._run,
+                                          name="journal-committer")
+        self.committer.daemon = True
+        self.committer.start()
+
+    def stop(self):
+        """Stop the committer and commit any waiting records."""
+
+        with self.wake:
+            self.live = False
+            self.wake.notify_all()
+
+        if self.committer is not None:
+            self.committer.join()
+            self.committer = None
+
+        self.commit()
+
+    def append(self, operation, *args):
+        """Queue a record of a change for the next group commit."""
+
+        with self.wake:
+            self.pending.append({ "op": operation, "args": args })
+
+            if len(self.pending) >= self.batch_size:
+                self.wake.notify_all()
+
+    def _run(self):
+        """Commit every interval, or when a batch fills up."""
+
+        while True:
+            with self.wake:
+                if self.live and len(self.pending) < self.batch_size:
+                    self.wake.wait(self.interval)
+                live = self.live
+
+            if not live:
+                return
+
+            try:
+                self.commit()
+
+                if self.compact_after and self.committed >= self.compact_after:
+                    self.compact()
+            except Exception as e:
+                logging.exception(e)
+
+    def commit(self):
+        """Sign, encrypt, and durably append all waiting records."""
+
+        with self.lock:
+            with self.wake:
+                records, self.pending = self.pending, list()
+
+            if not records:
+                return
+
+            block = str(self.gpg.encrypt(json.dumps(records),
+                                         recipients=[self.key], sign=self.key))
+
+            if not block:
+                # put them back, so they're not lost.
+                with self.wake:
+                    self.pending = records + self.pending
+                raise IOError("Couldn't encrypt journal records.")
+
+            with open(self.path, "a") as journal:
+                journal.write(block)
+                if not block.endswith("\n"):
+                    journal.write("\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+
+            self.committed += len(records)
+
+        trace("journal.commit", records=len(records))
+
+    def compact(self):
+        """Write a snapshot and start a new, empty, journal.
+
+        Records appended while the snapshot's being written stay pending, and
+        are committed to the new journal.
+
+        """
+        with self.lock:
+            self.commit()
+
+            if self.compact_callback is not None:
+                self.compact_callback()
+
+            self.truncate()
+
+        trace("journal.compact")
+
+    def truncate(self):
+        """Forget every committed record."""
+
+        with self.lock:
+            with open(self.path, "w") as journal:
+                journal.flush()
+                os.fsync(journal.fileno())
+
+            self.committed = 0
+
+    def replay(self):
+        """Yield each committed record, oldest first.
+
+        Blocks that can't be decrypted or verified (like one torn by a crash
+        mid-write) are skipped.
+
+        """
+        try:
+            journal = open(self.path)
+        except IOError:
+            return
+
+        count = 0
+
+        with journal:
+            for block in Journal.blocks(journal):
+                records = None
+
+                try:
+                    for records in pgpprocessor.Unwrapper(block, gpg=self.gpg):
+                        # iterations end when unwrapping complete.
+                        pass
+                    records = json.loads(str(records))
+                except (SignatureError, ValueError, TypeError) as e:
+                    logging.exception(e)
+                    continue
+
+                for record in records:
+                    count += 1
+                    yield record["op"], record["args"]
+
+        self.committed = count
+
+    @classmethod
+    def blocks(cls, lines):
+        """Split the journal's lines into separate PGP messages."""
+
+        block = list()
+
+        for line in lines:
+            block.append(line)
+
+            if line == Journal.END_LINE:
+                yield "".join(block)
+                block = list()
@@ -0,0 +1,172 @@
+"""The requests we've sent and are still waiting on replies to.
+
+A reply is only accepted for a (host, service) we've asked for.  Requests that
+are never answered are forgotten after ``ttl`` seconds, so neither unanswered
+queries nor replies to things we never asked for grow the table::
+
+    >>> requests = PendingRequests(ttl=300)
+    >>> requests.add("host", "service")
+    >>> requests.pending("host", "service")
+    True
+    >>> requests.discard("host", "service")
+    True
+    >>> requests.pending("host", "service")
+    False
+
+Expiry times are kept in a heap, so expiring only looks at the requests that
+have expired.  At most ``size`` requests are kept: when there are more, the ones
+that would expire soonest are forgotten early.
+
+"""
+
+import heapq
+import threading
+import time
+
+
+class PendingRequests(object):
+    """A bounded table of (host, service) requests, each expiring."""
+
+    def __init__(self, ttl=300, size=1024, clock=time.time):
+        """Prepare the table.
+
+        :ttl: the seconds to wait for a reply to each request.
+
+        :size: the most requests to wait on at once.
+
+        :clock: returns the current time, in seconds.
+
+        """
+        self.ttl = float(ttl)
+        self.size = max(1, int(size))
+        self.clock = clock
+
+        # (host, service): expiry, and each expiry in a heap.  Heap entries
+        # whose expiry doesn't match the table's are stale, and skipped.
+        self.expiries = dict()
+        self.heap = list()
+        self.hosts = dict()
+        self.lock = threading.Lock()
+
+        self.counters = { "added": 0, "answered": 0, "expired": 0,
+                          "evicted": 0 }
+
+    def add(self, host, service):
+        """Wait on the service from the host, for another ``ttl`` seconds."""
+
+        now = self.clock()
+
+        with self.lock:
+            self._expire(now)
+
+            key = (host, service)
+            expires = now + self.ttl
+
+            self.counters["added"] += 1
+            self.expiries[key] = expires
+            self.hosts.setdefault(host, set()).add(service)
+            heapq.heappush(self.heap, (expires, key))
+
+            while len(self.expiries) > self.size:
+                self._pop("evicted")
+
+            # don't let re-added requests fill the heap with stale entries.
+            if len(self.heap) > 2 * len(self.expiries) + 16:
+                self.heap = [(expires, key) for key, expires
+                             in self.expiries.iteritems()]
+                heapq.heapify(self.heap)
+
+    def pending(self, host, service):
+        """Whether we're still waiting on the service from the host."""
+
+        with self.lock:
+            self._expire(self.clock())
+
+            return (host, service) in self.expiries
+
+    def discard(self, host, service):
+        """Stop waiting on the service, once it's answered.
+
+        Returns whether we were waiting on it.
+
+        """
+        with self.lock:
+            self._expire(self.clock())
+
+            if (host, service) not in self.expiries:
+                return False
+
+            self._remove((host, service))
+            self.counters["answered"] += 1
+
+            return True
+
+    def __getitem__(self, host):
+        """The services we're waiting on from the host.
+
+        Raises a KeyError if there aren't any.  Nothing is added for the host.
+
+        """
+        with self.lock:
+            self._expire(self.clock())
+
+            return frozenset(self.hosts[host])
+
+    def __contains__(self, host):
+        with self.lock:
+            self._expire(self.clock())
+
+            return host in self.hosts
+
+    def __len__(self):
+        with self.lock:
+            return len(self.expiries)
+
+    def _expire(self, now):
+        while self.heap and self.heap[0][0] <= now:
+            self._pop("expired")
+
+    def _pop(self, reason):
+        """Forget the request at the top of the heap, unless it's stale."""
+
+        expires, key = heapq.heappop(self.heap)
+
+        if self.expiries.get(key) == expires:
+            self._remove(key)
+            self.counters[reason] += 1
+
+    def _remove(self, key):
+        host, service = key
+
+        del self.expiries[key]
+        self.hosts[host].discard(service)
+
+        if not self.hosts[host]:
+            del self.hosts[host]
+
+    def outstanding(self):
+        """Return { host: { service: seconds left } } for each request."""
+
+        now = self.clock()
+
+        with self.lock:
+            self._expire(now)
+
+            outstanding = dict()
+            for (host, service), expires in self.expiries.iteritems():
+                outstanding.setdefault(host, {})[service] = expires - now
+
+        return outstanding
+
+    def clear(self):
+        with self.lock:
+            self.expiries.clear()
+            self.hosts.clear()
+            self.heap = list()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self.expiries)
+
+        return stats
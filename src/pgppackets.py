@@ -0,0 +1,257 @@
+"""Just enough OpenPGP packet parsing to know who a message is for.
+
+Decrypting a message takes a gpg process.  Before spending one, the
+``RecipientFilter`` dearmors the message and reads the key IDs from its
+public-key encrypted session key packets (RFC 4880, section 5.1).  Messages
+that aren't encrypted to one of our keys are dropped, as are messages that
+can't be parsed at all::
+
+    >>> recipients = RecipientFilter(["0123456789ABCDEF"])
+    >>> recipients.accepts(str(gpg.encrypt("hi", "0123456789ABCDEF")))
+    True
+    >>> recipients.accepts("junk")
+    False
+    >>> recipients.stats()["malformed"]
+    1
+
+Only the packets' headers are read, nothing is decrypted or verified here.
+That's still gpg's job.
+
+"""
+
+import binascii
+import threading
+
+
+ARMOR_HEAD = "-----BEGIN PGP MESSAGE-----"
+ARMOR_END = "-----END PGP MESSAGE-----"
+
+PKESK, SKESK, MARKER = 1, 3, 10
+# symmetrically encrypted, integrity-protected and AEAD encrypted data.
+ENCRYPTED = (9, 18, 20)
+
+# encrypted to a hidden recipient (gpg's --throw-keyids).
+WILDCARD = "0" * 16
+
+
+class PacketError(ValueError):
+    """The message isn't well-formed OpenPGP."""
+
+    pass
+
+def dearmor(message):
+    """Decode an ASCII-armored PGP message.
+
+    The armor's checksum isn't checked: gpg does that.
+
+    """
+    lines = iter(message.splitlines())
+
+    for line in lines:
+        if line.strip() == ARMOR_HEAD:
+            break
+    else:
+        raise PacketError("No PGP message.")
+
+    # armor headers end at the first blank line.
+    for line in lines:
+        if not line.strip():
+            break
+    else:
+        raise PacketError("No armored data.")
+
+    data = list()
+
+    for line in lines:
+        line = line.strip()
+
+        if line == ARMOR_END:
+            break
+        if line.startswith("="):
+            # the checksum is the last line before the end.
+            continue
+
+        data.append(line)
+    else:
+        raise PacketError("Unterminated PGP message.")
+
+    try:
+        return binascii.a2b_base64("".join(data))
+    except (binascii.Error, TypeError) as e:
+        raise PacketError(str(e))
+
+def packets(data):
+    """Yield each packet's (tag, body) in the data.
+
+    Stops after the first encrypted data packet, which is the last one that
+    matters, and which may use lengths we don't bother to follow.
+
+    """
+    position = 0
+
+    while position < len(data):
+        header = ord(data[position])
+        position += 1
+
+        if not header & 0x80:
+            raise PacketError("Not a packet.")
+
+        if header & 0x40:
+            tag = header & 0x3f
+            length, position = new_length(data, position, tag)
+        else:
+            tag = (header >> 2) & 0x0f
+            length, position = old_length(data, position, header & 0x03)
+
+        if tag in ENCRYPTED:
+            yield tag, data[position:]
+            return
+
+        if length is None or position + length > len(data):
+            raise PacketError("Packet {0} is truncated.".format(tag))
+
+        yield tag, data[position:position + length]
+        position += length
+
+def new_length(data, position, tag):
+    """Read a new-format packet length.
+
+    Partial lengths are only allowed for encrypted data.  Returns the length
+    (None if it's partial) and the position of the packet's body.
+
+    """
+    first = byte(data, position)
+
+    if first < 192:
+        return first, position + 1
+    if first < 224:
+        return ((first - 192) << 8) + byte(data, position + 1) + 192, position + 2
+    if first == 255:
+        return number(data, position + 1, 4), position + 5
+    if tag in ENCRYPTED:
+        return None, position + 1
+
+    raise PacketError("Partial length in packet {0}.".format(tag))
+
+def old_length(data, position, length_type):
+    """Read an old-format packet length."""
+
+    if length_type == 3:
+        # indeterminate: the packet runs to the end of the data.
+        return len(data) - position, position
+
+    size = (1, 2, 4)[length_type]
+
+    return number(data, position, size), position + size
+
+def byte(data, position):
+    try:
+        return ord(data[position])
+    except IndexError:
+        raise PacketError("Truncated packet header.")
+
+def number(data, position, size):
+    if position + size > len(data):
+        raise PacketError("Truncated packet header.")
+
+    return int(binascii.hexlify(data[position:position + size]), 16)
+
+def recipient(body):
+    """The key ID a public-key encrypted session key packet names."""
+
+    if not body:
+        raise PacketError("Empty session key packet.")
+
+    version = ord(body[0])
+
+    if version == 3 and len(body) >= 9:
+        return binascii.hexlify(body[1:9]).upper()
+
+    if version == 6 and len(body) >= 2:
+        size = ord(body[1])
+
+        if size == 0:
+            return WILDCARD
+
+        fingerprint = body[3:2 + size]
+        key_version = ord(body[2])
+
+        # v4 key IDs end their fingerprints, v6 key IDs start them.
+        if key_version == 4 and len(fingerprint) == 20:
+            return binascii.hexlify(fingerprint[-8:]).upper()
+        if key_version == 6 and len(fingerprint) == 32:
+            return binascii.hexlify(fingerprint[:8]).upper()
+
+    raise PacketError("Unknown session key packet.")
+
+def recipients(message):
+    """The key IDs an armored message is encrypted to.
+
+    Raises a ``PacketError`` if the message isn't an encrypted OpenPGP
+    message.
+
+    """
+    found = list()
+
+    for tag, body in packets(dearmor(message)):
+        if tag == PKESK:
+            found.append(recipient(body))
+        elif tag in ENCRYPTED:
+            return found
+        elif tag not in (SKESK, MARKER):
+            break
+
+    raise PacketError("Not an encrypted message.")
+
+class RecipientFilter(object):
+    """Drops messages that aren't encrypted to any of our keys."""
+
+    DROP_REASONS = (MALFORMED, NOT_FOR_ME) = ("malformed", "not_for_me")
+
+    def __init__(self, key_ids=None):
+        """Accept messages for the key IDs.
+
+        If the key IDs aren't known (None), only malformed messages are
+        dropped.
+
+        """
+        self.key_ids = None
+        self.lock = threading.Lock()
+        self.counts = dict((reason, 0) for reason in
+                           RecipientFilter.DROP_REASONS + ("accepted",))
+
+        self.set_keys(key_ids)
+
+    def set_keys(self, key_ids):
+        if key_ids is not None:
+            key_ids = frozenset(str(key_id).upper()[-16:] for key_id in key_ids)
+
+        self.key_ids = key_ids
+
+    def check(self, message):
+        """Return why the message would be dropped, or None to keep it."""
+
+        try:
+            named = recipients(message)
+        except PacketError:
+            return RecipientFilter.MALFORMED
+
+        if self.key_ids is None or WILDCARD in named:
+            return None
+
+        if self.key_ids.isdisjoint(named):
+            return RecipientFilter.NOT_FOR_ME
+
+    def accepts(self, message):
+        """Whether the message is worth decrypting.  Counts the outcome."""
+
+        reason = self.check(message)
+
+        with self.lock:
+            self.counts[reason or "accepted"] += 1
+
+        return reason is None
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
@@ -1,12 +1,19 @@
 """PGP message processing utilities.
 
 Right now, this includes the Unwrapper, wihch unwraps and verifies each layer of
-an onion-wrapped PGP message.
+an onion-wrapped PGP message, and the StreamUnwrapper, which does the same for
+messages too large to keep in memory.
 
 """
 from utilities import InvalidSignatureError
-import gnupg
+import gpgpool
+import hashlib
+import itertools
+import os
 import re
+import stat
+import StringIO
+import tempfile
 
 
 class Unwrapper(object):
@@ -51,15 +58,20 @@ class Unwrapper(object):
     CRYPT_TARGET = re.compile(_TARGET.format("|".join(CRYPT_LINES)))
 
     def __init__(self, message, gpg = None,
-                 gnupg_new = None, gnupg_verify = None, gnupg_decrypt = None):
+                 gnupg_new = None, gnupg_verify = None, gnupg_decrypt = None,
+                 cache = None):
         """Prepare to unwrap a PGP message.
 
-        If a gnupg.GPG instance isn't passed in as the ``gpg`` parameter, it's
-        created during instantiation with the ``gnupg_new`` keyword arguments.
+        If a gnupg.GPG instance (or ``gpgpool.GpgPool``) isn't passed in as the
+        ``gpg`` parameter, the shared pool for the ``gnupg_new`` keyword
+        arguments is used.
 
         The ``_verify`` and ``_decrypt`` arguments are used when verifying
         signatures and decrypting messages, respectively.
 
+        If a ``verifycache.VerificationCache`` is passed in as ``cache``,
+        layers it's already seen aren't checked again.
+
         post::
 
             self.gpg # exists
@@ -73,13 +85,14 @@ class Unwrapper(object):
         if gnupg_decrypt == None:
             gnupg_decrypt = dict()
         if gpg == None:
-            gpg = gnupg.GPG(**gnupg_new)
+            gpg = gpgpool.get_pool(**gnupg_new)
 
         self.message = message
         self.gnupg_verify = gnupg_verify
         self.gnupg_decrypt = gnupg_decrypt
         self.type = ""
         self.gpg = gpg
+        self.cache = cache
         self.gpg_data = None
         self.reset_fields()
 
@@ -94,13 +107,34 @@ class Unwrapper(object):
                              self.end, self.gpg_data), bool)
 
         """
-        self.start = list()
-        self.header = list()
-        self.body = list()
-        self.footer = list()
-        self.end = list()
+        self.layer = ""
+        self.bounds = (0, 0, 0, 0)
         self.gpg_data = None
 
+    # Each part of the layer is a slice of it, so they're only copied out when
+    # they're asked for.  The layer's header, body and footer are contiguous, so
+    # str(self) is just the layer between the header and the end.
+
+    @property
+    def start(self):
+        return self.layer[:self.bounds[0]]
+
+    @property
+    def header(self):
+        return self.layer[self.bounds[0]:self.bounds[1]]
+
+    @property
+    def body(self):
+        return self.layer[self.bounds[1]:self.bounds[2]]
+
+    @property
+    def footer(self):
+        return self.layer[self.bounds[2]:self.bounds[3]]
+
+    @property
+    def end(self):
+        return self.layer[self.bounds[3]:]
+
     def __iter__(self):
         return self
 
@@ -112,49 +146,76 @@ class Unwrapper(object):
 
         Raise an InvalidSignature Error if signature isn't valid.
 
-        This is a simple state-machine: certain lines advance the state of the
-        machine, and until the machine is advanced again, all lines are added to
-        that part of the message.  When we reach the end of the message, the
-        state machine is reset, but starts with the message it just unwrapped.
+        The message is never split into lines.  Instead, we search forward for
+        each armor line that advances the message to its next part:
+
+        - start -> header: the first signed- or encrypted-message head.
+        - header -> body: the first blank line, which starts the body.
+        - body -> footer: the signature's head, for signed messages.  Encrypted
+          messages have no signature, so their footer's just their end line.
+        - footer -> end: the line after the message's end line.  The end line
+          itself is part of the footer.
 
-        It has one quirk in two states: the head -> body and footer -> end
-        transitions append their lines to the former state and then change
-        state, unlike all the other transitions which change state first.
-        Messages would be built non-intuitively without those exceptions.
+        If a part's armor line can't be found, the rest of the message stays in
+        the last part that was.
 
         """
+        message = self.message
         point = Unwrapper.START
         msg_type = ""
 
         self.reset_fields()
 
-        for line in self.message.splitlines(True):
-            if point == Unwrapper.START and line == Unwrapper.SIG_HEAD:
-                point = Unwrapper.HEAD
-                msg_type = Unwrapper.SIG
-            elif point == Unwrapper.START and line == Unwrapper.CRYPT_HEAD:
-                point = Unwrapper.HEAD
-                msg_type = Unwrapper.CRYPT
-            elif point == Unwrapper.HEAD and line == Unwrapper.SIG_BODY:
+        size = len(message)
+        header = body = footer = end = size
+
+        sig = Unwrapper.find_line(message, Unwrapper.SIG_HEAD)
+        crypt = Unwrapper.find_line(message, Unwrapper.CRYPT_HEAD)
+
+        if sig != -1 and (crypt == -1 or sig < crypt):
+            header, msg_type = sig, Unwrapper.SIG
+        elif crypt != -1:
+            header, msg_type = crypt, Unwrapper.CRYPT
+
+        if msg_type:
+            point = Unwrapper.HEAD
+
+            # the head line ends in a newline, so the first blank line after it
+            # is the first pair of newlines that starts with the head's.
+            blank = message.find("\n\n", message.index("\n", header))
+
+            if blank != -1:
+                body = blank + 1
                 point = Unwrapper.BODY
-            elif (point == Unwrapper.BODY and line == Unwrapper.SIG_FOOTER and
-                  msg_type == Unwrapper.SIG):
+
+        if point == Unwrapper.BODY and msg_type == Unwrapper.SIG:
+            found = Unwrapper.find_line(message, Unwrapper.SIG_FOOTER, body + 1)
+
+            if found != -1:
+                footer = found
                 point = Unwrapper.FOOTER
-            elif ((point == Unwrapper.FOOTER and line == Unwrapper.SIG_END
-                   and msg_type == Unwrapper.SIG)
-                  or (point == Unwrapper.BODY and line == Unwrapper.CRYPT_END
-                      and msg_type == Unwrapper.CRYPT)):
-                # add the footer line to the footer, not the post-script
-                self.footer.append(line)
+
+                found = Unwrapper.find_line(message, Unwrapper.SIG_END,
+                                            footer + len(Unwrapper.SIG_FOOTER))
+                if found != -1:
+                    end = found + len(Unwrapper.SIG_END)
+                    point = Unwrapper.END
+
+        elif point == Unwrapper.BODY and msg_type == Unwrapper.CRYPT:
+            found = Unwrapper.find_line(message, Unwrapper.CRYPT_END, body + 1)
+
+            if found != -1:
+                footer = found
+                end = found + len(Unwrapper.CRYPT_END)
                 point = Unwrapper.END
-                continue
 
-            getattr(self, point).append(line)
+        self.layer = message
+        self.bounds = (header, body, footer, end)
 
         self.handle_end_conditions(point, msg_type)
 
         self.type = msg_type
-        self.message = "".join(Unwrapper.unwrap(self.body, self.type)).lstrip()
+        self.message = Unwrapper.unwrap(self.body, self.type).lstrip()
 
         return self.gpg_data
 
@@ -177,10 +238,15 @@ class Unwrapper(object):
         args = (self.gnupg_verify if msg_type == Unwrapper.SIG
                 else self.gnupg_decrypt)
 
-        self.gpg_data = {
-            Unwrapper.SIG: self.gpg.verify,
-            Unwrapper.CRYPT: self.gpg.decrypt
-            }[msg_type](str(self), **args)
+        operation = { Unwrapper.SIG: "verify",
+                      Unwrapper.CRYPT: "decrypt" }[msg_type]
+
+        if self.cache is None:
+            self.gpg_data = getattr(self.gpg, operation)(str(self), **args)
+        else:
+            self.gpg_data = self.cache.call(
+                operation, getattr(self.gpg, operation), str(self),
+                keep_data = msg_type == Unwrapper.CRYPT, **args)
 
         if not (self.gpg_data and self.gpg_data.valid):
             raise InvalidSignatureError()
@@ -191,12 +257,48 @@ class Unwrapper(object):
         Non-PGP-message data (before and after the message) are not returned.
 
         """
-        return "".join([
-                "".join(x) for x in (self.header, self.body, self.footer) ])
+        return self.layer[self.bounds[0]:self.bounds[3]]
 
     @classmethod
-    def unwrap(cls, message, msg_type):
+    def find_line(cls, message, line, start=0):
+        """Find the line in the message, from the start.
+
+        The line only counts if it's a whole line: it must start a line of the
+        message.  Returns -1 if it's not found.
+
+        pre::
+
+            line.endswith("\n")
+            line[0] not in "\r\n"
+
         """
+        found = message.find(line, start)
+
+        while found > 0 and message[found - 1] not in "\r\n":
+            found = message.find(line, found + 1)
+
+        return found
+
+    @classmethod
+    def escapes(cls, message):
+        """Where each line that starts with a dash-escape starts, in order."""
+
+        found = [0] if message.startswith("- ") else []
+
+        for escape in ("\n- ", "\r- "):
+            at = message.find(escape)
+
+            while at != -1:
+                found.append(at + 1)
+                at = message.find(escape, at + 1)
+
+        return sorted(found)
+
+    @classmethod
+    def unwrap(cls, message, msg_type):
+        """Remove the dash-escaping from the message's escaped armor lines.
+
+        Only lines that start with a dash-escape are checked.
 
         pre::
 
@@ -211,11 +313,273 @@ class Unwrapper(object):
             raise ValueError("Type must be one of: {0}".format(
                     ", ".join(Unwrapper.TYPES)))
 
-        for i, line in enumerate(message):
-            if target.match(line):
-                message[i] = line[2:]
+        parts = list()
+        done = 0
+
+        for begin in Unwrapper.escapes(message):
+            finish = message.find("\n", begin) + 1
+
+            # lines that end early, with a bare return, never match the target.
+            if not finish or "\r" in message[begin:finish]:
+                continue
+
+            if target.match(message[begin:finish]):
+                parts.append(message[done:begin])
+                done = begin + 2
+
+        if not parts:
+            return message
+
+        parts.append(message[done:])
+
+        return "".join(parts)
+
+class StreamUnwrapper(object):
+    """Removes one layer of PGP message wrapping per iteration, from a stream.
+
+    Works like the ``Unwrapper``, but reads the message from a file-like object
+    or an iterable of chunks of it, instead of a string.  Each layer is spooled
+    and piped from there into gpg.  Given a private ``directory``, only
+    ``spool_size`` bytes of each layer are ever kept in memory: larger layers
+    spill to disk there, as does decrypted data.  Without one, nothing's
+    written to disk, and each layer is kept in memory instead.
+
+    After iterating, read the unwrapped message with ``lines``::
+
+    >>> unwrapper = pgpprocessor.StreamUnwrapper(open("signed-message"))
+    >>> for layer in unwrapper:
+    ...     pass
+    >>> message = "".join(unwrapper.lines())
+
+    Lines are split on newlines only.
+
+    """
+    CHUNK_SIZE = 64 * 1024
+    SPOOL_SIZE = 1024 * 1024
+
+    def __init__(self, source, gpg = None,
+                 gnupg_new = None, gnupg_verify = None, gnupg_decrypt = None,
+                 spool_size = SPOOL_SIZE, directory = None, cache = None):
+        """Prepare to unwrap a PGP message from the source.
+
+        The ``gpg``, ``gnupg_*`` and ``cache`` arguments are the same as the
+        ``Unwrapper``'s.  Only signatures are cached: decrypted layers would
+        have to be kept in memory.
+
+        Raises a ValueError if the directory can be read by anyone but its
+        owner, since decrypted data is written there.
+
+        """
+        if gnupg_new == None:
+            gnupg_new = dict()
+        if gnupg_verify == None:
+            gnupg_verify = dict()
+        if gnupg_decrypt == None:
+            gnupg_decrypt = dict()
+        if gpg == None:
+            gpg = gpgpool.get_pool(**gnupg_new)
+        if directory is not None and \
+                stat.S_IMODE(os.stat(directory).st_mode) & 077:
+            raise ValueError("{0} isn't private.".format(directory))
+
+        self.source = source
+        self.gpg = gpg
+        self.gnupg_verify = gnupg_verify
+        self.gnupg_decrypt = gnupg_decrypt
+        self.spool_size = spool_size
+        self.directory = directory
+        self.cache = cache
+        self.type = ""
+        self.gpg_data = None
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        """Remove one layer of PGP message wrapping.
+
+        Return the layer's gpg data.  The layer's contents become the source of
+        the next iteration.
+
+        Raise an InvalidSignatureError if the signature isn't valid, or a
+        StopIteration error if there's no PGP data left.  The message is then
+        still available from ``lines``.
+
+        This is the Unwrapper's original state machine: certain lines advance
+        the message to its next part.  The start of the message is only kept
+        until we know whether there's PGP data in it.  The layer's armor is
+        spooled for gpg while a signed message's unescaped body is spooled
+        separately, to read the next layer from.  We stop reading at the end of
+        the layer, ignoring anything after it.
+
+        """
+        point = Unwrapper.START
+        msg_type = ""
+
+        self.gpg_data = None
+
+        start, armor, body = self.spool(), self.spool(), self.spool()
+        lines = StreamUnwrapper.split(self.source, True)
+
+        # the same digest the VerificationCache would take of the armor.
+        digest = hashlib.sha256("verify\0")
+
+        for line in lines:
+            if point == Unwrapper.START:
+                if line == Unwrapper.SIG_HEAD:
+                    point, msg_type = Unwrapper.HEAD, Unwrapper.SIG
+                elif line == Unwrapper.CRYPT_HEAD:
+                    point, msg_type = Unwrapper.HEAD, Unwrapper.CRYPT
+                else:
+                    start.write(line)
+                    continue
+
+            elif point == Unwrapper.HEAD and line == Unwrapper.SIG_BODY:
+                point = Unwrapper.BODY
+
+            elif point == Unwrapper.BODY and msg_type == Unwrapper.SIG:
+                if line == Unwrapper.SIG_FOOTER:
+                    point = Unwrapper.FOOTER
+                else:
+                    body.write(StreamUnwrapper.unescape(line))
+
+            elif point == Unwrapper.BODY and line == Unwrapper.CRYPT_END:
+                point = Unwrapper.END
+
+            elif point == Unwrapper.FOOTER and line == Unwrapper.SIG_END:
+                point = Unwrapper.END
+
+            armor.write(line)
+            digest.update(line)
+
+            if point == Unwrapper.END:
+                break
+
+        if point != Unwrapper.END:
+            # no PGP data: put back everything we've read.
+            for spooled in (start, armor):
+                spooled.seek(0)
+            self.source = itertools.chain(start, armor, lines)
+            body.close()
+
+            raise StopIteration("No valid PGP data.")
+
+        start.close()
+        armor.seek(0)
+
+        if msg_type == Unwrapper.SIG:
+            self.gpg_data = self.verify(armor, digest.hexdigest())
+            body.seek(0)
+            contents = body
+        else:
+            body.close()
+            self.gpg_data, contents = self.decrypt(armor)
+
+        armor.close()
+        self.type = msg_type
+        self.source = contents
+
+        if not (self.gpg_data and self.gpg_data.valid):
+            contents.close()
+            raise InvalidSignatureError()
+
+        return self.gpg_data
+
+    def verify(self, armor, digest):
+        """Verify the armored layer, unless its outcome is cached."""
+
+        outcome = self.cache.get(digest) if self.cache is not None else None
+
+        if outcome is None:
+            outcome = self.gpg.verify_file(armor, **self.gnupg_verify)
+
+            if self.cache is not None:
+                outcome = self.cache.put(digest, outcome, keep_data = False)
+
+        return outcome
+
+    def decrypt(self, armor):
+        """Decrypt the armored layer into a temporary file, or memory.
+
+        Returns the gpg data and the (already unlinked) decrypted file.
+
+        """
+        if self.directory is None:
+            gpg_data = self.gpg.decrypt_file(armor, **self.gnupg_decrypt)
+
+            return gpg_data, StringIO.StringIO(gpg_data.data)
+
+        handle, path = tempfile.mkstemp(dir=self.directory)
+        os.close(handle)
+
+        try:
+            gpg_data = self.gpg.decrypt_file(armor, output=path,
+                                             **self.gnupg_decrypt)
+            contents = open(path, "rb")
+        finally:
+            os.remove(path)
+
+        return gpg_data, contents
+
+    def lines(self):
+        """Yield the lines of the message, as unwrapped so far."""
+
+        return StreamUnwrapper.split(self.source, True)
+
+    def spool(self):
+        if self.directory is None:
+            return StringIO.StringIO()
+
+        return tempfile.SpooledTemporaryFile(self.spool_size, dir=self.directory)
+
+    @classmethod
+    def split(cls, source, strip=False, chunk_size=CHUNK_SIZE):
+        """Yield the source's lines, keeping their newlines.
+
+        The source is a file-like object or an iterable of chunks.  With
+        ``strip``, leading whitespace is removed from the first line (and any
+        blank lines before it), like ``str.lstrip``.
+
+        """
+        if hasattr(source, "read"):
+            chunks = iter(lambda: source.read(chunk_size), "")
+        else:
+            chunks = source
+
+        partial = list()
+
+        for chunk in chunks:
+            if strip:
+                chunk = chunk.lstrip()
+                if not chunk:
+                    continue
+                strip = False
+
+            begin = 0
+            newline = chunk.find("\n")
+
+            while newline != -1:
+                partial.append(chunk[begin:newline + 1])
+                yield "".join(partial)
+
+                partial = list()
+                begin = newline + 1
+                newline = chunk.find("\n", begin)
+
+            if begin < len(chunk):
+                partial.append(chunk[begin:])
+
+        if partial:
+            yield "".join(partial)
+
+    @classmethod
+    def unescape(cls, line):
+        """Remove the dash-escape from a signed message's escaped armor line."""
+
+        if line.startswith("- ") and Unwrapper.SIG_TARGET.match(line):
+            return line[2:]
 
-        return message
+        return line
 
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+"""A versioned, line-oriented format for hosting and consuming data.
+
+Santiago used to save its service data as ``str(dict)`` and load it with
+``ast.literal_eval``, which is slow, memory hungry, and has no room to change
+the format later.  Instead, each registry is written as a header line followed
+by one JSON line per key and service::
+
+    {"format": "freedombuddy-registry", "version": 1}
+    ["someKey", "someService", ["http://a.list", "http://of.locations"]]
+    ["someKey", "otherService", []]
+    ["keyWithoutServices"]
+
+Since every line stands alone, registries can be written and read a line at a
+time, without building the whole document in memory.  Because keys are JSON
+values, not object keys, they keep their types (numbers stay numbers).
+
+A service's line may end with a dictionary of extras, like when its locations
+expire.  Readers that don't want them ignore them::
+
+    ["someKey", "someService", ["http://a.list"], {"expires": 1400000000}]
+
+"""
+
+import json
+
+
+FORMAT = "freedombuddy-registry"
+VERSION = 1
+
+
+class RegistryError(ValueError):
+    """The data isn't a registry, or is a version we don't understand."""
+
+    pass
+
+
+def header():
+    return json.dumps({ "format": FORMAT, "version": VERSION })
+
+def iterdump(tree, extras=None):
+    """Yield each line of the tree's registry, including line endings.
+
+    :extras: a dictionary of each (key, service)'s extras, if it has any.
+
+    """
+    extras = extras or {}
+
+    yield header() + "\n"
+
+    for key, services in tree.iteritems():
+        if not services:
+            yield json.dumps([key]) + "\n"
+            continue
+
+        for service, locations in services.iteritems():
+            entry = [key, service, list(locations or [])]
+
+            if (key, service) in extras:
+                entry.append(extras[(key, service)])
+
+            yield json.dumps(entry) + "\n"
+
+def dumps(tree, extras=None):
+    """Return the tree's registry as a string."""
+
+    return "".join(iterdump(tree, extras))
+
+class Reader(object):
+    """The tree's registry as a read-only file, dumped as it's read.
+
+    gpg can encrypt it from here without the whole registry ever being in
+    memory at once.
+
+    """
+    def __init__(self, tree, extras=None):
+        self.lines = iterdump(tree, extras)
+        self.buffered = ""
+
+    def read(self, size=-1):
+        chunks = [self.buffered]
+        length = len(self.buffered)
+
+        while size < 0 or length < size:
+            line = next(self.lines, "")
+            if not line:
+                break
+
+            chunks.append(line)
+            length += len(line)
+
+        data = "".join(chunks)
+
+        if size < 0:
+            self.buffered = ""
+            return data
+
+        self.buffered = data[size:]
+        return data[:size]
+
+def load(lines, extras=None):
+    """Build a tree from an iterable of registry lines.
+
+    :extras: a dictionary to fill with each (key, service)'s extras, if it
+      has any.
+
+    Raises a ``RegistryError`` if the lines aren't a registry we understand.
+
+    """
+    lines = iter(lines)
+    tree = dict()
+
+    try:
+        head = json.loads(next(lines))
+    except (StopIteration, ValueError):
+        raise RegistryError("Not a registry.")
+
+    if not (isinstance(head, dict) and head.get("format") == FORMAT):
+        raise RegistryError("Not a registry.")
+    if head.get("version") != VERSION:
+        raise RegistryError("Unsupported registry version: {0}".format(
+                head.get("version")))
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        entry = json.loads(line)
+        services = tree.setdefault(entry[0], dict())
+
+        if len(entry) > 1:
+            services[entry[1]] = entry[2]
+
+        if len(entry) > 3 and extras is not None:
+            extras[(entry[0], entry[1])] = entry[3]
+
+    return tree
+
+def loads(data):
+    """Build a tree from a registry string."""
+
+    return load(data.splitlines())
+
+def is_registry(data):
+    """Whether the string starts with a registry header, of any version."""
+
+    try:
+        head = json.loads(data.lstrip().split("\n", 1)[0])
+    except ValueError:
+        return False
+
+    return isinstance(head, dict) and head.get("format") == FORMAT
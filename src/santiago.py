@@ -33,35 +33,53 @@ or later.  A copy of GPLv3 is available [from the Free Software Foundation]
 """
 
 import ast
-from collections import defaultdict as DefaultDict
 import ConfigParser as configparser
-import gnupg
-import inspect
+import functools
+import itertools
 import json
 import logging
 import os
 import re
 import shelve
 import sys
+import threading
 import time
 import urlparse
 
+from dedup import DuplicateFilter
+from expiry import ServiceExpiry
+from pending import PendingRequests
+import fanout
+import gpgpool
+import journal
+import pgppackets
 import pgpprocessor
+import registry
+from scheduler import FairScheduler, Quota
+from serviceindex import ServiceIndex
+from singleflight import SingleFlight
+from tracing import trace
 import utilities
+from utilities import OrderedSet
+import verifycache
+from verifycache import VerificationCache
+import versions
+from versions import LocationVersions
 
 
 DEBUG = 0
 
 
-def debug_log(message):
-    frame = inspect.stack()
-    trace = inspect.getframeinfo(frame[1][0])
-    location = "{0}.{1}.{2}".format(trace.filename, trace.function,
-                                    trace.lineno)
-    try:
-        logging.debug("{0}:{1}: {2}".format(location, time.time(), message))
-    finally:
-        del frame, trace, location
+def locked(method):
+    """Hold the Santiago's data lock while the method changes its data."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
 
 class Santiago(object):
     """This Santiago is a less extensible Santiago.
@@ -69,7 +87,11 @@ class Santiago(object):
     The client and server are unified.
 
     """
-    SUPPORTED_CONNECTORS = set([1])
+    SUPPORTED_CONNECTORS = set([1, 2])
+    # version 2 requests ask for a list of services, or all of them.  Their
+    # replies' locations are a dictionary of each service's locations.
+    BATCH_VERSION = 2
+    ALL_SERVICES = "*"
     # all keys must be present in the message.
     ALL_KEYS = set(("host", "client", "service", "locations", "reply_to",
                     "request_version", "reply_versions"))
@@ -83,11 +105,30 @@ class Santiago(object):
 
     SERVICE_NAME = "freedombuddy"
 
+    PERSISTENCE = (SNAPSHOT, JOURNAL) = ("snapshot", "journal")
+    # the changes the journal may replay.
+    JOURNALED = set(("create_hosting_client", "create_hosting_service",
+                     "create_hosting_location", "create_consuming_host",
+                     "create_consuming_service", "create_consuming_location",
+                     "delete_hosting_client", "delete_hosting_service",
+                     "delete_hosting_location", "delete_consuming_host",
+                     "delete_consuming_service", "delete_consuming_location",
+                     "set_consuming_expiry"))
+
 
     def __init__(self, listeners=None, senders=None,
                  hosting=None, consuming=None, monitors=None,
                  me=0, reply_service=None,
-                 locale="en", save_dir=".", save_services=True):
+                 locale="en", save_dir=".", save_services=True,
+                 gpg_workers=4, send_deadline=10, fanout_deadline=30,
+                 max_sends=8, persistence="snapshot", journal_interval=1,
+                 compact_after=1000, verify_cache_size=1024,
+                 duplicate_window=60, duplicate_size=4096, quota_period=60,
+                 quota_requests=60, quota_bytes=1024 * 1024, quotas=None,
+                 quota_depth=64, request_ttl=300, max_requests=1024,
+                 min_query_interval=0, location_versions=4,
+                 versioned_services=1024, service_ttl=3600, service_ttls=None,
+                 refresh_fraction=0.75, refresh_retries=5):
         """Create a Santiago with the specified parameters.
 
         listeners and senders are both connector-specific dictionaries containing
@@ -120,21 +161,116 @@ class Santiago(object):
         :locale: The locale to use for the UI.
 
         :save_dir: The directory to save service data to, for storage between
-          sessions.
+          sessions.  Decrypted data too large to keep in memory is spilled to
+          a private directory in here, while it's loaded.
 
         :save_services: Whether to save service data between sessions at all.
           Technically, it's "whether service data is overwritten at the end of
           the session", but that's mostly semantics.
 
+        :gpg_workers: The number of GPG workers to keep alive in the shared
+          crypto pool.  Only used by the first Santiago to create the pool.
+
+        :send_deadline: The most seconds to wait for a single outgoing request
+          to be delivered.
+
+        :fanout_deadline: The most seconds to wait for an outgoing request to
+          be delivered to all of a host's locations.
+
+        :max_sends: The most locations to send a single request to at once.
+
+        :persistence: How service data is saved: as a single ``snapshot`` when
+          the Santiago stops, or in a ``journal`` as each change is made.
+
+        :journal_interval: The most seconds a journaled change waits to be
+          committed to disk.
+
+        :compact_after: Replace the journal with a new snapshot after this many
+          changes.
+
+        :verify_cache_size: The most decrypted or verified messages to remember,
+          so they aren't checked again when they're seen again.
+
+        :duplicate_window: Identical incoming requests that arrive within this
+          many seconds of each other are only handled once.
+
+        :duplicate_size: The most incoming requests to remember, to recognize
+          their duplicates.
+
+        :quota_period: Each friend's requests are handled up to a quota every
+          this many seconds.  The rest wait for the next period.
+
+        :quota_requests: The most requests handled for a friend each period.
+
+        :quota_bytes: The most bytes of requests handled for a friend each
+          period.
+
+        :quotas: Friends' own ``scheduler.Quota``s, by key ID or fingerprint.
+          A quota's weight is the friend's share of handling when requests are
+          waiting.
+
+        :quota_depth: The most requests that may wait for each friend.
+
+        :request_ttl: The most seconds to wait for a reply to a request.
+          Replies that come later are ignored, and background refreshes that
+          aren't answered by then are tried again.
+
+        :max_requests: The most requests to wait for replies to at once.  When
+          there are more, the ones that would expire soonest are forgotten.
+
+        :min_query_interval: The fewest seconds between queries for the same
+          host and service, unless they're forced.
+
+        :location_versions: The most versions of each hosted service's
+          locations to remember, so clients that know one of them are only
+          sent what changed since.
+
+        :versioned_services: The most hosted services to remember versions of.
+
+        :service_ttl: The seconds the services I host are good for.  Clients
+          are told this in my replies, so they don't ask again until then.
+          0 leaves the TTL out.
+
+        :service_ttls: The TTLs of particular services I host, by name.
+
+        :refresh_fraction: How much of a consumed service's TTL passes before
+          it's refreshed in the background.  When consumed services expire is
+          saved with their locations.
+
+        :refresh_retries: How many times an unanswered refresh is retried,
+          ``request_ttl`` seconds apart and doubling, before its host is given
+          up on.  Refreshes also stop once the service expires.
+
         """
         self.live = 1
-        self.requests = DefaultDict(set)
+        # held while hosting or consuming data changes, or is copied.
+        self.lock = threading.RLock()
+        self.requests = PendingRequests(request_ttl, max_requests)
+        self.replied = threading.Condition()
+        self.service_ttl = float(service_ttl)
+        self.service_ttls = dict(service_ttls or {})
+        self.expiry = ServiceExpiry(self.refresh, refresh_fraction,
+                                    request_ttl, refresh_retries)
+        # the request versions each host's last reply said it accepts.
+        self.host_versions = dict()
+        self.queries = SingleFlight(min_query_interval)
+        self.versions = LocationVersions(location_versions, versioned_services)
         self.me = me
-        self.gpg = gnupg.GPG(use_agent = True)
+        self.gpg = gpgpool.get_pool(gpg_workers, use_agent = True)
+        self.verified = VerificationCache(verify_cache_size,
+                                          verifycache.keyring_files())
+        self.recipients = pgppackets.RecipientFilter(self.my_key_ids())
+        self.duplicates = DuplicateFilter(duplicate_window, duplicate_size)
+        self.scheduler = FairScheduler(self.dispatch,
+                                       Quota(quota_requests, quota_bytes),
+                                       quotas, quota_period, quota_depth)
         self.connectors = set()
         self.reply_service = reply_service or Santiago.SERVICE_NAME
         self.locale = locale
         self.save_services = save_services
+        self.send_deadline = send_deadline
+        self.fanout_deadline = fanout_deadline
+        self.max_sends = max_sends
 
         if listeners is not None:
             self.listeners = self.create_connectors(listeners, "Listener")
@@ -143,10 +279,44 @@ class Santiago(object):
         if monitors is not None:
             self.monitors = self.create_connectors(monitors, "Monitor")
 
-        self.shelf = shelve.open(save_dir.rstrip(os.sep) + os.sep +
-                                 str(self.me) + ".dat")
+        save_path = save_dir.rstrip(os.sep) + os.sep + str(self.me)
+        self.save_path = save_path
+        self.journal = None
+        self.migrated = set()
+        self.shelf = shelve.open(save_path + ".dat")
         self.hosting = hosting if hosting else self.load_data("hosting")
         self.consuming = consuming if consuming else self.load_data("consuming")
+        Santiago.use_location_sets(self.hosting)
+        Santiago.use_location_sets(self.consuming)
+        self.index = ServiceIndex(self.hosting, self.consuming)
+
+        # rewrite any data saved in an older format.
+        if save_services and self.migrated:
+            for key in self.migrated:
+                self.save_data(key)
+            self.shelf.sync()
+
+        if save_services and persistence == Santiago.JOURNAL:
+            self.journal = journal.Journal(save_path + ".journal", self.gpg,
+                                           self.me, journal_interval,
+                                           compact_after=compact_after,
+                                           compact=self.snapshot)
+
+            # data we were given replaces whatever was saved, so it's
+            # snapshotted before the old journal's dropped.
+            if hosting or consuming:
+                self.journal.compact()
+            else:
+                self.replay_journal()
+
+    @classmethod
+    def use_location_sets(cls, tree):
+        """Store each service's locations in an OrderedSet, in place."""
+
+        for services in tree.itervalues():
+            for service, locations in services.iteritems():
+                if not isinstance(locations, OrderedSet):
+                    services[service] = OrderedSet(locations or ())
 
     def create_connectors(self, data, type):
         connectors = self._create_connectors(data, type)
@@ -201,6 +371,10 @@ class Santiago(object):
         When this has finished, the Santiago will be ready to go.
 
         """
+        if self.journal is not None:
+            self.journal.start()
+
+        self.expiry.start()
         self.change_state("start")
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -214,19 +388,24 @@ class Santiago(object):
             pass
 
         self.change_state("stop")
+        self.scheduler.stop()
+        self.expiry.stop()
 
-        if self.save_services:
+        if self.journal is not None:
+            self.journal.stop()
+            self.journal.compact()
+        elif self.save_services:
             self.save_data("hosting")
             self.save_data("consuming")
 
-        debug_log([key for key in self.shelf])
+        trace("santiago.exit", shelf_keys=lambda: list(self.shelf))
 
         self.shelf.close()
 
     def change_state(self, state):
         """Start or stop listeners and senders."""
 
-        debug_log("Connectors: {0}".format(state))
+        trace("connectors.change_state", state=state)
 
         l_and_s = list()
 
@@ -246,14 +425,47 @@ class Santiago(object):
         for connector in self.connectors:
             getattr(sys.modules[Santiago.CONTROLLER_MODULE.format(connector)], state)()
 
-        debug_log("Santiago: {0}".format(state))
+        trace("santiago.change_state", state=state)
+
+    def my_key_ids(self):
+        """The IDs of my key and its subkeys, or None if I can't find them.
+
+        Incoming requests that aren't encrypted to one of these are dropped
+        without being decrypted.
+
+        """
+        me = str(self.me).upper()
+
+        # too short to find a key by.
+        if len(me) < 8:
+            return None
+
+        try:
+            keys = self.gpg.list_keys(True)
+        except Exception as e:
+            logging.exception(e)
+            return None
+
+        for key in keys:
+            if key["fingerprint"].upper().endswith(me):
+                return [key["keyid"]] + [subkey[0] for subkey in
+                                         key.get("subkeys", ())]
+
+        trace("santiago.key_missing", me=me)
 
     def load_data(self, key):
-        """Load hosting or consuming data from the shelf.
+        """Load hosting or consuming data from its file.
 
         To do this correctly, we need to convert the list values to sets.
         However, that can be done only after unwrapping the signed data.
 
+        Data is stored as a ``registry``, in its own file, and is read and
+        unwrapped a chunk at a time.  Data saved by older versions, in the
+        shelf or as Python literals, is still loaded, and the key is added to
+        ``self.migrated`` so it can be saved again in the new format.
+
+        When consumed services expire is loaded with them.
+
         pre::
 
             key in ("hosting", "consuming")
@@ -263,62 +475,148 @@ class Santiago(object):
             getattr(self, key) # exists
 
         """
-        debug_log("loading data.")
+        trace("data.load", key=key)
 
         if not key in ("hosting", "consuming"):
-            debug_log("bad key {0}".format(key))
+            trace("data.bad_key", key=key)
             return
 
-        message = ""
-
         try:
-            data = self.shelf[key]
-        except KeyError as e:
-            logging.exception(e)
-            data = dict()
-        else:
-            for message in pgpprocessor.Unwrapper(data, gpg=self.gpg):
-                # iterations end when unwrapping complete.
-                pass
+            source = open(self.data_path(key), "rb")
+        except IOError:
+            source = None
 
+        if source is None:
+            # data saved before it had its own file, to be rewritten.
             try:
-                # FIXME there's gotta be something safer we can use here, right?
-                data = ast.literal_eval(str(message))
-            except (ValueError, SyntaxError) as e:
+                source = [self.shelf[key]]
+            except KeyError as e:
                 logging.exception(e)
-                data = dict()
+                return dict()
+
+            self.migrated.add(key)
 
-        debug_log("found {0}: {1}".format(key, data))
+        extras = dict()
+
+        try:
+            data = self.unwrap_data(key, source, extras)
+        finally:
+            if hasattr(source, "close"):
+                source.close()
+
+        if key == "consuming":
+            for (host, service), extra in extras.iteritems():
+                try:
+                    self.expiry.set(host, service, extra["ttl"],
+                                    extra["expires"])
+                except (KeyError, TypeError, ValueError):
+                    trace("data.bad_expiry", host=host, service=service,
+                          extra=extra)
+
+        trace("data.loaded", key=key, data=data)
 
         return data
 
+    def unwrap_data(self, key, source, extras=None):
+        """Unwrap and parse saved data from an iterable of chunks, or a file.
+
+        Each service's extras, if the data has any, are added to ``extras``.
+
+        """
+        unwrapper = pgpprocessor.StreamUnwrapper(
+            source, gpg=self.gpg, cache=self.verified,
+            directory=self.private_directory())
+
+        for layer in unwrapper:
+            # iterations end when unwrapping complete.
+            pass
+
+        # the data's read line by line, never as a whole.  Data that was
+        # never wrapped at all isn't trusted.
+        lines = unwrapper.lines() if unwrapper.type else iter(())
+        first = next(lines, "")
+
+        try:
+            if registry.is_registry(first):
+                return registry.load(itertools.chain([first], lines), extras)
+
+            # data saved before registries existed, to be rewritten.
+            data = ast.literal_eval(first + "".join(lines))
+            self.migrated.add(key)
+
+            return data
+        except (ValueError, SyntaxError) as e:
+            logging.exception(e)
+            return dict()
+
     def save_data(self, key):
         """Save hosting and consuming data to file.
 
         To do this safely, we'll need to convert the set subnodes to lists.
-        That way, we'll be able to sign the data correctly.
+        That way, we'll be able to sign the data correctly.  The data is saved
+        as a ``registry``, streamed into gpg, and replaces the old file only
+        once it's entirely on disk.  Consumed services are saved with when
+        they expire.
 
         pre::
 
             key in ("hosting", "consuming")
 
         """
-        debug_log("saving data.")
+        trace("data.save", key=key)
 
         if not key in ("hosting", "consuming"):
-            debug_log("bad key {0}".format(key))
+            trace("data.bad_key", key=key)
             return
 
-        data = getattr(self, key)
+        # copied, so changes made while it's encrypted don't disturb it.
+        with self.lock:
+            data = dict((name, dict((service, list(locations))
+                                    for service, locations
+                                    in services.iteritems()))
+                        for name, services in getattr(self, key).iteritems())
 
-        data = str(self.gpg.encrypt(str(data), recipients=[self.me],
-                                    sign=self.me))
+        extras = self.expiry.records() if key == "consuming" else None
 
-        self.shelf[key] = data
+        path = self.data_path(key)
+        saving = path + ".new"
 
-        debug_log("saved {0}: {1}".format(key, data))
+        encrypted = self.gpg.encrypt_file(registry.Reader(data, extras),
+                                          [self.me], sign=self.me,
+                                          output=saving)
+
+        if not encrypted.ok:
+            trace("data.unsaved", key=key, status=encrypted.status)
+            raise IOError("Couldn't encrypt {0} data.".format(key))
+
+        with open(saving, "rb") as saved:
+            os.fsync(saved.fileno())
+
+        os.rename(saving, path)
+
+        # the shelf's copy is out of date now.
+        if key in self.shelf:
+            del self.shelf[key]
+
+        trace("data.saved", key=key, path=path)
+
+    def data_path(self, key):
+        """The file hosting or consuming data is saved in."""
+
+        return self.save_path + "." + key
+
+    def private_directory(self):
+        """A directory only I can read, for decrypted data to spill into."""
+
+        path = self.save_path + ".private"
+
+        if not os.path.isdir(path):
+            os.makedirs(path, 0700)
+
+        os.chmod(path, 0700)
+
+        return path
 
-
     def i_am(self, server):
         """Verify whether this server is the specified server."""
 
@@ -326,12 +624,20 @@ class Santiago(object):
 
     # FIXME: unify create_hosting and create_consuming, to reduce redundancy.
 
+    # Each create, delete, and replace method records only what it changed, so
+    # that the journal can replay it.  Locations are kept in OrderedSets, so
+    # adding, checking, and removing each one takes constant time.  Each holds
+    # the data lock, so snapshots never see a change half made.
+
+    @locked
     def create_hosting_client(self, client):
         """Create a hosting client if one doesn't currently exist."""
 
         if client not in self.hosting:
             self.hosting[client] = dict()
+            self.record("create_hosting_client", client)
 
+    @locked
     def create_hosting_service(self, client, service):
         """Create a hosting service if one doesn't currently exist.
 
@@ -341,8 +647,11 @@ class Santiago(object):
         self.create_hosting_client(client)
 
         if service not in self.hosting[client]:
-            self.hosting[client][service] = list()
+            self.hosting[client][service] = OrderedSet()
+            self.index.add_hosting(client, service)
+            self.record("create_hosting_service", client, service)
 
+    @locked
     def create_hosting_location(self, client, service, locations):
         """Create a hosting service if one doesn't currently exist.
 
@@ -352,16 +661,25 @@ class Santiago(object):
         """
         self.create_hosting_service(client, service)
 
+        added = list()
         for location in locations:
             if location not in self.hosting[client][service]:
-                self.hosting[client][service].append(location)
+                self.hosting[client][service].add(location)
+                added.append(location)
+
+        if added:
+            self.index.add_hosting(client, service, added)
+            self.record("create_hosting_location", client, service, added)
 
+    @locked
     def create_consuming_host(self, host):
         """Create a consuming host if one doesn't currently exist."""
 
         if host not in self.consuming:
             self.consuming[host] = dict()
+            self.record("create_consuming_host", host)
 
+    @locked
     def create_consuming_service(self, host, service):
         """Create a consuming service if one doesn't currently exist.
 
@@ -371,8 +689,11 @@ class Santiago(object):
         self.create_consuming_host(host)
 
         if service not in self.consuming[host]:
-            self.consuming[host][service] = list()
+            self.consuming[host][service] = OrderedSet()
+            self.index.add_consuming(host, service)
+            self.record("create_consuming_service", host, service)
 
+    @locked
     def create_consuming_location(self, host, service, locations):
         """Create a consuming location if one doesn't currently exist.
 
@@ -382,19 +703,150 @@ class Santiago(object):
         """
         self.create_consuming_service(host, service)
 
+        added = list()
         for location in locations:
             if location not in self.consuming[host][service]:
-                self.consuming[host][service].append(location)
+                self.consuming[host][service].add(location)
+                added.append(location)
 
+        if added:
+            self.record("create_consuming_location", host, service, added)
+
+    @locked
     def replace_consuming_location(self, host, service, locations):
-        """Replace existing consuming locations with the new ones."""
+        """Replace existing consuming locations with the new ones, in order.
+
+        Nothing's changed (or recorded) if they're already the same.
 
+        """
         try:
-            del self.consuming[host][self.reply_service]
-        except:
+            if list(self.consuming[host][service]) == list(locations):
+                return
+        except KeyError:
             pass
 
-        self.create_consuming_location(host, self.reply_service, locations)
+        self.delete_consuming_service(host, service)
+        self.create_consuming_location(host, service, locations)
+
+    @locked
+    def delete_hosting_client(self, client):
+        """Stop hosting anything for the client."""
+
+        if client in self.hosting:
+            self.index.remove_hosting_client(client, self.hosting[client])
+            del self.hosting[client]
+            self.record("delete_hosting_client", client)
+
+    @locked
+    def delete_hosting_service(self, client, service):
+        """Stop hosting the service for the client."""
+
+        try:
+            locations = self.hosting[client].pop(service)
+        except KeyError:
+            return
+
+        self.index.remove_hosting(client, service, locations)
+        self.index.remove_hosting(client, service)
+        self.record("delete_hosting_service", client, service)
+
+    @locked
+    def delete_hosting_location(self, client, service, locations):
+        """Stop hosting the service for the client at the locations."""
+
+        try:
+            hosted = self.hosting[client][service]
+        except KeyError:
+            return
+
+        removed = list()
+        for location in locations:
+            if location in hosted:
+                hosted.remove(location)
+                removed.append(location)
+
+        if removed:
+            self.index.remove_hosting(client, service, removed)
+            self.record("delete_hosting_location", client, service, removed)
+
+    @locked
+    def delete_consuming_host(self, host):
+        """Forget every service the host serves for me."""
+
+        if host in self.consuming:
+            self.index.remove_consuming_host(host, self.consuming[host])
+            del self.consuming[host]
+            self.expiry.forget(host)
+            self.record("delete_consuming_host", host)
+
+    @locked
+    def delete_consuming_service(self, host, service):
+        """Forget the service the host serves for me."""
+
+        try:
+            del self.consuming[host][service]
+        except KeyError:
+            return
+
+        self.index.remove_consuming(host, service)
+        self.expiry.forget(host, service)
+        self.record("delete_consuming_service", host, service)
+
+    @locked
+    def delete_consuming_location(self, host, service, locations):
+        """Forget the locations the host serves the service at."""
+
+        try:
+            consumed = self.consuming[host][service]
+        except KeyError:
+            return
+
+        removed = list()
+        for location in locations:
+            if location in consumed:
+                consumed.remove(location)
+                removed.append(location)
+
+        if removed:
+            self.record("delete_consuming_location", host, service, removed)
+
+    @locked
+    def set_consuming_expiry(self, host, service, ttl, expires=None):
+        """Remember when the service's locations expire.
+
+        They expire ``ttl`` seconds from now, or at ``expires``, if it's given.
+
+        """
+
+        expires = self.expiry.set(host, service, ttl, expires)
+        self.record("set_consuming_expiry", host, service, ttl, expires)
+
+    def record(self, operation, *args):
+        """Journal a change to the hosting or consuming data, if journaling."""
+
+        if self.journal is not None:
+            self.journal.append(operation, *args)
+
+    def replay_journal(self):
+        """Reapply every journaled change to the loaded snapshot."""
+
+        log, self.journal = self.journal, None
+
+        try:
+            for operation, args in log.replay():
+                if operation in Santiago.JOURNALED:
+                    getattr(self, operation)(*args)
+                else:
+                    trace("journal.unknown_operation", operation=operation)
+        finally:
+            self.journal = log
+
+    def snapshot(self):
+        """Save all hosting and consuming data to the shelf, right now."""
+
+        self.save_data("hosting")
+        self.save_data("consuming")
+        self.shelf.sync()
 
     def get_host_locations(self, client, service):
         """Return where I'm hosting the service for the client.
@@ -434,34 +886,189 @@ class Santiago(object):
         except KeyError as e:
             logging.exception(e)
 
+    @locked
     def get_served_clients(self, service):
         """Return what clients I'm hosting the service for."""
 
-        return [client for client in self.hosting if service in
-                   self.hosting[client]]
+        return self.index.served_clients(service)
 
+    @locked
     def get_serving_hosts(self, service):
         """Return which hosts are hosting the service for me."""
 
-        return [host for host in self.consuming if service in
-                   self.consuming[host]]
+        return self.index.serving_hosts(service)
+
+    @locked
+    def get_location_clients(self, location):
+        """Return which (client, service) pairs I'm hosting at the location."""
+
+        return self.index.location_clients(location)
 
 
-    def query(self, host, service):
+    def query(self, host, service, force=False):
         """Request a service from another Santiago.
 
         This tag starts the entire Santiago request process.
 
+        Identical queries are coalesced: while one is being sent, the others
+        wait for it.  While its reply is outstanding, or for
+        ``min_query_interval`` seconds after it's sent, the service isn't
+        queried again unless the query is forced.  Nor is it while the
+        locations we have for it are fresh.
+
+        Returns the delivery summary from ``outgoing_request``, if the request
+        could be sent at all.
+
         """
-        try:
-            self.outgoing_request(
+        if not force and self.expiry.fresh(host, service):
+            trace("query.fresh", host=host, service=service)
+            return
+
+        def send():
+            return self.outgoing_request(
                 host, self.me, host, self.me,
                 service, None, self.consuming[host][self.reply_service])
+
+        try:
+            return self.queries.call(
+                (host, service), send, force,
+                lambda: self.requests.pending(host, service))
         except Exception as e:
             logging.exception("Couldn't handle %s.%s", host, service)
 
+    def query_many(self, host, services, force=False):
+        """Request several services from another Santiago, at once.
+
+        ``services`` is a list of service names, or ``ALL_SERVICES`` for every
+        service the host hosts for me.  The host answers with a single reply.
+
+        The request includes the versions of the locations I already know, so
+        the host only needs to reply with what's changed.  Services whose
+        locations are fresh aren't asked for, unless the query is forced.
+
+        Returns the delivery summary from ``outgoing_request``, like
+        ``query``.
+
+        Older hosts only accept version 1 requests, and silently drop batches.
+        So unless the host's last reply said it accepts batches, each service
+        is queried on its own instead, and a dictionary of each one's summary
+        is returned.  Asking a host that hasn't replied yet for
+        ``ALL_SERVICES`` sends the batch too, as only batches can ask for
+        services we don't know of yet.
+
+        """
+        batches = self.accepts_batches(host)
+
+        if not batches:
+            trace("query.unbatched", host=host, service=services)
+
+            results = self.query_each(host, services, force)
+
+            if batches is not None or services != Santiago.ALL_SERVICES:
+                return results
+
+        if services == Santiago.ALL_SERVICES:
+            names = [services]
+        else:
+            services = names = sorted(
+                service for service in set(services)
+                if force or not self.expiry.fresh(host, service))
+
+        if not names:
+            trace("query.fresh", host=host, service=services)
+            return
+
+        def send():
+            known = self.consuming[host]
+            if services != Santiago.ALL_SERVICES:
+                known = dict((name, known[name]) for name in
+                             services + [self.reply_service] if name in known)
+
+            return self.outgoing_request(
+                host, self.me, host, self.me,
+                services, None, self.consuming[host][self.reply_service],
+                Santiago.BATCH_VERSION,
+                dict((name, versions.digest(places))
+                     for name, places in known.iteritems()))
+
+        try:
+            return self.queries.call(
+                (host, tuple(names)), send, force,
+                lambda: all(self.requests.pending(host, name)
+                            for name in names))
+        except Exception as e:
+            logging.exception("Couldn't handle %s.%s", host, services)
+
+    def query_each(self, host, services, force=False):
+        """Request each of several services from another Santiago, with
+        version 1 requests.
+
+        ``ALL_SERVICES`` asks for each service I already consume from the host.
+        Returns a dictionary of each service's delivery summary.
+
+        """
+        if services == Santiago.ALL_SERVICES:
+            services = self.consuming.get(host, {}).keys()
+
+        return dict((service, self.query(host, service, force))
+                    for service in sorted(set(services)))
+
+    def accepts_batches(self, host):
+        """Whether the host's last reply said it accepts batches, or None if
+        it hasn't replied yet."""
+
+        try:
+            return Santiago.BATCH_VERSION in self.host_versions[host]
+        except KeyError:
+            return None
+
+    def refresh(self, host, service):
+        """Relearn a consumed service before it expires.
+
+        Services that are no longer consumed aren't refreshed.
+
+        """
+        if service not in self.consuming.get(host, ()):
+            self.expiry.forget(host, service)
+            return
+
+        trace("query.refresh", host=host, service=service)
+
+        self.query(host, service, force=True)
+
+    def service_ttls_for(self, services):
+        """The TTL of each service I host, for a reply, or None."""
+
+        ttls = dict((service, self.service_ttls.get(service, self.service_ttl))
+                    for service in services)
+        ttls = dict((service, ttl) for service, ttl in ttls.iteritems() if ttl)
+
+        return ttls or None
+
+    def wait_for_reply(self, host, service, timeout):
+        """Wait until the host replies with the service, or the timeout passes.
+
+        Returns immediately if we aren't waiting on the service, either because
+        we never asked for it, or because it's been answered or expired.
+        Returns whether we're done waiting.
+
+        """
+        deadline = time.time() + float(timeout)
+
+        with self.replied:
+            while self.requests.pending(host, service):
+                remaining = deadline - time.time()
+
+                if remaining <= 0:
+                    return False
+
+                self.replied.wait(remaining)
+
+        return True
+
     def outgoing_request(self, from_, to, host, client,
-                         service, locations="", reply_to=""):
+                         service, locations="", reply_to="", request_version=1,
+                         known=None, ttl=None):
         """Send a request to another Santiago service.
 
         This tag is used when sending queries or replies to other Santiagi.
@@ -471,22 +1078,54 @@ class Santiago(object):
         The outgoing ``request`` is literally the request's text.  It needs to
         be wrapped for transport across the connector.
 
+        The request is sent to all of the host's locations at once.  We only
+        wait until every send finishes or the deadlines pass, then return the
+        per-location summary from ``fanout.fan_out``.
+
+        Version 2 requests carry a list of services (or ``ALL_SERVICES``) and
+        the ``known`` versions of their locations.  Replies carry a dictionary
+        of each service's locations, or the changes since the known version.
+
+        Replies of either version may carry each service's ``ttl``, in
+        seconds.
+
         """
-        self.requests[host].add(service)
+        message = { "host": host, "client": client,
+                    "service": service, "locations": list(locations or ""),
+                    "reply_to": list(reply_to or ""),
+                    "request_version": request_version,
+                    "reply_versions": list(Santiago.SUPPORTED_CONNECTORS),}
+        services = [service]
+
+        if request_version == Santiago.BATCH_VERSION:
+            if service != Santiago.ALL_SERVICES:
+                services = service
 
-        request = self.gpg.encrypt(
-            json.dumps({ "host": host, "client": client,
-                  "service": service, "locations": list(locations or ""),
-                  "reply_to": list(reply_to),
-                  "request_version": 1,
-                  "reply_versions": list(Santiago.SUPPORTED_CONNECTORS),}),
-            host,
-            sign=self.me)
+            message["locations"] = dict(
+                (name, places if isinstance(places, dict) else list(places))
+                for name, places in (locations or {}).iteritems())
+            message["known"] = known
 
-        for destination in self.consuming[host][self.reply_service]:
+        if ttl is not None:
+            message["ttl"] = ttl
+
+        for name in services:
+            self.requests.add(host, name)
+
+        request = self.gpg.encrypt(json.dumps(message), host, sign=self.me)
+
+        def send(destination):
             o = urlparse.urlparse(destination)
             self.senders[o.scheme].outgoing_request(request, destination)
 
+        results = fanout.fan_out(self.consuming[host][self.reply_service],
+                                 send, self.send_deadline,
+                                 self.fanout_deadline, self.max_sends)
+
+        trace("request.sent", host=host, service=service, results=results)
+
+        return results
+
     def incoming_request(self, request_list):
         """Provide a service to a client.
 
@@ -504,42 +1143,106 @@ class Santiago(object):
         is set up to reject connections by default.  Then, the
         attacker knows that the last request brought down a system.
 
+        Every request in the list is handed to the GPG pool at once, so a batch
+        is decrypted as concurrently as the pool allows.  The decrypted
+        requests are handed to the scheduler, which handles each friend's
+        requests up to its quota, fairly between friends, and holds the rest
+        for later.
+        Requests that were already decrypted, like retransmissions, come from
+        the verification cache instead.  Requests that aren't encrypted to me,
+        or that are copies of ones I've just seen, aren't decrypted at all.
+
         """
         # no matter what happens, the sender will never hear about it.
+        # one bad request doesn't cost the rest of the batch, and whatever
+        # was submitted is always drained.
         try:
+            # decrypt the whole batch concurrently, then handle it in order.
+            # requests seen before don't need decrypting again.
+            decrypting = list()
             for request in request_list:
-                debug_log("request: {0}".format(str(request)))
+                try:
+                    trace("request.received", request=request)
 
-                unpacked = self.unpack_request(request)
+                    if self.duplicates.seen(request):
+                        trace("request.duplicate")
+                        continue
 
-                if not unpacked:
-                    debug_log("opaque request.")
-                else:
-                    debug_log("unpacked {0}".format(str(unpacked)))
-
-                    if unpacked["locations"]:
-                        debug_log("handling reply")
-
-                        self.handle_reply(
-                            unpacked["from"], unpacked["to"],
-                            unpacked["host"], unpacked["client"],
-                            unpacked["service"], unpacked["locations"],
-                            unpacked["reply_to"],
-                            unpacked["request_version"],
-                            unpacked["reply_versions"])
-                    else:
-                        debug_log("handling request")
-
-                        self.handle_request(
-                            unpacked["from"], unpacked["to"],
-                            unpacked["host"], unpacked["client"],
-                            unpacked["service"], unpacked["reply_to"],
-                            unpacked["request_version"],
-                            unpacked["reply_versions"])
+                    if not self.recipients.accepts(request):
+                        trace("request.not_for_me")
+                        continue
+
+                    digest = VerificationCache.digest("decrypt", request)
+                    decrypted = self.verified.get(digest)
+
+                    if decrypted is None:
+                        decrypted = self.gpg.submit("decrypt", request)
+
+                    decrypting.append((request, digest, decrypted))
+
+                except Exception as e:
+                    logging.exception(e)
+
+            for request, digest, decrypted in decrypting:
+                try:
+                    self.submit_decrypted(request, digest, decrypted)
+                except Exception as e:
+                    logging.exception(e)
 
         except Exception as e:
             logging.exception(e)
 
+        finally:
+            try:
+                self.scheduler.drain()
+            except Exception as e:
+                logging.exception(e)
+
+    def submit_decrypted(self, request, digest, decrypted):
+        """Unpack one decrypted request and hand it to the scheduler.
+
+        ``decrypted`` is either gpg's result or the pool's job producing it.
+
+        """
+        if isinstance(decrypted, gpgpool.Job):
+            decrypted = self.verified.put(digest, decrypted.result())
+
+        unpacked = self.unpack_decrypted_request(decrypted)
+
+        if not unpacked:
+            trace("request.opaque")
+        else:
+            trace("request.unpacked", request=unpacked)
+
+            if not self.scheduler.submit(unpacked["from"], unpacked,
+                                         len(request)):
+                trace("request.over_quota", client=unpacked["from"])
+
+    def dispatch(self, unpacked):
+        """Handle an unpacked request or reply."""
+
+        if unpacked["locations"]:
+            trace("request.handling_reply")
+
+            self.handle_reply(
+                unpacked["from"], unpacked["to"],
+                unpacked["host"], unpacked["client"],
+                unpacked["service"], unpacked["locations"],
+                unpacked["reply_to"],
+                unpacked["request_version"],
+                unpacked["reply_versions"],
+                unpacked.get("ttl"))
+        else:
+            trace("request.handling_request")
+
+            self.handle_request(
+                unpacked["from"], unpacked["to"],
+                unpacked["host"], unpacked["client"],
+                unpacked["service"], unpacked["reply_to"],
+                unpacked["request_version"],
+                unpacked["reply_versions"],
+                unpacked.get("known"))
+
     def unpack_request(self, request):
         """Decrypt and verify the request.
 
@@ -553,12 +1256,24 @@ class Santiago(object):
         understand.
 
         """
-        request = self.gpg.decrypt(request)
+        if not self.recipients.accepts(request):
+            trace("request.not_for_me")
+            return
+
+        return self.unpack_decrypted_request(
+            self.verified.call("decrypt", self.gpg.decrypt, request))
+
+    def unpack_decrypted_request(self, request):
+        """Verify and unpack a request gpg has already decrypted.
+
+        ``request`` is the result of ``gpg.decrypt``.  Returns the same
+        dictionary as ``unpack_request``.
 
+        """
         # skip badly signed messages or ones for other folks.
         if not (str(request) and request.fingerprint):
-            debug_log("fail request {0}".format(str(request)))
-            debug_log("fail fingerprint {0}".format(str(request.fingerprint)))
+            trace("request.unverified", request=lambda: str(request),
+                  fingerprint=request.fingerprint)
             return
 
         # copy out all white-listed keys from request, throwing away cruft
@@ -568,18 +1283,39 @@ class Santiago(object):
             for key in Santiago.ALL_KEYS:
                 request_body[key] = source[key]
         except KeyError:
-            debug_log("missing key {0}".format(str(source)))
+            trace("request.missing_key", request=source)
             return
 
         # required keys are non-null
         if None in [request_body[x] for x in Santiago.REQUIRED_KEYS]:
-            debug_log("blank key {0}: {1}".format(key, str(request_body)))
+            trace("request.blank_key", request=request_body)
             return
 
+        # batches' locations are a dictionary instead.
+        batch = request_body["request_version"] == Santiago.BATCH_VERSION
+        list_keys = Santiago.LIST_KEYS - set(("locations",)) if batch \
+            else Santiago.LIST_KEYS
+
         if False in [type(request_body[key]) == list for key in
-                     Santiago.LIST_KEYS if request_body[key] is not None]:
+                     list_keys if request_body[key] is not None]:
             return
 
+        if batch:
+            request_body["known"] = source.get("known")
+
+            if not Santiago.valid_batch(request_body["service"],
+                                        request_body["locations"],
+                                        request_body["known"]):
+                trace("request.invalid_batch", request=request_body)
+                return
+
+        if "ttl" in source:
+            request_body["ttl"] = source["ttl"]
+
+            if not Santiago.valid_ttls(source["ttl"]):
+                trace("request.invalid_ttl", request=request_body)
+                return
+
         # versions must overlap.
         if not (Santiago.SUPPORTED_CONNECTORS &
                 set(request_body["reply_versions"])):
@@ -594,8 +1330,52 @@ class Santiago(object):
 
         return request_body
 
+    @classmethod
+    def valid_ttls(cls, ttls):
+        """Whether a reply's TTLs are a dictionary of positive numbers."""
+
+        if ttls is None:
+            return True
+        if type(ttls) != dict:
+            return False
+
+        return not False in [type(ttl) in (int, long, float) and ttl > 0
+                             for ttl in ttls.itervalues()]
+
+    @classmethod
+    def valid_batch(cls, services, locations, known=None):
+        """Whether a version 2 request's services and locations are usable.
+
+        Services must be a list of names, or ``ALL_SERVICES``.  Locations, if
+        any, must be a dictionary of lists or changes.  Known versions, if
+        any, must be a dictionary of strings.
+
+        """
+        if services != Santiago.ALL_SERVICES:
+            if type(services) != list:
+                return False
+            if False in [isinstance(service, basestring)
+                         for service in services]:
+                return False
+
+        if known is not None:
+            if type(known) != dict:
+                return False
+            if False in [isinstance(version, basestring)
+                         for version in known.itervalues()]:
+                return False
+
+        if locations is None:
+            return True
+        if type(locations) != dict:
+            return False
+
+        return not False in [type(places) == list or versions.is_change(places)
+                             for places in locations.itervalues()]
+
     def handle_request(self, from_, to, host, client,
-                       service, reply_to, request_version, reply_versions):
+                       service, reply_to, request_version, reply_versions,
+                       known=None):
         """Actually do the request processing.
 
         - Verify we're willing to host for both the client and proxy.  If we
@@ -604,34 +1384,88 @@ class Santiago(object):
         - Learn new Santiagi if they were sent.
         - Reply to the client on the appropriate connector.
 
+        Version 2 requests ask for a list of services, or all of them.  They're
+        answered with a single reply holding every service we host for the
+        client, if the client accepts version 2 replies, or one reply per
+        service if it doesn't.  Services whose ``known`` versions are recent
+        are answered with the changes since then, and our reply locations
+        aren't sent at all if the client knows them already.
+
         """
         # give up if we don't host this service for the sender.
         try:
             self.hosting[from_][self.reply_service]
         except KeyError:
-            debug_log("no {0} hosting for {1}".format(self.reply_service,
-                                                      from_))
+            trace("request.not_hosting", service=self.reply_service,
+                  client=from_)
             return
 
+        batch = request_version == Santiago.BATCH_VERSION
+
         # give up if we won't host the service for the client.
         try:
-            self.hosting[client][service]
+            if batch:
+                services = self.hosted_services(client, service)
+            else:
+                self.hosting[client][service]
         except KeyError:
-            debug_log("no host for {0} in {1}".format(client, self.hosting))
+            trace("request.not_hosting", service=service, client=client)
+            return
+
+        if batch and not services:
+            trace("request.not_hosting", service=service, client=client)
             return
 
         # if we don't proxy, learn new reply locations and send the request.
         if not self.i_am(host):
             self.proxy(to, host, client, service, reply_to)
-        else:
-            if reply_to:
-                self.replace_consuming_location(client,
-                                                self.reply_service,
-                                                reply_to)
+            return
+
+        if reply_to:
+            self.replace_consuming_location(client,
+                                            self.reply_service,
+                                            reply_to)
+
+        reply_to = self.hosting[client][self.reply_service]
+
+        if not batch:
+            self.outgoing_request(
+                self.me, client, self.me, client,
+                service, self.hosting[client][service], reply_to,
+                ttl=self.service_ttls_for([service]))
+        elif Santiago.BATCH_VERSION in reply_versions:
+            known = known or {}
+
+            if known.get(self.reply_service) == versions.digest(reply_to):
+                reply_to = None
+
             self.outgoing_request(
                 self.me, client, self.me, client,
-                service, self.hosting[client][service],
-                self.hosting[client][self.reply_service])
+                services, dict((name, self.versions.change(
+                            (client, name), known.get(name),
+                            self.hosting[client][name]))
+                               for name in services),
+                reply_to, Santiago.BATCH_VERSION,
+                ttl=self.service_ttls_for(services))
+        else:
+            for name in services:
+                self.outgoing_request(
+                    self.me, client, self.me, client,
+                    name, self.hosting[client][name], reply_to,
+                    ttl=self.service_ttls_for([name]))
+
+    def hosted_services(self, client, services):
+        """The requested services I host for the client.
+
+        Raises a KeyError if I don't host anything for the client.
+
+        """
+        hosted = self.hosting[client]
+
+        if services == Santiago.ALL_SERVICES:
+            return sorted(hosted)
+
+        return [service for service in services if service in hosted]
 
     def proxy(self, request):
         """Pass off a request to another Santiago.
@@ -644,47 +1478,106 @@ class Santiago(object):
 
     def handle_reply(self, from_, to, host, client,
                      service, locations, reply_to,
-                     request_version, reply_versions):
+                     request_version, reply_versions, ttl=None):
         """Process a reply from a Santiago service.
 
         The last call in the chain that makes up the Santiago system, we now
         take the reply from the other Santiago server and learn any new service
         locations, if we've requested locations for that service.
 
+        Version 2 replies hold a dictionary of each service's locations.  We
+        only learn the services we asked for, by name or by asking for all.
+        A service's whole list of locations replaces the ones we had, so our
+        version of it is the host's.  Services may instead be answered with the
+        changes since the version we know, which are applied to our
+        locations, removals and all.  Changes to versions we don't know are
+        ignored.
+
+        Services that come with a TTL are fresh until it passes, and are
+        refreshed a while before then.
+
+        The versions the host accepts are remembered, so we know whether to
+        send it batches.
+
         """
-        debug_log("local {0}".format(str(locals())))
+        trace("reply.received", from_=from_, to=to, host=host, client=client,
+              service=service, locations=locations, reply_to=reply_to,
+              request_version=request_version, reply_versions=reply_versions)
+
+        if request_version == Santiago.BATCH_VERSION:
+            replies = sorted(locations.iteritems())
+        else:
+            replies = [(service, locations)]
 
         # give up if we won't consume the service from the proxy or the client.
         try:
-            if service not in self.requests[host]:
-                debug_log("unrequested service {0}: ".format(
-                        service, self.requests))
-                return
+            waiting = self.requests[host]
         except KeyError:
-            debug_log("unrequested host {0}: ".format(host, self.requests))
+            trace("reply.unrequested_host", host=host)
+            return
+
+        replies = [(name, places) for name, places in replies
+                   if name in waiting or Santiago.ALL_SERVICES in waiting]
+        if not replies:
+            trace("reply.unrequested_service", host=host, service=service)
             return
 
         # give up or proxy if the message isn't for me.
         if not self.i_am(to):
-            debug_log("not to {0}".format(to))
+            trace("reply.not_to_me", to=to)
             return
         if not self.i_am(client):
-            debug_log("not client {0}".format(client))
+            trace("reply.not_client", client=client)
             self.proxy()
             return
 
+        self.host_versions[host] = set(reply_versions)
+
         if reply_to:
             self.replace_consuming_location(host, self.reply_service, reply_to)
-        self.create_consuming_location(host, service, locations)
 
-        self.requests[host].remove(service)
-        # clean buffers
-        if not self.requests[host]:
-            del self.requests[host]
+        ttl = ttl or {}
+
+        for name, places in replies:
+            self.requests.discard(host, name)
+
+            if not versions.is_change(places):
+                self.replace_consuming_location(host, name, places)
+                self.learned_ttl(host, name, ttl)
+                continue
+
+            try:
+                current = self.consuming[host][name]
+            except KeyError:
+                current = None
+
+            if current is None or versions.digest(current) != places["base"]:
+                trace("reply.unknown_version", host=host, service=name)
+                continue
 
-        debug_log("Success!")
-        debug_log("consuming {0}".format(self.consuming))
-        debug_log("requests {0}".format(self.requests))
+            if places.get("removed"):
+                self.delete_consuming_location(host, name, places["removed"])
+            if places.get("added"):
+                self.create_consuming_location(host, name, places["added"])
+
+            self.learned_ttl(host, name, ttl)
+
+        if request_version == Santiago.BATCH_VERSION:
+            self.requests.discard(host, Santiago.ALL_SERVICES)
+
+        with self.replied:
+            self.replied.notify_all()
+
+        trace("reply.handled", host=host, service=service,
+              locations=lambda: dict((name, self.consuming[host].get(name))
+                                     for name, places in replies),
+              outstanding=self.requests.outstanding)
+
+    def learned_ttl(self, host, service, ttls):
+        """Remember when the service expires, if the host said."""
+
+        if service in ttls:
+            self.set_consuming_expiry(host, service, ttls[service])
 
 class SantiagoConnector(object):
     """Generic Santiago connector superclass.
@@ -729,6 +1622,11 @@ class SantiagoListener(SantiagoConnector):
     def incoming_request(self, request):
         self.santiago.incoming_request(request)
 
+    def stats(self):
+        """Return the listener's counters, for the scheduling monitor."""
+
+        return dict()
+
 class SantiagoSender(SantiagoConnector):
     """Generic Santiago Sender superclass.
 
@@ -766,10 +1664,17 @@ class Stop(SantiagoMonitor):
         self.santiago.live = 0
 
 class Learn(SantiagoMonitor):
-    def POST(self, host, service, *args, **kwargs):
+    def POST(self, host, service, force=False, *args, **kwargs):
+        """Learn the service, or a comma-separated list of them, or all."""
+
         super(Learn, self).POST(host, service, *args, **kwargs)
 
-        self.santiago.query(host, service)
+        if service == Santiago.ALL_SERVICES or "," in service:
+            self.santiago.query_many(
+                host, service if service == Santiago.ALL_SERVICES
+                else service.split(","), force)
+        else:
+            self.santiago.query(host, service, force)
 
 class Hosting(SantiagoMonitor):
     def GET(self, *args, **kwargs):
@@ -785,8 +1690,7 @@ class Hosting(SantiagoMonitor):
     def DELETE(self, client, *args, **kwargs):
         super(Hosting, self).DELETE(client, *args, **kwargs)
 
-        if client in self.santiago.hosting:
-            del self.santiago.hosting[client]
+        self.santiago.delete_hosting_client(client)
 
 class HostedClient(SantiagoMonitor):
 
@@ -806,18 +1710,19 @@ class HostedClient(SantiagoMonitor):
     def DELETE(self, client, service, *args, **kwargs):
         super(HostedClient, self).DELETE(client, service, *args, **kwargs)
 
-        if service in self.santiago.hosting[client]:
-            del self.santiago.hosting[client][service]
+        self.santiago.delete_hosting_service(client, service)
 
 class HostedService(SantiagoMonitor):
 
     def GET(self, client, service, *args, **kwargs):
         super(HostedService, self).GET(client, service, *args, **kwargs)
 
+        locations = self.santiago.get_host_locations(client, service)
+
         return {
             "service": service,
             "client": client,
-            "locations": self.santiago.get_host_locations(client, service)}
+            "locations": list(locations) if locations is not None else None}
 
     def PUT(self, client, service, location, *args, **kwargs):
         super(HostedService, self).PUT(client, service, location,
@@ -825,14 +1730,60 @@ class HostedService(SantiagoMonitor):
 
         self.santiago.create_hosting_location(client, service, [location])
 
-    # Have to remove instead of delete for locations as $service is a list
     def DELETE(self, client, service, location, *args, **kwargs):
         super(HostedService, self).DELETE(client, service, location,
                                           *args, **kwargs)
 
-        if client in self.santiago.hosting:
-            if location in self.santiago.hosting[client][service]:
-                self.santiago.hosting[client][service].remove(location)
+        self.santiago.delete_hosting_location(client, service, [location])
+
+class ServedClients(SantiagoMonitor):
+
+    def GET(self, service, *args, **kwargs):
+        super(ServedClients, self).GET(service, *args, **kwargs)
+
+        return { "service": service,
+                 "clients": self.santiago.get_served_clients(service) }
+
+class ServingHosts(SantiagoMonitor):
+
+    def GET(self, service, *args, **kwargs):
+        super(ServingHosts, self).GET(service, *args, **kwargs)
+
+        return { "service": service,
+                 "hosts": self.santiago.get_serving_hosts(service) }
+
+class LocationClients(SantiagoMonitor):
+
+    def GET(self, location="", *args, **kwargs):
+        super(LocationClients, self).GET(location, *args, **kwargs)
+
+        return { "location": location,
+                 "clients": self.santiago.get_location_clients(location) }
+
+class Scheduling(SantiagoMonitor):
+    """Reports the fair scheduler's queues, the crypto pool's latency, and
+    how many requests the listeners and filters let through."""
+
+    def GET(self, *args, **kwargs):
+        super(Scheduling, self).GET(*args, **kwargs)
+
+        stats = self.santiago.scheduler.stats()
+        stats["crypto"] = self.santiago.gpg.stats()
+        stats["crypto"]["cache"] = self.santiago.verified.stats()
+        stats["duplicates"] = self.santiago.duplicates.stats()
+        stats["listeners"] = dict(
+            (protocol, listener.stats()) for protocol, listener in
+            getattr(self.santiago, "listeners", dict()).iteritems())
+
+        return stats
+
+class Requests(SantiagoMonitor):
+
+    def GET(self, *args, **kwargs):
+        super(Requests, self).GET(*args, **kwargs)
+
+        return { "requests": self.santiago.requests.outstanding(),
+                 "stats": self.santiago.requests.stats() }
 
 class Consuming(SantiagoMonitor):
 
@@ -849,8 +1800,7 @@ class Consuming(SantiagoMonitor):
     def DELETE(self, host, *args, **kwargs):
         super(Consuming, self).DELETE(host, *args, **kwargs)
 
-        if host in self.santiago.consuming:
-            del self.santiago.consuming[host]
+        self.santiago.delete_consuming_host(host)
 
 class ConsumedHost(SantiagoMonitor):
 
@@ -870,18 +1820,40 @@ class ConsumedHost(SantiagoMonitor):
     def DELETE(self, host, service, *args, **kwargs):
         super(ConsumedHost, self).DELETE(host, service, *args, **kwargs)
 
-        if service in self.santiago.consuming[host]:
-            del self.santiago.consuming[host][service]
+        self.santiago.delete_consuming_service(host, service)
+
+class Wait(SantiagoMonitor):
+    """Reports a consumed service once the host replies with it."""
+
+    # the most seconds a monitor request is held open.
+    MAX_TIMEOUT = 60
+
+    def GET(self, host, service, timeout=MAX_TIMEOUT, *args, **kwargs):
+        super(Wait, self).GET(host, service, *args, **kwargs)
+
+        timeout = min(max(float(timeout), 0), Wait.MAX_TIMEOUT)
+        replied = self.santiago.wait_for_reply(host, service, timeout)
+        locations = self.santiago.get_client_locations(host, service)
+
+        return { "service": service,
+                 "host": host,
+                 "replied": replied,
+                 "expires": self.santiago.expiry.expires(host, service),
+                 "locations": list(locations) if locations is not None
+                     else None }
 
 class ConsumedService(SantiagoMonitor):
 
     def GET(self, host, service, *args, **kwargs):
         super(ConsumedService, self).GET(host, service, *args, **kwargs)
 
+        locations = self.santiago.get_client_locations(host, service)
+
         return { "service": service,
                  "host": host,
-                 "locations":
-                     self.santiago.get_client_locations(host, service) }
+                 "expires": self.santiago.expiry.expires(host, service),
+                 "locations": list(locations) if locations is not None
+                     else None }
 
     def PUT(self, host, service, location, *args, **kwargs):
         super(ConsumedService, self).PUT(host, service, location,
@@ -889,13 +1861,11 @@ class ConsumedService(SantiagoMonitor):
 
         self.santiago.create_consuming_location(host, service, [location])
 
-    # Have to remove instead of delete for locations as $service is a list
     def DELETE(self, host, service, location, *args, **kwargs):
         super(ConsumedService, self).DELETE(host, service, location,
                                             *args, **kwargs)
 
-        if location in self.santiago.consuming[host][service]:
-            self.santiago.consuming[host][service].remove(location)
+        self.santiago.delete_consuming_location(host, service, [location])
 
 
 if __name__ == "__main__":
@@ -19,6 +19,8 @@ import utilities
 import webbrowser
 
 import santiago
+from scheduler import Quota
+from tracing import trace
 
 def parse_args(args):
     """Interpret args passed in on the command line."""
@@ -49,6 +51,12 @@ without overwriting your existing data.""")
     parser.add_option("-t", "--trace", dest="trace", action="store_true",
                       help="Drop into the debugger when starting FreedomBuddy.")
 
+    parser.add_option("-j", "--journal", dest="persistence",
+                      action="store_const", const="journal",
+                      default="snapshot", help="""\
+Save each change to an encrypted journal as soon as it's made, instead of
+saving all service data only when exiting.""")
+
     return parser.parse_args(args)
 
 def load_config(options):
@@ -80,6 +88,34 @@ def load_config(options):
 
     return mykey, lang, protocols, connectors
 
+def load_scheduling(options):
+    """Load each friend's quota from the configuration file.
+
+    Returns the Santiago's scheduling arguments.  Friends' own quotas are in
+    the ``quotas`` section, by key ID or fingerprint, as "requests, bytes,
+    weight".  Values they leave out come from the ``scheduler`` section.
+
+    """
+    config = utilities.load_config(options.config)
+    settings = dict(safe_load(config, "scheduler", None, {}))
+    scheduling = dict()
+
+    for key, convert in (("quota_period", float), ("quota_requests", int),
+                         ("quota_bytes", int), ("quota_depth", int)):
+        if key in settings:
+            scheduling[key] = convert(settings[key])
+
+    default = Quota(scheduling.get("quota_requests", Quota().requests),
+                    scheduling.get("quota_bytes", Quota().bytes))
+
+    # every section includes the config's defaults, which aren't quotas.
+    scheduling["quotas"] = dict(
+        (key, Quota.parse(quota, default))
+        for key, quota in safe_load(config, "quotas", None, {})
+        if key not in config.defaults())
+
+    return scheduling
+
 def configure_connectors(protocols, connectors):
 
     listeners, senders, monitors = {}, {}, {}
@@ -125,6 +161,7 @@ if __name__ == "__main__":
 
     # create listeners and senders
     listeners, senders, monitors = configure_connectors(protocols, connectors)
+    scheduling = load_scheduling(options)
 
     # services to host and consume
     url = "https://localhost:8080"
@@ -140,14 +177,18 @@ if __name__ == "__main__":
 
         freedombuddy = santiago.Santiago(listeners, senders, hosting, consuming,
                                          me=mykey, monitors=monitors,
-                                         locale=lang, save_dir="../data")
+                                         locale=lang, save_dir="../data",
+                                         persistence=options.persistence,
+                                         **scheduling)
     else:
         freedombuddy = santiago.Santiago(listeners, senders, me=mykey,
                                          monitors=monitors, locale=lang,
-                                         save_dir="../data")
+                                         save_dir="../data",
+                                         persistence=options.persistence,
+                                         **scheduling)
 
     # run
     with freedombuddy:
         webbrowser.open_new_tab(url + "/freedombuddy")
 
-    santiago.debug_log("Santiago finished!")
+    trace("santiago.finished")
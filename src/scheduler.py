@@ -0,0 +1,341 @@
+"""Shares request handling fairly between friends.
+
+Every friend may have requests handled up to a quota: a number of requests and
+bytes per period.  Requests past the quota wait for the next period, instead of
+being handled or dropped::
+
+    >>> friends = FairScheduler(handle, Quota(requests=2), period=60)
+    >>> for request in (a, b, c):
+    ...     friends.submit("0123456789ABCDEF", request, len(request))
+    >>> friends.drain()        # handles a and b, c waits for the next minute.
+    2
+
+Waiting requests are handled in weighted-fair order (self-clocked fair
+queueing): each request is tagged with the virtual time its friend would
+finish it at, given its share, and the earliest tag goes first.  One chatty
+friend's backlog can't hold up anyone else's requests, it can only wait behind
+them.
+
+"""
+
+from collections import deque
+import logging
+import threading
+import time
+
+
+class Quota(object):
+    """What a friend may send each period, and its share of the handling."""
+
+    def __init__(self, requests=60, bytes=1024 * 1024, weight=1):
+        """Prepare the quota.
+
+        :requests: the most requests handled per period.
+
+        :bytes: the most bytes handled per period.
+
+        :weight: the friend's share of handling, relative to other friends',
+          when requests are waiting.
+
+        """
+        self.requests = int(requests)
+        self.bytes = int(bytes)
+        self.weight = max(float(weight), 1e-6)
+
+    def __repr__(self):
+        return "Quota(requests={0}, bytes={1}, weight={2})".format(
+            self.requests, self.bytes, self.weight)
+
+    @classmethod
+    def parse(cls, text, default=None):
+        """Read a quota from a setting: "requests, bytes, weight".
+
+        Values left out, or left blank, come from the default quota.  Raises a
+        ValueError if a value isn't a number.
+
+        """
+        default = default or cls()
+        values = [value.strip() for value in text.split(",")]
+        values += [""] * (3 - len(values))
+
+        if len(values) > 3:
+            raise ValueError("Too many values in quota: {0}".format(text))
+
+        requests, bytes, weight = values
+
+        return cls(int(requests) if requests else default.requests,
+                   int(bytes) if bytes else default.bytes,
+                   float(weight) if weight else default.weight)
+
+class Friend(object):
+    """A friend's waiting requests and what they've used this period."""
+
+    def __init__(self, quota):
+        self.quota = quota
+        self.waiting = deque()
+        self.finish = 0.0
+        self.requests = 0
+        self.bytes = 0
+        # how many of the waiting requests were counted as deferred.
+        self.deferred = 0
+
+    def allows(self, size):
+        """Whether the quota has room for another request of this size.
+
+        A request larger than the whole byte quota is still handled once per
+        period, on its own, so it's delayed instead of stuck forever.
+
+        """
+        if self.requests >= self.quota.requests:
+            return False
+
+        return (self.bytes + size <= self.quota.bytes or
+                (self.bytes == 0 and self.quota.bytes > 0))
+
+class FairScheduler(object):
+    """Per-friend quotas, with the excess handled in later periods."""
+
+    def __init__(self, handler, default=None, quotas=None, period=60,
+                 depth=64, clock=time.time, timer=threading.Timer):
+        """Prepare the scheduler.
+
+        :handler: called with each request, in the thread that drains it.
+
+        :default: the ``Quota`` for friends without their own.
+
+        :quotas: a dictionary of friends' ``Quota``s, by key ID or fingerprint.
+
+        :period: the seconds each quota is for.
+
+        :depth: the most requests that may wait for each friend.  Newer ones are
+          dropped.
+
+        :clock: returns the current time, in seconds.
+
+        :timer: makes the ``threading.Timer`` that drains waiting requests at
+          the start of the next period.
+
+        """
+        self.handler = handler
+        self.default = default or Quota()
+        self.quotas = dict()
+        self.period = max(float(period), 1e-3)
+        self.depth = max(1, int(depth))
+        self.clock = clock
+        self.timer = timer
+
+        self.friends = dict()
+        self.window = None
+        self.virtual = 0.0
+        self.sequence = 0
+        self.waiting = None
+        self.lock = threading.Lock()
+
+        self.counters = { "submitted": 0, "handled": 0, "deferred": 0,
+                          "dropped": 0, "failed": 0 }
+
+        for key, quota in (quotas or {}).iteritems():
+            self.set_quota(key, quota)
+
+    def set_quota(self, key, quota):
+        """Give the friend its own quota, or the default one if it's None."""
+
+        key = str(key).upper()
+
+        with self.lock:
+            if quota is None:
+                self.quotas.pop(key, None)
+            else:
+                self.quotas[key] = quota
+
+            for fingerprint, friend in self.friends.iteritems():
+                friend.quota = self.quota(fingerprint)
+
+    def quota(self, key):
+        """The friend's quota.  Key IDs match the ends of fingerprints."""
+
+        key = str(key).upper()
+
+        try:
+            return self.quotas[key]
+        except KeyError:
+            pass
+
+        for known, quota in self.quotas.iteritems():
+            if key.endswith(known):
+                return quota
+
+        return self.default
+
+    def submit(self, key, request, size=0):
+        """Queue the friend's request.
+
+        Returns False if it was dropped because too many are waiting.
+
+        """
+        with self.lock:
+            self.counters["submitted"] += 1
+
+            try:
+                friend = self.friends[key]
+            except KeyError:
+                friend = self.friends[key] = Friend(self.quota(key))
+
+            if len(friend.waiting) >= self.depth:
+                self.counters["dropped"] += 1
+                return False
+
+            # the request finishes after its friend's previous one, or now.
+            # ties go to the request submitted first.
+            start = max(self.virtual, friend.finish)
+            friend.finish = start + max(size, 1) / friend.quota.weight
+            self.sequence += 1
+            friend.waiting.append(((friend.finish, self.sequence), size,
+                                   request))
+
+        return True
+
+    def drain(self):
+        """Handle waiting requests, in fair order, until the quotas run out.
+
+        Returns the number handled.  If requests are still waiting, they're
+        drained again when the next period starts.
+
+        """
+        handled = 0
+
+        while True:
+            with self.lock:
+                request = self._next()
+
+            if request is None:
+                break
+
+            try:
+                self.handler(request)
+            except Exception as e:
+                logging.exception(e)
+                outcome = "failed"
+            else:
+                outcome = "handled"
+
+            with self.lock:
+                self.counters[outcome] += 1
+
+            handled += 1
+
+        with self.lock:
+            self._wait()
+
+        return handled
+
+    def _next(self):
+        """Take the waiting request with the earliest tag its quota allows.
+
+        Friends without waiting requests are forgotten at the end of a period.
+
+        """
+        self._roll()
+
+        best = None
+
+        for friend in self.friends.itervalues():
+            if not friend.waiting:
+                continue
+
+            tag, size, request = friend.waiting[0]
+
+            if not friend.allows(size):
+                continue
+
+            if best is None or tag < best.waiting[0][0]:
+                best = friend
+
+        if best is None:
+            return
+
+        (finish, order), size, request = best.waiting.popleft()
+        best.deferred = max(0, best.deferred - 1)
+        best.requests += 1
+        best.bytes += size
+        self.virtual = finish
+
+        return request
+
+    def _roll(self):
+        """Start a new period, if it's time, resetting what friends used."""
+
+        window = int(self.clock() // self.period)
+
+        if window == self.window:
+            return
+
+        self.window = window
+
+        for key, friend in self.friends.items():
+            if friend.waiting:
+                friend.requests = friend.bytes = 0
+            else:
+                del self.friends[key]
+
+        if not self.friends:
+            self.virtual = 0.0
+
+    def _wait(self):
+        """Drain again at the next period, if requests are waiting for it.
+
+        Each request is counted as deferred once, however many periods it
+        waits.
+
+        """
+        waiting = 0
+
+        for friend in self.friends.itervalues():
+            self.counters["deferred"] += len(friend.waiting) - friend.deferred
+            friend.deferred = len(friend.waiting)
+            waiting += len(friend.waiting)
+
+        if not waiting or self.waiting is not None:
+            return
+
+        delay = (self.window + 1) * self.period - self.clock()
+        self.waiting = self.timer(max(delay, 0), self._next_period)
+        self.waiting.daemon = True
+        self.waiting.start()
+
+    def _next_period(self):
+        with self.lock:
+            self.waiting = None
+
+        self.drain()
+
+    def stop(self):
+        """Stop waiting for the next period.  Waiting requests are dropped."""
+
+        with self.lock:
+            if self.waiting is not None:
+                self.waiting.cancel()
+                self.waiting = None
+
+            for friend in self.friends.itervalues():
+                self.counters["dropped"] += len(friend.waiting)
+
+            self.friends.clear()
+
+    def stats(self):
+        """Return the counters and each friend's queue and usage."""
+
+        with self.lock:
+            stats = dict(self.counters)
+            stats["waiting"] = sum(len(friend.waiting)
+                                   for friend in self.friends.itervalues())
+            stats["friends"] = dict(
+                (key, { "waiting": len(friend.waiting),
+                        "requests": friend.requests,
+                        "bytes": friend.bytes,
+                        "quota": { "requests": friend.quota.requests,
+                                   "bytes": friend.quota.bytes,
+                                   "weight": friend.quota.weight } })
+                for key, friend in self.friends.iteritems())
+
+        return stats
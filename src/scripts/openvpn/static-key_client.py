@@ -31,7 +31,7 @@ try:
 except ImportError:
     pass
 
-import scripts.freedombuddy as freedombuddy
+import connectors.cli.controller as freedombuddy
 
 
 client_conf = """\
@@ -61,6 +61,10 @@ Doesn't necessarily have to be local, just has to be reachable and trusted.
 """)
     parser.add_option("-p", "--port", dest="port", default=8080,
                       help="Localhost's FreedomBuddy port.")
+    parser.add_option("-t", "--timeout", dest="timeout", default=30,
+                      help="""\
+Maximum time, in seconds, to wait for the host to reply to each request.
+""")
 
     (options, args) = parser.parse_args(args)
     if not options.key:
@@ -110,7 +114,8 @@ if __name__ == "__main__":
     request = lambda service: extract(
         freedombuddy.query_remotely(options.address, options.port,
                                     options.key, service,
-                                    params={"encoding": "json"}))
+                                    params={"encoding": "json"},
+                                    timeout=options.timeout))
 
     newHostIp = request("openvpn-host")
     newClientIp = request("openvpn-client")
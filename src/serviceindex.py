@@ -0,0 +1,102 @@
+"""Reverse indexes over Santiago's hosting and consuming data.
+
+``hosting`` and ``consuming`` are keyed by the other party, which makes "who do
+I host this service for?" a scan of every client.  The ``ServiceIndex`` keeps
+the inverse mappings up to date as the data changes:
+
+- service -> the clients I host it for.
+- service -> the hosts that serve it to me.
+- location -> the (client, service) pairs I host there.
+
+Santiago's create and delete methods keep the index current.  Anything that
+changes ``hosting`` or ``consuming`` directly must call ``rebuild`` afterward.
+
+"""
+
+
+class ServiceIndex(object):
+    """Secondary indexes for hosting and consuming data."""
+
+    def __init__(self, hosting=None, consuming=None):
+        self.clients = dict()
+        self.hosts = dict()
+        self.locations = dict()
+
+        self.rebuild(hosting or {}, consuming or {})
+
+    def rebuild(self, hosting, consuming):
+        """Index the data from scratch."""
+
+        self.clients = dict()
+        self.hosts = dict()
+        self.locations = dict()
+
+        for client, services in hosting.iteritems():
+            for service, locations in services.iteritems():
+                self.add_hosting(client, service, locations)
+
+        for host, services in consuming.iteritems():
+            for service in services:
+                self.add_consuming(host, service)
+
+    def add_hosting(self, client, service, locations=()):
+        """Index that I host the service for the client at the locations."""
+
+        self.clients.setdefault(service, set()).add(client)
+
+        for location in locations:
+            self.locations.setdefault(location, set()).add((client, service))
+
+    def remove_hosting(self, client, service, locations=None):
+        """Remove the locations, or the whole service if locations is None."""
+
+        if locations is None:
+            ServiceIndex._discard(self.clients, service, client)
+            return
+
+        for location in locations:
+            ServiceIndex._discard(self.locations, location, (client, service))
+
+    def remove_hosting_client(self, client, services):
+        """Remove everything hosted for the client."""
+
+        for service, locations in services.iteritems():
+            self.remove_hosting(client, service, locations)
+            self.remove_hosting(client, service)
+
+    def add_consuming(self, host, service):
+        self.hosts.setdefault(service, set()).add(host)
+
+    def remove_consuming(self, host, service):
+        ServiceIndex._discard(self.hosts, service, host)
+
+    def remove_consuming_host(self, host, services):
+        for service in services:
+            self.remove_consuming(host, service)
+
+    def served_clients(self, service):
+        """The clients I host the service for."""
+
+        return list(self.clients.get(service, ()))
+
+    def serving_hosts(self, service):
+        """The hosts that serve the service to me."""
+
+        return list(self.hosts.get(service, ()))
+
+    def location_clients(self, location):
+        """The (client, service) pairs I host at the location."""
+
+        return list(self.locations.get(location, ()))
+
+    @classmethod
+    def _discard(cls, index, key, value):
+        """Remove the value from the key's set, and the key once it's empty."""
+
+        try:
+            index[key].discard(value)
+        except KeyError:
+            return
+
+        if not index[key]:
+            del index[key]
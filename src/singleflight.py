@@ -0,0 +1,125 @@
+"""Sends a query once, no matter how many callers ask for it at once.
+
+Scripts and monitor pages ask for the same (host, service) often, and each
+query costs an encryption and a send to every one of the host's locations.  A
+``SingleFlight`` lets only one caller send at a time: callers that ask while
+it's sending wait for it and share its result.  Callers that ask while the
+host's reply is still outstanding, or soon after the last query, don't send at
+all::
+
+    >>> queries = SingleFlight(min_interval=30)
+    >>> queries.call(("host", "service"), send)
+    {'https://host': None}
+    >>> queries.call(("host", "service"), send)  # sent too recently.
+    >>> queries.call(("host", "service"), send, force=True)
+    {'https://host': None}
+
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class Flight(object):
+    """A call in progress, that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+class SingleFlight(object):
+    """Coalesces concurrent and repeated calls with the same key."""
+
+    def __init__(self, min_interval=0, clock=time.time):
+        """Prepare the flights.
+
+        :min_interval: the fewest seconds between calls with the same key,
+          unless they're forced.
+
+        :clock: returns the current time, in seconds.
+
+        """
+        self.min_interval = float(min_interval)
+        self.clock = clock
+
+        self.flights = dict()
+        # when each key was last called, oldest first.
+        self.called = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.counters = { "called": 0, "joined": 0, "outstanding": 0,
+                          "throttled": 0 }
+
+    def call(self, key, function, force=False, outstanding=None):
+        """Call the function, unless it's already been called for the key.
+
+        :force: call the function even if it was called too recently, or its
+          result is still outstanding.  A call that's in progress is still
+          joined instead.
+
+        :outstanding: returns whether the last call's result is still
+          outstanding, in which case the function isn't called again.
+
+        Callers that join a call in progress get its result.  Callers that
+        don't call the function get None.
+
+        """
+        leader = False
+
+        with self.lock:
+            flight = self.flights.get(key)
+
+            if flight is not None:
+                self.counters["joined"] += 1
+            elif not force and outstanding is not None and outstanding():
+                self.counters["outstanding"] += 1
+                return
+            elif not force and self._too_soon(key):
+                self.counters["throttled"] += 1
+                return
+            else:
+                self.counters["called"] += 1
+                flight = self.flights[key] = Flight()
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            return flight.result
+
+        try:
+            flight.result = function()
+        finally:
+            with self.lock:
+                del self.flights[key]
+                self.called.pop(key, None)
+                self.called[key] = self.clock()
+
+            flight.done.set()
+
+        return flight.result
+
+    def _too_soon(self, key):
+        """Whether the key was called within the minimum interval.
+
+        Forgets the calls that are older than that.
+
+        """
+        horizon = self.clock() - self.min_interval
+
+        while self.called:
+            oldest, when = next(self.called.iteritems())
+
+            if when > horizon:
+                break
+
+            del self.called[oldest]
+
+        return key in self.called
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = len(self.flights)
+
+        return stats
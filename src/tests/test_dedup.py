@@ -0,0 +1,56 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for the duplicate-message filter."""
+
+import unittest
+
+from dedup import DuplicateFilter
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class DuplicateFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.duplicates = DuplicateFilter(window=60, size=3, clock=self.clock)
+
+    def test_duplicate(self):
+        self.assertFalse(self.duplicates.seen("a"))
+        self.assertTrue(self.duplicates.seen("a"))
+        self.assertFalse(self.duplicates.seen("b"))
+
+        self.assertEqual(self.duplicates.stats()["duplicates"], 1)
+
+    def test_window(self):
+        """Messages are forgotten once the window passes."""
+
+        self.duplicates.seen("a")
+        self.clock.now += 30
+        self.assertTrue(self.duplicates.seen("a"))
+
+        self.clock.now += 31
+        self.assertFalse(self.duplicates.seen("a"))
+        self.assertEqual(self.duplicates.stats()["expired"], 1)
+
+    def test_bounded(self):
+        """The oldest messages are forgotten early when there are too many."""
+
+        for message in "abcd":
+            self.duplicates.seen(message)
+
+        self.assertFalse(self.duplicates.seen("a"))
+        self.assertTrue(self.duplicates.seen("d"))
+
+        stats = self.duplicates.stats()
+        self.assertEqual((stats["size"], stats["evicted"]), (3, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for consumed services' expiry and refreshing."""
+
+import threading
+import unittest
+
+from expiry import ServiceExpiry
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class ServiceExpiryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.refreshed = list()
+        self.expiry = ServiceExpiry(
+            lambda host, service: self.refreshed.append((host, service)),
+            fraction=0.5, retry=30, clock=self.clock)
+
+    def test_fresh(self):
+        self.expiry.set("host", "wiki", 100)
+
+        self.assertTrue(self.expiry.fresh("host", "wiki"))
+        self.assertEqual(self.expiry.expires("host", "wiki"), 1100)
+
+        self.clock.now += 100
+
+        self.assertFalse(self.expiry.fresh("host", "wiki"))
+
+    def test_no_ttl(self):
+        """Services without a TTL are never fresh."""
+
+        self.assertFalse(self.expiry.fresh("host", "wiki"))
+        self.assertEqual(self.expiry.expires("host", "wiki"), None)
+
+    def test_refresh_due(self):
+        """Services are refreshed once the fraction of their TTL passes."""
+
+        self.expiry.set("host", "wiki", 100)
+        self.expiry.set("host", "blog", 300)
+
+        self.clock.now += 49
+        self.expiry.refresh_due()
+        self.assertEqual(self.refreshed, [])
+
+        self.clock.now += 1
+        self.expiry.refresh_due()
+        self.expiry.refresh_due()
+        self.assertEqual(self.refreshed, [("host", "wiki")])
+
+    def test_retried(self):
+        """Refreshes that aren't answered are tried again."""
+
+        self.expiry.set("host", "wiki", 100)
+        self.clock.now += 50
+        self.expiry.refresh_due()
+        self.clock.now += 30
+        self.expiry.refresh_due()
+
+        self.assertEqual(self.refreshed, [("host", "wiki")] * 2)
+
+        # answered, so it isn't due until half its new TTL passes.
+        self.expiry.set("host", "wiki", 100)
+        self.clock.now += 30
+        self.expiry.refresh_due()
+
+        self.assertEqual(len(self.refreshed), 2)
+
+    def test_given_up(self):
+        """Unanswered refreshes back off, then stop."""
+
+        expiry = ServiceExpiry(
+            lambda host, service: self.refreshed.append(self.clock.now),
+            fraction=0.5, retry=30, retries=2, clock=self.clock)
+        expiry.set("host", "wiki", 1000)
+
+        for i in range(100):
+            self.clock.now += 10
+            expiry.refresh_due()
+
+        self.assertEqual(self.refreshed, [1500, 1530, 1590])
+        self.assertEqual(expiry.stats()["abandoned"], 1)
+        self.assertEqual(expiry.expires("host", "wiki"), 2000)
+
+        # answered after all, so it's refreshed again.
+        expiry.set("host", "wiki", 100)
+        self.clock.now += 50
+        expiry.refresh_due()
+
+        self.assertEqual(len(self.refreshed), 4)
+
+    def test_expired_given_up(self):
+        """Services aren't retried once they've expired."""
+
+        self.expiry.set("host", "wiki", 100)
+
+        for i in range(100):
+            self.clock.now += 10
+            self.expiry.refresh_due()
+
+        self.assertEqual(self.refreshed, [("host", "wiki")] * 2)
+        self.assertEqual(self.expiry.stats()["abandoned"], 1)
+
+    def test_loaded(self):
+        """Saved expiry times are set again as they were."""
+
+        self.expiry.set("host", "wiki", 100)
+        records = self.expiry.records()
+
+        self.assertEqual(records, { ("host", "wiki"): { "expires": 1100,
+                                                        "ttl": 100 } })
+
+        loaded = ServiceExpiry(self.refreshed.append, fraction=0.5,
+                               clock=self.clock)
+        self.clock.now += 10
+        loaded.set("host", "wiki", **records[("host", "wiki")])
+
+        self.assertEqual(loaded.expires("host", "wiki"), 1100)
+        self.assertEqual(loaded.times[("host", "wiki")][0], 1050)
+
+    def test_renewed(self):
+        """Services set again are refreshed on their new schedule."""
+
+        self.expiry.set("host", "wiki", 100)
+        self.clock.now += 40
+        self.expiry.set("host", "wiki", 100)
+        self.clock.now += 20
+        self.expiry.refresh_due()
+
+        self.assertEqual(self.refreshed, [])
+
+    def test_forget(self):
+        self.expiry.set("host", "wiki", 100)
+        self.expiry.set("host", "blog", 100)
+        self.expiry.forget("host")
+        self.clock.now += 100
+        self.expiry.refresh_due()
+
+        self.assertEqual((self.refreshed, self.expiry.stats()["services"]),
+                         ([], 0))
+
+    def test_background(self):
+        """Started, services are refreshed in the background."""
+
+        refreshed = threading.Event()
+        expiry = ServiceExpiry(lambda host, service: refreshed.set(),
+                               fraction=0.1)
+        expiry.start()
+
+        try:
+            expiry.set("host", "wiki", 0.5)
+
+            self.assertTrue(refreshed.wait(5))
+        finally:
+            expiry.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
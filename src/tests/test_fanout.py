@@ -0,0 +1,59 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for concurrent, deadline-bounded request delivery."""
+
+import threading
+import time
+import unittest
+
+import fanout
+
+
+class FanOutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+
+    def tearDown(self):
+        # let any stuck senders finish.
+        self.release.set()
+
+    def send(self, destination):
+        """Succeed, fail, or hang, depending on the destination."""
+
+        if destination == "fail":
+            raise IOError("connection refused")
+        elif destination.startswith("hang"):
+            self.release.wait(5)
+
+    def test_all_sent(self):
+        self.assertEqual(fanout.fan_out(["a", "b"], self.send),
+                         { "a": fanout.SENT, "b": fanout.SENT })
+
+    def test_failures_reported(self):
+        self.assertEqual(fanout.fan_out(["a", "fail"], self.send),
+                         { "a": fanout.SENT, "fail": fanout.FAILED })
+
+    def test_send_deadline(self):
+        """A hung destination doesn't hold up the caller."""
+
+        start = time.time()
+        results = fanout.fan_out(["a", "hang"], self.send, send_deadline=0.1)
+
+        self.assertTrue(time.time() - start < 2)
+        self.assertEqual(results, { "a": fanout.SENT,
+                                    "hang": fanout.TIMED_OUT })
+
+    def test_overall_deadline(self):
+        """Destinations that never got a chance to start aren't sent."""
+
+        results = fanout.fan_out(["hang", "hang too"], self.send,
+                                 overall_deadline=0.1, max_concurrent=1)
+
+        self.assertEqual(sorted(results.values()),
+                         [fanout.NOT_SENT, fanout.TIMED_OUT])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for the shared GPG worker pool.
+
+These use a fake GPG object, so they don't need a keyring.
+
+"""
+
+import threading
+import unittest
+
+import gpgpool
+
+
+class FakeGpg(object):
+    """Records which thread handled each call."""
+
+    created = 0
+
+    def __init__(self, **kwargs):
+        FakeGpg.created += 1
+        self.kwargs = kwargs
+
+    def encrypt(self, data, *args, **kwargs):
+        return ("encrypted", data, threading.current_thread().name)
+
+    def decrypt(self, data, *args, **kwargs):
+        raise ValueError("undecryptable")
+
+class GpgPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        FakeGpg.created = 0
+        self.pool = gpgpool.GpgPool(2, gpg_factory=FakeGpg, use_agent=True)
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def test_jobs_run_on_workers(self):
+        """Operations are handled by the pool's threads, not the caller's."""
+
+        result = self.pool.encrypt("hi")
+
+        self.assertEqual(result[:2], ("encrypted", "hi"))
+        self.assertTrue(result[2].startswith("gpg-worker-"))
+
+    def test_workers_are_reused(self):
+        """Only one GPG instance is made per worker, no matter the load."""
+
+        jobs = [self.pool.submit("encrypt", str(i)) for i in range(20)]
+        [job.result() for job in jobs]
+
+        self.assertTrue(FakeGpg.created <= 2)
+
+    def test_pool_size_bounded(self):
+        self.pool.encrypt("hi")
+
+        self.assertEqual(self.pool.stats()["workers"], 2)
+
+    def test_errors_reraised(self):
+        """Errors in the worker come back to the caller."""
+
+        self.assertRaises(ValueError, self.pool.decrypt, "hi")
+
+    def test_unknown_operations_refused(self):
+        self.assertRaises(ValueError, self.pool.submit, "gen_key")
+
+    def test_latency_recorded(self):
+        self.pool.encrypt("hi")
+        self.pool.encrypt("there")
+
+        stats = self.pool.stats()["operations"]["encrypt"]
+
+        self.assertEqual(stats["count"], 2)
+        self.assertTrue(stats["max"] >= stats["mean"] >= 0)
+
+class SharedPoolTest(unittest.TestCase):
+
+    def test_same_settings_share_pool(self):
+        self.assertTrue(gpgpool.get_pool(use_agent=True) is
+                        gpgpool.get_pool(use_agent=True))
+
+    def test_different_settings_dont_share(self):
+        self.assertFalse(gpgpool.get_pool(use_agent=True) is
+                         gpgpool.get_pool(use_agent=False))
+
+
+if __name__ == "__main__":
+    unittest.main()
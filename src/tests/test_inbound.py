@@ -0,0 +1,84 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for the inbound request queue."""
+
+import threading
+import unittest
+
+import inbound
+
+
+class InboundQueueTest(unittest.TestCase):
+    """Tests the queue's dropping policies without starting its workers."""
+
+    def setUp(self):
+        self.handled = list()
+
+    def create_queue(self, policy):
+        return inbound.InboundQueue(self.handled.append, depth=2, workers=1,
+                                    policy=policy)
+
+    def test_drop_oldest(self):
+        queue = self.create_queue(inbound.InboundQueue.DROP_OLDEST)
+
+        for item in (1, 2, 3):
+            queue.put(item)
+
+        self.assertEqual(list(queue.items), [2, 3])
+        self.assertEqual(queue.stats()["dropped_oldest"], 1)
+
+    def test_drop_newest(self):
+        queue = self.create_queue(inbound.InboundQueue.DROP_NEWEST)
+
+        results = [queue.put(item) for item in (1, 2, 3)]
+
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(list(queue.items), [1, 2])
+        self.assertEqual(queue.stats()["dropped_newest"], 1)
+
+    def test_dropped_callback(self):
+        """Whoever's interested hears about every item that won't be handled."""
+
+        dropped = list()
+        queue = inbound.InboundQueue(self.handled.append, depth=2, workers=1,
+                                     dropped=dropped.append)
+
+        for item in (1, 2, 3):
+            queue.put(item)
+        queue.stop()
+
+        self.assertEqual(dropped, [1, 2, 3])
+
+    def test_depth_counters(self):
+        queue = self.create_queue(inbound.InboundQueue.DROP_OLDEST)
+
+        queue.put(1)
+        queue.put(2)
+
+        stats = queue.stats()
+        self.assertEqual(stats["depth"], 2)
+        self.assertEqual(stats["max_depth"], 2)
+        self.assertEqual(stats["enqueued"], 2)
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, inbound.InboundQueue, None,
+                          policy="drop-everything")
+
+    def test_workers_drain_queue(self):
+        """Started workers pass each item to the handler."""
+
+        done = threading.Event()
+        queue = inbound.InboundQueue(lambda item: done.set())
+
+        queue.start()
+        queue.put(1)
+
+        done.wait(5)
+
+        self.assertTrue(done.is_set())
+        queue.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for the encrypted service journal.
+
+These use a fake GPG that only armors data, so they don't need a keyring.
+
+"""
+
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+
+import journal
+
+
+class FakeResult(str):
+    valid = True
+    fingerprint = "fake"
+
+class FakeGpg(object):
+    """Armors and unarmors data, like an unkeyed gpg might."""
+
+    def __init__(self):
+        self.encryptions = 0
+
+    def encrypt(self, data, recipients=None, sign=None):
+        self.encryptions += 1
+
+        return "".join(("-----BEGIN PGP MESSAGE-----\n", "\n",
+                        base64.b64encode(data), "\n",
+                        "-----END PGP MESSAGE-----\n"))
+
+    def decrypt(self, data, **kwargs):
+        return FakeResult(base64.b64decode(data.splitlines()[2]))
+
+    def verify(self, data, **kwargs):
+        raise NotImplementedError("Journals are only encrypted.")
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "test.journal")
+        self.gpg = FakeGpg()
+        self.snapshots = 0
+        self.journal = self.create_journal()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_journal(self, **kwargs):
+        return journal.Journal(self.path, self.gpg, "me",
+                               compact=self.snapshot, **kwargs)
+
+    def snapshot(self):
+        self.snapshots += 1
+
+    def test_replay(self):
+        """Committed records are replayed in order."""
+
+        self.journal.append("create_hosting_client", "a")
+        self.journal.append("create_hosting_service", "a", "b")
+        self.journal.commit()
+
+        self.assertEqual(list(self.create_journal().replay()),
+                         [("create_hosting_client", ["a"]),
+                          ("create_hosting_service", ["a", "b"])])
+
+    def test_group_commit(self):
+        """Records waiting together are encrypted together."""
+
+        for i in range(10):
+            self.journal.append("create_hosting_client", i)
+        self.journal.commit()
+
+        self.assertEqual(self.gpg.encryptions, 1)
+        self.assertEqual(self.journal.committed, 10)
+
+    def test_separate_commits_replayed(self):
+        self.journal.append("create_hosting_client", "a")
+        self.journal.commit()
+        self.journal.append("create_hosting_client", "b")
+        self.journal.commit()
+
+        self.assertEqual(len(list(self.create_journal().replay())), 2)
+
+    def test_torn_blocks_skipped(self):
+        """A block that was never finished isn't replayed."""
+
+        self.journal.append("create_hosting_client", "a")
+        self.journal.commit()
+
+        with open(self.path, "a") as torn:
+            torn.write("-----BEGIN PGP MESSAGE-----\n\nabc")
+
+        self.assertEqual(len(list(self.create_journal().replay())), 1)
+
+    def test_compaction(self):
+        """Compaction snapshots the data and empties the journal."""
+
+        self.journal.append("create_hosting_client", "a")
+        self.journal.compact()
+
+        self.assertEqual(self.snapshots, 1)
+        self.assertEqual(list(self.create_journal().replay()), [])
+
+    def test_stop_commits(self):
+        self.journal.start()
+        self.journal.append("create_hosting_client", "a")
+        self.journal.stop()
+
+        self.assertEqual(len(list(self.create_journal().replay())), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
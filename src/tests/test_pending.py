@@ -0,0 +1,84 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for the pending-request table."""
+
+import unittest
+
+from pending import PendingRequests
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class PendingRequestsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.requests = PendingRequests(ttl=300, size=3, clock=self.clock)
+
+    def test_pending(self):
+        self.requests.add("host", "a")
+        self.requests.add("host", "b")
+
+        self.assertTrue(self.requests.pending("host", "a"))
+        self.assertEqual(self.requests["host"], frozenset(("a", "b")))
+
+    def test_answered(self):
+        self.requests.add("host", "a")
+
+        self.assertTrue(self.requests.discard("host", "a"))
+        self.assertFalse(self.requests.discard("host", "a"))
+        self.assertNotIn("host", self.requests)
+
+    def test_unknown_host(self):
+        """Looking up a host we aren't waiting on doesn't add it."""
+
+        self.assertRaises(KeyError, lambda: self.requests["nobody"])
+        self.assertEqual(len(self.requests), 0)
+
+    def test_expired(self):
+        self.requests.add("host", "a")
+        self.clock.now += 200
+        self.requests.add("host", "b")
+        self.clock.now += 100
+
+        self.assertEqual(self.requests.outstanding(), { "host": { "b": 200 }})
+        self.assertEqual(self.requests.stats()["expired"], 1)
+
+    def test_renewed(self):
+        """Asking again waits longer."""
+
+        self.requests.add("host", "a")
+        self.clock.now += 200
+        self.requests.add("host", "a")
+        self.clock.now += 200
+
+        self.assertTrue(self.requests.pending("host", "a"))
+
+    def test_bounded(self):
+        """The requests that would expire soonest are forgotten early."""
+
+        for service in "abcd":
+            self.requests.add("host", service)
+            self.clock.now += 1
+
+        self.assertEqual(self.requests["host"], frozenset("bcd"))
+        self.assertEqual(self.requests.stats()["evicted"], 1)
+
+    def test_stale_entries(self):
+        """Re-adding the same request doesn't grow the heap without limit."""
+
+        for i in range(100):
+            self.requests.add("host", "a")
+
+        self.assertTrue(len(self.requests.heap) <= 18)
+        self.assertEqual(len(self.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for the OpenPGP packet pre-parser.
+
+The messages are built by hand, so no keys are needed.
+
+"""
+
+import base64
+import binascii
+import unittest
+
+import pgppackets
+from pgppackets import RecipientFilter
+
+
+MINE, OTHER = "E7C359ABC86FFEEE", "E95588092AB4EC4D"
+
+def packet(tag, body):
+    """A new-format packet."""
+
+    return chr(0xc0 | tag) + chr(len(body)) + body
+
+def session_key(key_id):
+    return packet(pgppackets.PKESK,
+                  chr(3) + binascii.unhexlify(key_id) + chr(1) + "x" * 16)
+
+def armor(data):
+    return "\n".join((pgppackets.ARMOR_HEAD, "Version: GnuPG v1", "",
+                      base64.encodestring(data).strip(), "=abcd",
+                      pgppackets.ARMOR_END, ""))
+
+def message(*key_ids):
+    data = "".join(session_key(key_id) for key_id in key_ids)
+
+    return armor(data + packet(18, chr(1) + "ciphertext"))
+
+class RecipientsTest(unittest.TestCase):
+
+    def test_recipients(self):
+        self.assertEqual(pgppackets.recipients(message(MINE, OTHER)),
+                         [MINE, OTHER])
+
+    def test_old_format(self):
+        """Old-format packet headers are read too."""
+
+        body = session_key(MINE)[2:]
+        data = chr(0x80 | pgppackets.PKESK << 2) + chr(len(body)) + body
+
+        self.assertEqual(
+            pgppackets.recipients(armor(data + packet(18, "ciphertext"))),
+            [MINE])
+
+    def test_not_armored(self):
+        self.assertRaises(pgppackets.PacketError, pgppackets.recipients,
+                          "hi there")
+
+    def test_truncated(self):
+        data = session_key(MINE)[:-4]
+
+        self.assertRaises(pgppackets.PacketError, pgppackets.recipients,
+                          armor(data))
+
+    def test_not_encrypted(self):
+        """Signed messages have no recipients."""
+
+        self.assertRaises(pgppackets.PacketError, pgppackets.recipients,
+                          armor(packet(4, "one-pass signature")))
+
+class RecipientFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.recipients = RecipientFilter(["042E8793145A7E42", MINE.lower()])
+
+    def test_mine(self):
+        self.assertTrue(self.recipients.accepts(message(OTHER, MINE)))
+
+    def test_not_mine(self):
+        self.assertFalse(self.recipients.accepts(message(OTHER)))
+        self.assertEqual(self.recipients.stats()["not_for_me"], 1)
+
+    def test_hidden_recipient(self):
+        """Messages to hidden recipients might be for me."""
+
+        self.assertTrue(self.recipients.accepts(message(pgppackets.WILDCARD)))
+
+    def test_malformed(self):
+        self.assertFalse(self.recipients.accepts("junk"))
+        self.assertEqual(self.recipients.stats(),
+                         { "malformed": 1, "not_for_me": 0, "accepted": 0 })
+
+    def test_unknown_keys(self):
+        """Without my keys, only malformed messages are dropped."""
+
+        recipients = RecipientFilter()
+
+        self.assertTrue(recipients.accepts(message(OTHER)))
+        self.assertFalse(recipients.accepts("junk"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,10 +8,16 @@ isn't verifiable.
 
 """
 
+import base64
 import gnupg
+import os
 import pgpprocessor
+import shutil
+import StringIO
+import tempfile
 import unittest
 import utilities
+import verifycache
 
 def remove_line(string, line, preserve_newlines = True):
     """Remove a line from a multi-line string."""
@@ -109,6 +115,167 @@ class UnwrapperTest(MessageWrapper):
 
         self.assertRaises(StopIteration, self.unwrapper.next)
 
+class StreamUnwrapperTest(MessageWrapper):
+    """The StreamUnwrapper unwraps the same messages, from streams."""
+
+    def setUp(self):
+        super(StreamUnwrapperTest, self).setUp()
+
+        self.unwrapper = pgpprocessor.StreamUnwrapper(
+            StringIO.StringIO(self.messages[-1]), self.gpg)
+
+    def test_unwrap_all_messages(self):
+        self.assertEqual(self.iterations, sum([1 for e in self.unwrapper]))
+
+    def test_iterator_unwraps_correctly(self):
+        for message in reversed(self.messages[:-1]):
+            self.unwrapper.next()
+            self.assertEqual(message.strip(),
+                             "".join(self.unwrapper.lines()).strip())
+
+            # reading the lines consumed the layer, so start again from it.
+            self.unwrapper.source = StringIO.StringIO(message)
+
+class Verified(object):
+    def __init__(self, valid=True):
+        self.valid = valid
+
+class FakeGpg(object):
+    """Checks and decrypts messages, without keys.
+
+    Signatures are valid unless they're "bad".  Encrypted messages' bodies are
+    just their plaintext, in base64.
+
+    """
+    def verify(self, data, **kwargs):
+        return Verified("bad" not in data)
+
+    decrypt = verify
+
+    def verify_file(self, armor, **kwargs):
+        return self.verify(armor.read())
+
+    def decrypt_file(self, armor, output=None, **kwargs):
+        lines = armor.read().splitlines(True)
+        decrypted = Verified()
+        decrypted.data = base64.b64decode("".join(lines[2:-1]))
+
+        if output is not None:
+            with open(output, "w") as plaintext:
+                plaintext.write(decrypted.data)
+
+        return decrypted
+
+def sign(message, signature="good"):
+    escaped = "".join(("- " + line if line.startswith("-") else line)
+                      for line in message.splitlines(True))
+
+    return "".join((pgpprocessor.Unwrapper.SIG_HEAD, "Hash: SHA1\n\n",
+                    escaped, "\n", pgpprocessor.Unwrapper.SIG_FOOTER,
+                    signature, "\n", pgpprocessor.Unwrapper.SIG_END))
+
+def encrypt(message):
+    return "".join((pgpprocessor.Unwrapper.CRYPT_HEAD, "\n",
+                    base64.encodestring(message),
+                    pgpprocessor.Unwrapper.CRYPT_END))
+
+def chunks(message, size=7):
+    return [message[i:i + size] for i in range(0, len(message), size)]
+
+class StreamedLayersTest(unittest.TestCase):
+    """Unwrap streams without gpg, so the parts are easy to check."""
+
+    def setUp(self):
+        self.message = "hi\n-----BEGIN PGP SIGNATURE-----\nthere\n"
+
+    def unwrap(self, source, directory=None):
+        unwrapper = pgpprocessor.StreamUnwrapper(source, FakeGpg(),
+                                                 directory=directory)
+        layers = sum([1 for layer in unwrapper])
+
+        return layers, "".join(unwrapper.lines())
+
+    def test_signed_layers(self):
+        """Armor lines in the message are escaped and unescaped correctly."""
+
+        layers, message = self.unwrap(chunks(sign(sign(self.message))))
+
+        self.assertEqual((layers, message.strip()), (2, self.message.strip()))
+
+    def test_encrypted_layers(self):
+        layers, message = self.unwrap(
+            StringIO.StringIO(encrypt(sign(self.message))))
+
+        self.assertEqual((layers, message.strip()), (2, self.message.strip()))
+
+    def test_private_directory(self):
+        """Layers spill into the directory, and are removed from it."""
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        layers, message = self.unwrap(
+            StringIO.StringIO(encrypt(sign(self.message))), directory)
+
+        self.assertEqual((layers, message.strip()), (2, self.message.strip()))
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_public_directory(self):
+        """Decrypted data isn't written where anyone could read it."""
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        os.chmod(directory, 0755)
+
+        self.assertRaises(ValueError, pgpprocessor.StreamUnwrapper,
+                          [self.message], FakeGpg(), directory=directory)
+
+    def test_like_unwrapper(self):
+        message = "junk\n" + sign("  " + sign(self.message)) + "trailer\n"
+        unwrapper = pgpprocessor.Unwrapper(message, FakeGpg())
+        [layer for layer in unwrapper]
+
+        self.assertEqual(self.unwrap(chunks(message)),
+                         (2, unwrapper.message))
+
+    def test_no_pgp_data(self):
+        """Unwrapping stops, but the message is still there."""
+
+        self.assertEqual(self.unwrap(chunks(self.message)), (0, self.message))
+
+    def test_incomplete(self):
+        message = sign(self.message)
+        message = message[:message.index("-----BEGIN PGP SIGNATURE")]
+
+        self.assertEqual(self.unwrap(chunks(message)), (0, message))
+
+    def test_invalid_signature(self):
+        unwrapper = pgpprocessor.StreamUnwrapper(
+            [sign(self.message, "bad")], FakeGpg())
+
+        self.assertRaises(utilities.InvalidSignatureError, unwrapper.next)
+
+    def test_cached_signatures(self):
+        """Both unwrappers share cached signatures."""
+
+        cache = verifycache.VerificationCache()
+        message = sign(self.message)
+        gpg = FakeGpg()
+        gpg.verify_file = lambda armor: self.fail("verified twice")
+
+        [layer for layer in pgpprocessor.Unwrapper(message, FakeGpg(),
+                                                   cache=cache)]
+        [layer for layer in pgpprocessor.StreamUnwrapper([message], gpg,
+                                                         cache=cache)]
+
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_split(self):
+        self.assertEqual(
+            list(pgpprocessor.StreamUnwrapper.split(["\n  a", "b\nc", "\n\nd"],
+                                                    True)),
+            ["ab\n", "c\n", "\n", "d"])
+
 
 if __name__ == "__main__":
     unittest.main()
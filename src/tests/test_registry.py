@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for the registry serialization format."""
+
+import unittest
+
+import registry
+
+
+class RegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tree = { "a": { "freedombuddy": ["https://1", "https://2"],
+                             "empty": [] },
+                      "b": {},
+                      3: { 4: [5] } }
+
+    def test_round_trip(self):
+        self.assertEqual(registry.loads(registry.dumps(self.tree)), self.tree)
+
+    def test_types_kept(self):
+        """Numeric keys stay numeric."""
+
+        self.assertIn(3, registry.loads(registry.dumps(self.tree)))
+
+    def test_location_order_kept(self):
+        loaded = registry.loads(registry.dumps(self.tree))
+
+        self.assertEqual(loaded["a"]["freedombuddy"], ["https://1", "https://2"])
+
+    def test_streamed_lines(self):
+        """Registries can be loaded from any iterable of lines."""
+
+        lines = list(registry.iterdump(self.tree))
+
+        self.assertEqual(registry.load(iter(lines)), self.tree)
+        self.assertEqual(len(lines), 5)
+
+    def test_extras(self):
+        """Services' extras are kept, and ignored by readers that don't ask."""
+
+        extras = { ("a", "freedombuddy"): { "expires": 1100 } }
+        dumped = registry.dumps(self.tree, extras)
+        loaded = dict()
+
+        self.assertEqual(registry.load(dumped.splitlines(), loaded), self.tree)
+        self.assertEqual(loaded, extras)
+        self.assertEqual(registry.loads(dumped), self.tree)
+
+    def test_reader(self):
+        """The reader gives the same registry, however it's read."""
+
+        reader = registry.Reader(self.tree)
+        chunks = iter(lambda: reader.read(7), "")
+
+        self.assertEqual("".join(chunks), registry.dumps(self.tree))
+        self.assertEqual(registry.Reader(self.tree).read(),
+                         registry.dumps(self.tree))
+
+    def test_is_registry(self):
+        self.assertTrue(registry.is_registry(registry.dumps(self.tree)))
+        self.assertFalse(registry.is_registry(str(self.tree)))
+        self.assertFalse(registry.is_registry(""))
+
+    def test_not_registry(self):
+        self.assertRaises(registry.RegistryError, registry.loads,
+                          str(self.tree))
+
+    def test_unknown_version(self):
+        data = '{"format": "freedombuddy-registry", "version": 9000}\n'
+
+        self.assertRaises(registry.RegistryError, registry.loads, data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,7 +4,11 @@
 """These tests are designed to test the main Santiago class."""
 
 import os
+import shutil
 import sys
+import tempfile
+import threading
+import time
 import unittest
 
 import cherrypy
@@ -14,6 +18,7 @@ import logging
 from optparse import OptionParser
 import santiago, santiago_test
 import utilities
+import versions
 
 
 cherrypy.log.access_file = None
@@ -238,6 +243,33 @@ class UnpackRequest(SantiagoTest):
 
         self.assertFalse(self.santiago.unpack_request(self.request))
 
+    def test_batch_request(self):
+        """Version 2 requests may ask for a list of services."""
+
+        self.request.update({ "service": ["a", "b"], "locations": {},
+                              "known": { "a": "0123456789abcdef" },
+                              "request_version": 2, "reply_versions": [1, 2] })
+
+        adict = self.validate_request(dict(self.request))
+
+        self.assertEqual(
+            self.santiago.unpack_request(self.wrap_message(self.request)),
+            adict)
+
+    def test_batch_locations(self):
+        """Version 2 locations must be a dictionary of lists."""
+
+        self.request.update({ "service": "*", "request_version": 2 })
+
+        for locations, valid in (({ "a": [1] }, True), ([1], False),
+                                 ({ "a": 1 }, False)):
+            self.request["locations"] = locations
+
+            unpacked = self.santiago.unpack_request(
+                self.wrap_message(self.request))
+
+            self.assertEqual(bool(unpacked), valid)
+
 class HandleRequest(SantiagoTest):
     """Process an incoming request, from a client, for to host services.
 
@@ -270,7 +302,7 @@ class HandleRequest(SantiagoTest):
         self.to = self.keyid
         self.host = self.keyid
         self.client = self.keyid
-        self.service = santiago.Santiago.SERVICE_NAME
+        self.service = self.service_name = santiago.Santiago.SERVICE_NAME
         self.reply_to = [1]
         self.request_version = 1
         self.reply_versions = [1]
@@ -323,6 +355,76 @@ class HandleRequest(SantiagoTest):
             self.santiago.consuming[self.keyid][santiago.Santiago.SERVICE_NAME],
             [1, 2])
 
+    def test_batch(self):
+        """Version 2 requests are answered with one reply."""
+
+        replies = list()
+        self.santiago.outgoing_request = (lambda *args, **kwargs:
+                                              replies.append(args))
+        self.santiago.create_hosting_location(self.client, "wiki", [2])
+
+        self.service, self.request_version = ["wiki", "unhosted"], 2
+        self.reply_versions = [1, 2]
+        self.test_call()
+
+        self.assertEqual(len(replies), 1)
+        self.assertEqual(replies[0][4], ["wiki"])
+        self.assertEqual(dict(replies[0][5]), { "wiki": [2] })
+        self.assertEqual(replies[0][7], 2)
+
+    def test_batch_known_versions(self):
+        """Clients are only sent what changed since the version they know."""
+
+        replies = list()
+        self.santiago.outgoing_request = (lambda *args, **kwargs:
+                                              replies.append(args))
+        self.santiago.create_hosting_location(self.client, "wiki", [2])
+
+        self.service, self.request_version = ["wiki"], 2
+        self.reply_versions = [1, 2]
+        self.test_call()
+
+        self.santiago.create_hosting_location(self.client, "wiki", [3])
+        self.santiago.handle_request(
+            self.from_, self.to, self.host, self.client, self.service,
+            self.reply_to, 2, [1, 2],
+            { "wiki": versions.digest([2]),
+              self.service_name: versions.digest([1]) })
+
+        self.assertEqual(replies[-1][5],
+                         { "wiki": { "base": versions.digest([2]),
+                                     "added": [3] }})
+        self.assertEqual(replies[-1][6], None)
+
+    def test_ttl(self):
+        """Replies say how long each service is good for."""
+
+        ttls = list()
+        self.santiago.outgoing_request = (lambda *args, **kwargs:
+                                              ttls.append(kwargs["ttl"]))
+        self.santiago.service_ttls["wiki"] = 60
+        self.santiago.create_hosting_location(self.client, "wiki", [2])
+
+        self.service, self.request_version = "*", 2
+        self.reply_versions = [1, 2]
+        self.test_call()
+
+        self.assertEqual(ttls, [{ self.service_name: 3600, "wiki": 60 }])
+
+    def test_batch_all_services(self):
+        """Clients that can't read version 2 replies get one per service."""
+
+        replies = list()
+        self.santiago.outgoing_request = (lambda *args, **kwargs:
+                                              replies.append(args))
+        self.santiago.create_hosting_location(self.client, "wiki", [2])
+
+        self.service, self.request_version = "*", 2
+        self.test_call()
+
+        self.assertEqual(sorted(reply[4] for reply in replies),
+                         [santiago.Santiago.SERVICE_NAME, "wiki"])
+
 class OutgoingRequest(SantiagoTest):
     """Are outgoing requests properly formed?
 
@@ -361,7 +463,7 @@ class OutgoingRequest(SantiagoTest):
         self.reply_to = [ "https://1" ]
         self.locations = [1]
         self.request_version = 1
-        self.reply_versions = [1]
+        self.reply_versions = list(santiago.Santiago.SUPPORTED_CONNECTORS)
 
         self.request = {
             "host": self.host, "client": self.client,
@@ -467,6 +569,536 @@ class CreateConsuming(SantiagoTest):
         self.assertIn(self.location,
                        self.santiago.consuming[self.host][self.service])
 
+class WaitForReply(SantiagoTest):
+    """Do waiters hear about replies as soon as they're handled?"""
+
+    def setUp(self):
+        self.keyid = utilities.load_config().get("pgpprocessor", "keyid")
+
+        self.santiago = santiago.Santiago(me = self.keyid)
+
+        self.host = 1
+        self.service = 2
+
+    def reply(self):
+        self.santiago.handle_reply(
+            self.host, self.keyid, self.host, self.keyid, self.service,
+            ["https://1"], None, 1, [1])
+
+    def test_not_waiting(self):
+        """Services we never asked for aren't waited on."""
+
+        self.assertTrue(self.santiago.wait_for_reply(self.host, self.service,
+                                                     10))
+
+    def test_timeout(self):
+        self.santiago.requests.add(self.host, self.service)
+
+        self.assertFalse(self.santiago.wait_for_reply(self.host, self.service,
+                                                      0.1))
+
+    def test_replied(self):
+        self.santiago.requests.add(self.host, self.service)
+
+        replier = threading.Timer(0.1, self.reply)
+        replier.start()
+
+        started = time.time()
+        self.assertTrue(self.santiago.wait_for_reply(self.host, self.service,
+                                                     10))
+        self.assertTrue(time.time() - started < 5)
+        self.assertIn("https://1",
+                      self.santiago.consuming[self.host][self.service])
+
+class IncomingRequests(SantiagoTest):
+    """Does one bad request spare the rest of its batch?"""
+
+    def setUp(self):
+        self.keyid = utilities.load_config().get("pgpprocessor", "keyid")
+
+        self.santiago = santiago.Santiago(me = self.keyid)
+
+        self.handled = list()
+        self.santiago.scheduler.handler = self.handled.append
+
+    def encrypt(self, message):
+        return str(self.santiago.gpg.encrypt(message, self.keyid,
+                                             sign=self.keyid))
+
+    def test_mixed_batch(self):
+        """Signed, non-JSON requests are skipped, and the rest handled."""
+
+        request = { "host": self.keyid, "client": self.keyid,
+                    "service": santiago.Santiago.SERVICE_NAME,
+                    "reply_to": [1], "locations": [],
+                    "request_version": 1, "reply_versions": [1], }
+
+        self.santiago.incoming_request([self.encrypt("not json"),
+                                        self.encrypt(json.dumps(request))])
+
+        self.assertEqual(len(self.handled), 1)
+        self.assertEqual(self.handled[0]["service"],
+                         santiago.Santiago.SERVICE_NAME)
+
+    def test_drained_after_failure(self):
+        """Requests already submitted are drained, even if a later one fails."""
+
+        drained = list()
+        self.santiago.scheduler.drain = lambda: drained.append(True)
+
+        self.santiago.incoming_request(None)
+
+        self.assertEqual(drained, [True])
+
+class BatchRequests(SantiagoTest):
+    """Are several services asked for, and answered, at once?"""
+
+    def setUp(self):
+        self.keyid = utilities.load_config().get("pgpprocessor", "keyid")
+
+        self.santiago = santiago.Santiago(me = self.keyid)
+
+        self.host = 1
+
+    def test_batch_reply(self):
+        """Version 2 replies answer every service asked for."""
+
+        self.santiago.requests.add(self.host, santiago.Santiago.ALL_SERVICES)
+
+        self.santiago.handle_reply(
+            self.host, self.keyid, self.host, self.keyid, "*",
+            { "a": ["https://a"], "b": ["https://b"] }, None, 2, [1, 2])
+
+        self.assertIn("https://b", self.santiago.consuming[self.host]["b"])
+        self.assertNotIn(self.host, self.santiago.requests)
+
+    def test_unrequested_services(self):
+        """Services we didn't ask for aren't learned."""
+
+        self.santiago.requests.add(self.host, "a")
+
+        self.santiago.handle_reply(
+            self.host, self.keyid, self.host, self.keyid, ["a"],
+            { "a": ["https://a"], "b": ["https://b"] }, None, 2, [1, 2])
+
+        self.assertIn("a", self.santiago.consuming[self.host])
+        self.assertNotIn("b", self.santiago.consuming[self.host])
+
+    def record_requests(self):
+        """Record each outgoing request's service and version."""
+
+        self.santiago.create_consuming_location(
+            self.host, santiago.Santiago.SERVICE_NAME, ["https://1"])
+        self.sent = list()
+
+        def record(from_, to, host, client, service, locations="",
+                   reply_to="", request_version=1, *args, **kwargs):
+            self.sent.append((service, request_version))
+
+        self.santiago.outgoing_request = record
+
+    def test_unknown_host_queried_singly(self):
+        """Hosts that haven't replied might not accept batches."""
+
+        self.record_requests()
+        self.santiago.query_many(self.host, ["b", "a"])
+
+        self.assertEqual(self.sent, [("a", 1), ("b", 1)])
+
+    def test_unknown_host_all_services(self):
+        """Only batches can ask for all services, so they're sent as well."""
+
+        self.record_requests()
+        self.santiago.query_many(self.host, santiago.Santiago.ALL_SERVICES)
+
+        self.assertEqual(self.sent, [(santiago.Santiago.SERVICE_NAME, 1),
+                                     (santiago.Santiago.ALL_SERVICES, 2)])
+
+    def test_batching_host(self):
+        """Hosts that said they accept batches are sent them."""
+
+        self.record_requests()
+        self.santiago.requests.add(self.host, "a")
+        self.santiago.handle_reply(
+            self.host, self.keyid, self.host, self.keyid, "a",
+            ["https://a"], None, 1, [1, 2])
+
+        self.santiago.query_many(self.host, ["b", "a"], True)
+
+        self.assertEqual(self.sent, [(["a", "b"], 2)])
+
+    def test_old_host_all_services(self):
+        """Old hosts are asked for each service we consume from them."""
+
+        self.record_requests()
+        self.santiago.requests.add(self.host, "a")
+        self.santiago.handle_reply(
+            self.host, self.keyid, self.host, self.keyid, "a",
+            ["https://a"], None, 1, [1])
+
+        self.santiago.query_many(self.host, santiago.Santiago.ALL_SERVICES,
+                                 True)
+
+        self.assertEqual(sorted(self.sent),
+                         [("a", 1), (santiago.Santiago.SERVICE_NAME, 1)])
+
+class DeltaReplies(SantiagoTest):
+    """Are locations kept at the host's version, and changes applied to it?"""
+
+    def setUp(self):
+        self.keyid = utilities.load_config().get("pgpprocessor", "keyid")
+
+        self.santiago = santiago.Santiago(me = self.keyid)
+
+        self.host = 1
+
+    def reply(self, locations, version=2):
+        self.santiago.requests.add(self.host, "a")
+
+        self.santiago.handle_reply(
+            self.host, self.keyid, self.host, self.keyid,
+            ["a"] if version == 2 else "a",
+            { "a": locations } if version == 2 else locations,
+            None, version, [1, 2])
+
+    def consumed(self):
+        return list(self.santiago.consuming[self.host]["a"])
+
+    def test_full_reply_replaces(self):
+        """A whole list replaces what we knew, so our version is the host's."""
+
+        self.santiago.create_consuming_location(self.host, "a",
+                                                ["https://1", "https://2"])
+
+        self.reply(["https://3", "https://1"])
+
+        self.assertEqual(self.consumed(), ["https://3", "https://1"])
+        self.assertEqual(versions.digest(self.consumed()),
+                         versions.digest(["https://3", "https://1"]))
+
+        self.reply(["https://1"], version=1)
+
+        self.assertEqual(self.consumed(), ["https://1"])
+
+    def test_removed_location(self):
+        """A location the host stops hosting goes away for the client too."""
+
+        host = versions.LocationVersions()
+        key = (self.keyid, "a")
+
+        self.reply(host.change(key, None, ["https://1", "https://2"]))
+        known = versions.digest(self.consumed())
+        change = host.change(key, known, ["https://1"])
+
+        self.assertEqual(change, { "base": known, "removed": ["https://2"] })
+
+        self.reply(change)
+
+        self.assertEqual(self.consumed(), ["https://1"])
+
+    def test_changed_reply(self):
+        """Changes to the locations we know are applied."""
+
+        self.santiago.create_consuming_location(self.host, "a", ["https://1"])
+        self.reply({ "base": versions.digest(["https://1"]),
+                     "added": ["https://2"], "removed": ["https://1"] })
+
+        self.assertEqual(self.consumed(), ["https://2"])
+
+    def test_unknown_version(self):
+        """Changes to versions we don't know are ignored."""
+
+        self.santiago.create_consuming_location(self.host, "a", ["https://1"])
+        self.reply({ "base": "0123456789abcdef", "added": ["https://2"] })
+
+        self.assertEqual(self.consumed(), ["https://1"])
+
+class ServiceExpiry(SantiagoTest):
+    """Are consumed services fresh until their TTL passes, across restarts?"""
+
+    def setUp(self):
+        self.keyid = utilities.load_config().get("pgpprocessor", "keyid")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.santiago = self.create()
+
+        self.host = 1
+        self.service = 2
+
+    def create(self, **kwargs):
+        freedombuddy = santiago.Santiago(me=self.keyid,
+                                         save_dir=self.directory, **kwargs)
+        self.addCleanup(freedombuddy.shelf.close)
+
+        return freedombuddy
+
+    def test_ttl(self):
+        """Services that come with a TTL aren't queried until it passes."""
+
+        self.santiago.requests.add(self.host, self.service)
+        self.reply_with_ttl(100)
+
+        self.assertTrue(self.santiago.expiry.fresh(self.host, self.service))
+        self.assertEqual(self.santiago.query(self.host, self.service), None)
+        self.assertFalse(self.santiago.requests.pending(self.host,
+                                                        self.service))
+
+    def reply_with_ttl(self, ttl):
+        self.santiago.handle_reply(
+            self.host, self.keyid, self.host, self.keyid, self.service,
+            ["https://1"], None, 1, [1], { self.service: ttl })
+
+    def test_expiry_saved(self):
+        """When services expire is saved and loaded with their locations."""
+
+        self.santiago.requests.add(self.host, self.service)
+        self.reply_with_ttl(100)
+        self.santiago.save_data("consuming")
+
+        loaded = self.create()
+
+        self.assertEqual(loaded.expiry.expires(self.host, self.service),
+                         self.santiago.expiry.expires(self.host, self.service))
+        self.assertTrue(loaded.expiry.fresh(self.host, self.service))
+
+    def test_expiry_journaled(self):
+        """Learned expiry times are journaled, and replayed as they were."""
+
+        self.santiago.journal = JournaledChanges.RecordingJournal()
+
+        self.santiago.requests.add(self.host, self.service)
+        self.reply_with_ttl(100)
+
+        record = self.santiago.journal.records[-1]
+        expires = self.santiago.expiry.expires(self.host, self.service)
+
+        self.assertEqual(record, ("set_consuming_expiry", self.host,
+                                  self.service, 100, expires))
+        self.assertIn(record[0], santiago.Santiago.JOURNALED)
+
+        replayed = self.create()
+        getattr(replayed, record[0])(*record[1:])
+
+        self.assertEqual(replayed.expiry.expires(self.host, self.service),
+                         expires)
+
+class JournaledChanges(SantiagoTest):
+    """Is every change recorded for the journal, so it can be replayed?"""
+
+    class RecordingJournal(object):
+        def __init__(self):
+            self.records = list()
+
+        def append(self, operation, *args):
+            self.records.append((operation,) + args)
+
+    def setUp(self):
+        self.keyid = utilities.load_config().get("pgpprocessor", "keyid")
+
+        self.santiago = santiago.Santiago(me = self.keyid)
+        self.santiago.journal = JournaledChanges.RecordingJournal()
+
+    def test_only_changes_recorded(self):
+        self.santiago.create_hosting_location(1, 2, [3])
+        self.santiago.create_hosting_location(1, 2, [3, 4])
+
+        self.assertEqual(self.santiago.journal.records,
+                         [("create_hosting_client", 1),
+                          ("create_hosting_service", 1, 2),
+                          ("create_hosting_location", 1, 2, [3]),
+                          ("create_hosting_location", 1, 2, [4])])
+
+    def test_deletes_recorded(self):
+        self.santiago.create_consuming_location(1, 2, [3])
+        self.santiago.delete_consuming_location(1, 2, [3])
+        self.santiago.delete_consuming_host(1)
+
+        self.assertEqual(self.santiago.journal.records[-2:],
+                         [("delete_consuming_location", 1, 2, [3]),
+                          ("delete_consuming_host", 1)])
+
+    def test_records_replayable(self):
+        """Every recorded operation can be replayed."""
+
+        self.santiago.create_hosting_location(1, 2, [3])
+        self.santiago.replace_consuming_location(1, 2, [3])
+        self.santiago.delete_hosting_client(1)
+
+        for record in self.santiago.journal.records:
+            self.assertIn(record[0], santiago.Santiago.JOURNALED)
+
+    def test_given_data_snapshotted(self):
+        """Data we're given is saved before the old journal's dropped."""
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        given = santiago.Santiago(me=self.keyid, save_dir=directory,
+                                  persistence=santiago.Santiago.JOURNAL,
+                                  hosting={ "1": { "a": ["https://a"] } })
+        given.shelf.close()
+
+        loaded = santiago.Santiago(me=self.keyid, save_dir=directory,
+                                   persistence=santiago.Santiago.JOURNAL)
+        loaded.shelf.close()
+
+        self.assertEqual(list(loaded.hosting["1"]["a"]), ["https://a"])
+
+class SavedData(SantiagoTest):
+    """Is service data saved to its own file, and streamed back from it?"""
+
+    def setUp(self):
+        self.keyid = utilities.load_config().get("pgpprocessor", "keyid")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def create(self, **kwargs):
+        freedombuddy = santiago.Santiago(me=self.keyid,
+                                         save_dir=self.directory, **kwargs)
+        self.addCleanup(freedombuddy.shelf.close)
+
+        return freedombuddy
+
+    def test_round_trip(self):
+        saved = self.create(hosting={ "1": { "a": ["https://a"] } })
+        saved.save_data("hosting")
+
+        self.assertTrue(os.path.exists(saved.data_path("hosting")))
+        self.assertEqual(list(self.create().hosting["1"]["a"]),
+                         ["https://a"])
+
+    def test_private_directory(self):
+        """Decrypted data only spills where nobody else can read it."""
+
+        path = self.create().private_directory()
+
+        self.assertEqual(os.stat(path).st_mode & 0777, 0700)
+
+    def test_shelved_data_migrated(self):
+        """Data saved in the shelf is loaded, then moved to its own file."""
+
+        shelved = self.create()
+        shelved.shelf["hosting"] = str(shelved.gpg.encrypt(
+                '{ "1": { "a": ["https://a"] } }', recipients=[self.keyid],
+                sign=self.keyid))
+        shelved.shelf.close()
+
+        migrated = self.create(save_services=True)
+
+        self.assertEqual(migrated.migrated, set(["hosting"]))
+        self.assertNotIn("hosting", migrated.shelf)
+        self.assertEqual(list(self.create().hosting["1"]["a"]),
+                         ["https://a"])
+
+class ServiceIndexes(SantiagoTest):
+    """Do the reverse indexes follow every change?"""
+
+    def setUp(self):
+        self.keyid = utilities.load_config().get("pgpprocessor", "keyid")
+
+        self.santiago = santiago.Santiago(me = self.keyid)
+
+    def test_served_clients(self):
+        self.santiago.create_hosting_location(1, 2, [3])
+
+        self.assertEqual(self.santiago.get_served_clients(2), [1])
+        self.assertEqual(self.santiago.get_location_clients(3), [(1, 2)])
+
+        self.santiago.delete_hosting_client(1)
+
+        self.assertEqual(self.santiago.get_served_clients(2), [])
+        self.assertEqual(self.santiago.get_location_clients(3), [])
+
+    def test_serving_hosts(self):
+        self.santiago.create_consuming_location(1, 2, [3])
+
+        self.assertEqual(self.santiago.get_serving_hosts(2), [1])
+
+        self.santiago.delete_consuming_service(1, 2)
+
+        self.assertEqual(self.santiago.get_serving_hosts(2), [])
+
+    def test_locked(self):
+        """Indexes aren't read while they're being changed."""
+
+        changing = threading.Event()
+        changed = threading.Event()
+
+        def change():
+            with self.santiago.lock:
+                changing.set()
+                changed.wait(5)
+
+        changer = threading.Thread(target=change)
+        changer.start()
+        changing.wait(5)
+
+        served = list()
+        reader = threading.Thread(
+            target=lambda: served.append(self.santiago.get_served_clients(2)))
+        reader.start()
+        reader.join(0.2)
+
+        self.assertEqual(served, [])
+
+        changed.set()
+        reader.join(5)
+        changer.join(5)
+
+        self.assertEqual(served, [[]])
+
+class Monitors(SantiagoTest):
+    """Do the monitors report what they should?"""
+
+    def setUp(self):
+        self.keyid = utilities.load_config().get("pgpprocessor", "keyid")
+
+        self.santiago = santiago.Santiago(me = self.keyid)
+
+    def test_crypto_latency(self):
+        """The scheduling monitor shows how long crypto operations take."""
+
+        self.santiago.gpg.encrypt("hi", self.keyid)
+
+        stats = santiago.Scheduling(self.santiago).GET()
+
+        self.assertIn("encrypt", stats["crypto"]["operations"])
+        self.assertTrue(stats["crypto"]["operations"]["encrypt"]["count"] > 0)
+
+    def test_verification_cache(self):
+        """The scheduling monitor shows the verification cache's counters."""
+
+        self.santiago.verified.get("0123")
+
+        stats = santiago.Scheduling(self.santiago).GET()
+
+        self.assertEqual(stats["crypto"]["cache"]["misses"], 1)
+
+    def test_duplicates(self):
+        """The scheduling monitor shows how many duplicates were dropped."""
+
+        self.santiago.duplicates.seen("request")
+        self.santiago.duplicates.seen("request")
+
+        stats = santiago.Scheduling(self.santiago).GET()
+
+        self.assertEqual(stats["duplicates"]["checked"], 2)
+        self.assertEqual(stats["duplicates"]["duplicates"], 1)
+
+    def test_listeners(self):
+        """The scheduling monitor shows each listener's counters."""
+
+        class CountingListener(santiago.SantiagoListener):
+            def stats(self):
+                return { "admission": { "admitted": 1 } }
+
+        self.santiago.listeners = { "test": CountingListener(self.santiago) }
+
+        stats = santiago.Scheduling(self.santiago).GET()
+
+        self.assertEqual(stats["listeners"]["test"]["admission"]["admitted"], 1)
+
 class ArgumentTests(SantiagoTest):
     """Tests arguments to the FreedomBuddy service."""
 
@@ -486,6 +1118,31 @@ class ArgumentTests(SantiagoTest):
         """
         pass
 
+    def test_scheduling_config(self):
+        """Friends' quotas come from the configuration file."""
+
+        handle, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+
+        with os.fdopen(handle, "w") as config:
+            config.write("[scheduler]\nquota_requests = 5\n"
+                         "[quotas]\n0928D23A = , 100, 2\n")
+
+        options = OptionParser()
+        options.config = path
+
+        scheduling = santiago_test.load_scheduling(options)
+        quota = scheduling["quotas"]["0928d23a"]
+
+        self.assertEqual(scheduling["quota_requests"], 5)
+        self.assertEqual((quota.requests, quota.bytes, quota.weight),
+                         (5, 100, 2))
+
+        keyid = utilities.load_config().get("pgpprocessor", "keyid")
+        scheduler = santiago.Santiago(me=keyid, **scheduling).scheduler
+
+        self.assertEqual(scheduler.quota("FFFF0928D23A"), quota)
+
     def test_forgetting_services(self):
         """Are services correctly forgotten?
 
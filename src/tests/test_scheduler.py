@@ -0,0 +1,167 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for the per-friend fair scheduler."""
+
+import unittest
+
+from scheduler import FairScheduler, Quota
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1200.0
+
+    def __call__(self):
+        return self.now
+
+class Timer(object):
+    """Remembers when it would run, instead of running."""
+
+    started = list()
+
+    def __init__(self, delay, function):
+        self.delay, self.function = delay, function
+        self.daemon = False
+
+    def start(self):
+        Timer.started.append(self)
+
+    def cancel(self):
+        Timer.started.remove(self)
+
+class FairSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        Timer.started = list()
+        self.clock = Clock()
+        self.handled = list()
+        self.scheduler = FairScheduler(
+            self.handled.append, Quota(requests=2, bytes=100), period=60,
+            depth=3, clock=self.clock, timer=Timer)
+
+    def submit(self, key, *requests):
+        for request in requests:
+            self.scheduler.submit(key, request, 10)
+
+    def test_quota(self):
+        """Requests past the quota wait for the next period."""
+
+        self.submit("a", 1, 2, 3)
+
+        self.assertEqual(self.scheduler.drain(), 2)
+        self.assertEqual(self.handled, [1, 2])
+        self.assertEqual(Timer.started[0].delay, 60)
+
+        self.clock.now += 60
+        Timer.started.pop().function()
+
+        self.assertEqual(self.handled, [1, 2, 3])
+        self.assertEqual(Timer.started, [])
+
+    def test_deferred_once(self):
+        """Requests are counted as deferred once, however long they wait."""
+
+        self.scheduler.set_quota("a", Quota(requests=1))
+        self.submit("a", 1, 2, 3)
+        self.scheduler.drain()
+
+        for period in range(2):
+            self.clock.now += 60
+            Timer.started.pop().function()
+
+        self.assertEqual(self.handled, [1, 2, 3])
+        self.assertEqual(self.scheduler.stats()["deferred"], 2)
+
+    def test_parse_quota(self):
+        quota = Quota.parse("120, , 2.5", Quota(requests=1, bytes=2))
+
+        self.assertEqual((quota.requests, quota.bytes, quota.weight),
+                         (120, 2, 2.5))
+        self.assertEqual(Quota.parse("7").weight, 1)
+        self.assertRaises(ValueError, Quota.parse, "a lot")
+        self.assertRaises(ValueError, Quota.parse, "1, 2, 3, 4")
+
+    def test_bytes(self):
+        self.scheduler.submit("a", 1, 60)
+        self.scheduler.submit("a", 2, 60)
+        self.scheduler.drain()
+
+        self.assertEqual(self.handled, [1])
+
+    def test_large_request(self):
+        """Requests larger than the byte quota are handled alone."""
+
+        self.scheduler.submit("a", 1, 1000)
+        self.scheduler.drain()
+
+        self.assertEqual(self.handled, [1])
+
+    def test_fair(self):
+        """A chatty friend's backlog doesn't hold up the others."""
+
+        self.submit("chatty", 1, 2)
+        self.submit("quiet", "a")
+        self.scheduler.drain()
+
+        self.assertEqual(self.handled, [1, "a", 2])
+
+    def test_weights(self):
+        self.scheduler.set_quota("heavy", Quota(requests=10, weight=2))
+        self.scheduler.submit("light", 1, 12)
+        self.scheduler.submit("light", 2, 12)
+        self.submit("heavy", "a", "b", "c")
+        self.scheduler.drain()
+
+        self.assertEqual(self.handled, ["a", "b", 1, "c", 2])
+
+    def test_key_ids(self):
+        """Quotas for key IDs match the fingerprints that end with them."""
+
+        quota = Quota(requests=5)
+        self.scheduler.set_quota("89abcdef", quota)
+
+        self.assertIs(self.scheduler.quota("0123456789ABCDEF"), quota)
+        self.assertIs(self.scheduler.quota("0123"), self.scheduler.default)
+
+    def test_depth(self):
+        self.submit("a", 1, 2, 3)
+
+        self.assertFalse(self.scheduler.submit("a", 4, 10))
+        self.assertEqual(self.scheduler.stats()["dropped"], 1)
+
+    def test_failures(self):
+        """A failing request doesn't stop the others."""
+
+        def handle(request):
+            if request == 1:
+                raise ValueError(request)
+            self.handled.append(request)
+
+        self.scheduler.handler = handle
+        self.submit("a", 1, 2)
+
+        self.assertEqual(self.scheduler.drain(), 2)
+        self.assertEqual(self.handled, [2])
+        self.assertEqual(self.scheduler.stats()["failed"], 1)
+
+    def test_stats(self):
+        self.submit("a", 1, 2, 3)
+        self.scheduler.drain()
+
+        stats = self.scheduler.stats()
+
+        self.assertEqual((stats["handled"], stats["waiting"]), (2, 1))
+        self.assertEqual(stats["friends"]["a"]["bytes"], 20)
+
+    def test_stop(self):
+        self.submit("a", 1, 2, 3)
+        self.scheduler.drain()
+        self.scheduler.stop()
+
+        self.assertEqual(Timer.started, [])
+        self.assertEqual(self.scheduler.stats()["waiting"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
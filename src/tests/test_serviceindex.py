@@ -0,0 +1,53 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for the reverse service indexes."""
+
+import unittest
+
+from serviceindex import ServiceIndex
+
+
+class ServiceIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = ServiceIndex(
+            { "a": { "vpn": ["https://1"], "wiki": ["https://1"] },
+              "b": { "vpn": ["https://2"] } },
+            { "c": { "vpn": [] }, "d": { "wiki": [] } })
+
+    def test_rebuilt(self):
+        self.assertEqual(sorted(self.index.served_clients("vpn")), ["a", "b"])
+        self.assertEqual(self.index.serving_hosts("wiki"), ["d"])
+        self.assertEqual(sorted(self.index.location_clients("https://1")),
+                         [("a", "vpn"), ("a", "wiki")])
+
+    def test_unknown(self):
+        self.assertEqual(self.index.served_clients("ssh"), [])
+        self.assertEqual(self.index.serving_hosts("ssh"), [])
+        self.assertEqual(self.index.location_clients("https://3"), [])
+
+    def test_remove_locations(self):
+        self.index.remove_hosting("a", "vpn", ["https://1"])
+
+        self.assertEqual(self.index.location_clients("https://1"),
+                         [("a", "wiki")])
+        self.assertIn("a", self.index.served_clients("vpn"))
+
+    def test_remove_client(self):
+        self.index.remove_hosting_client(
+            "a", { "vpn": ["https://1"], "wiki": ["https://1"] })
+
+        self.assertEqual(self.index.served_clients("vpn"), ["b"])
+        self.assertEqual(self.index.served_clients("wiki"), [])
+        self.assertEqual(self.index.location_clients("https://1"), [])
+
+    def test_consuming(self):
+        self.index.add_consuming("d", "vpn")
+        self.index.remove_consuming_host("c", ["vpn"])
+
+        self.assertEqual(self.index.serving_hosts("vpn"), ["d"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for coalescing identical queries."""
+
+import threading
+import unittest
+
+from singleflight import SingleFlight
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.queries = SingleFlight(min_interval=30, clock=self.clock)
+        self.calls = list()
+
+    def send(self):
+        self.calls.append(1)
+        return len(self.calls)
+
+    def test_joined(self):
+        """Callers that ask while a call is in progress share its result."""
+
+        started, finish = threading.Event(), threading.Event()
+        results = list()
+
+        def slow():
+            started.set()
+            finish.wait(5)
+            return self.send()
+
+        leader = threading.Thread(
+            target=lambda: results.append(self.queries.call("key", slow)))
+        leader.start()
+        started.wait(5)
+
+        follower = threading.Thread(
+            target=lambda: results.append(
+                self.queries.call("key", self.send, force=True)))
+        follower.start()
+
+        while not self.queries.stats()["joined"]:
+            follower.join(0.01)
+
+        finish.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual((results, self.calls), ([1, 1], [1]))
+
+    def test_throttled(self):
+        self.queries.call("key", self.send)
+        self.clock.now += 29
+
+        self.assertEqual(self.queries.call("key", self.send), None)
+        self.assertEqual(self.queries.call("other", self.send), 2)
+
+        self.clock.now += 1
+
+        self.assertEqual(self.queries.call("key", self.send), 3)
+        self.assertEqual(self.queries.stats()["throttled"], 1)
+
+    def test_forced(self):
+        self.queries.call("key", self.send)
+
+        self.assertEqual(self.queries.call("key", self.send, force=True), 2)
+
+    def test_outstanding(self):
+        """Calls whose results are still outstanding aren't repeated."""
+
+        queries = SingleFlight(clock=self.clock)
+
+        self.assertEqual(queries.call("key", self.send,
+                                      outstanding=lambda: True), None)
+        self.assertEqual(queries.call("key", self.send, force=True,
+                                      outstanding=lambda: True), 1)
+        self.assertEqual(queries.stats()["outstanding"], 1)
+
+    def test_failure(self):
+        """A failed call doesn't stay in flight."""
+
+        def fail():
+            raise ValueError()
+
+        self.assertRaises(ValueError, self.queries.call, "key", fail)
+        self.assertEqual(self.queries.stats()["in_flight"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for the structured tracer."""
+
+import unittest
+
+import tracing
+
+
+class DisabledSink(object):
+    def enabled(self):
+        return False
+
+    def record(self, event):
+        raise AssertionError("Disabled sinks don't record.")
+
+class TracerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = tracing.RingBuffer(2)
+        self.tracer = tracing.Tracer([self.ring])
+
+    def test_disabled_is_lazy(self):
+        """Fields aren't computed when nobody's listening."""
+
+        tracer = tracing.Tracer([DisabledSink()])
+
+        tracer.trace("event", expensive=lambda: 1 / 0)
+
+    def test_lazy_fields_computed(self):
+        self.tracer.trace("event", value=lambda: 3)
+
+        self.assertEqual(list(self.ring)[0]["fields"], { "value": "3" })
+
+    def test_structured_event(self):
+        self.tracer.trace("request.received", host="a")
+
+        event = list(self.ring)[0]
+        self.assertEqual(event["event"], "request.received")
+        self.assertEqual(event["caller"], None)
+
+    def test_caller_on_request(self):
+        self.tracer.trace("event", caller=True)
+
+        self.assertEqual(list(self.ring)[0]["caller"][1],
+                         "test_caller_on_request")
+
+    def test_ring_buffer_bounded(self):
+        for i in range(3):
+            self.tracer.trace("event", i=i)
+
+        self.assertEqual([x["fields"]["i"] for x in self.ring], ["1", "2"])
+
+    def test_logging_format(self):
+        self.tracer.trace("event", b=2, a="x")
+
+        event = list(self.ring)[0]
+        event["fields"] = { "b": 2, "a": "x" }
+
+        self.assertTrue(tracing.LoggingSink.format(event).endswith(
+                "event: a='x', b=2"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for the shared utilities."""
+
+import unittest
+
+from utilities import OrderedSet
+
+
+class OrderedSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.locations = OrderedSet(["https://b", "https://a", "https://b"])
+
+    def test_insertion_order(self):
+        """Items keep the order they were first added in."""
+
+        self.locations.add("https://c")
+        self.locations.add("https://b")
+
+        self.assertEqual(list(self.locations),
+                         ["https://b", "https://a", "https://c"])
+
+    def test_membership(self):
+        self.assertTrue("https://a" in self.locations)
+        self.assertFalse("https://c" in self.locations)
+
+    def test_discard(self):
+        self.locations.discard("https://b")
+        self.locations.discard("https://c")
+
+        self.assertEqual(self.locations, ["https://a"])
+
+    def test_remove_missing(self):
+        self.assertRaises(KeyError, self.locations.remove, "https://c")
+
+    def test_compares_to_lists(self):
+        self.assertEqual(self.locations, ["https://b", "https://a"])
+        self.assertEqual(self.locations, ("https://b", "https://a"))
+        self.assertNotEqual(self.locations, ["https://a", "https://b"])
+
+    def test_indexing(self):
+        self.assertEqual(self.locations[0], "https://b")
+
+    def test_empty_is_false(self):
+        self.assertFalse(OrderedSet())
+
+
+if __name__ == "__main__":
+    unittest.main()
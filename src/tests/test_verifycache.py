@@ -0,0 +1,103 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for the verification cache."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from verifycache import VerificationCache
+
+
+class Result(object):
+    """Stands in for a ``gnupg.Crypt``."""
+
+    def __init__(self, data, valid=True):
+        self.data = data
+        self.valid = valid
+        self.fingerprint = "ABCD" if valid else None
+
+    def __nonzero__(self):
+        return self.valid
+
+    def __str__(self):
+        return self.data
+
+class VerificationCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.keyring = os.path.join(self.directory, "pubring.gpg")
+        self.touch(0)
+
+        self.cache = VerificationCache(2, [self.keyring])
+        self.calls = list()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def touch(self, when):
+        with open(self.keyring, "a") as keyring:
+            keyring.write("key")
+
+        os.utime(self.keyring, (when, when))
+
+    def decrypt(self, data, valid=True):
+        self.calls.append(data)
+        return Result(data.upper(), valid)
+
+    def call(self, data, **kwargs):
+        return self.cache.call("decrypt", self.decrypt, data, **kwargs)
+
+    def test_hit(self):
+        """Data's only decrypted once."""
+
+        self.call("a")
+        outcome = self.call("a")
+
+        self.assertEqual((str(outcome), outcome.fingerprint), ("A", "ABCD"))
+        self.assertEqual(self.calls, ["a"])
+        self.assertEqual((self.cache.stats()["hits"],
+                          self.cache.stats()["misses"]), (1, 1))
+
+    def test_operations_kept_apart(self):
+        self.call("a")
+        self.cache.call("verify", self.decrypt, "a")
+
+        self.assertEqual(self.calls, ["a", "a"])
+
+    def test_least_recently_used_dropped(self):
+        self.call("a")
+        self.call("b")
+        self.call("a")
+        self.call("c")
+        self.call("a")
+        self.call("b")
+
+        self.assertEqual(self.calls, ["a", "b", "c", "b"])
+
+    def test_invalid_not_kept(self):
+        self.call("a", valid=False)
+        outcome = self.call("a", valid=False)
+
+        self.assertFalse(outcome.valid)
+        self.assertEqual(self.calls, ["a", "a"])
+
+    def test_data_not_kept(self):
+        self.assertEqual(str(self.call("a", keep_data=False)), "")
+
+    def test_keyring_change(self):
+        """Changing the keyring forgets everything."""
+
+        self.call("a")
+        self.touch(10)
+        self.call("a")
+
+        self.assertEqual(self.calls, ["a", "a"])
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
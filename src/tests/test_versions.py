@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+# -*- mode: python; mode: auto-fill; fill-column: 80 -*-
+
+"""Tests for location-set versions and the changes between them."""
+
+import unittest
+
+import versions
+from versions import LocationVersions
+
+
+class LocationVersionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.versions = LocationVersions(depth=2, size=2)
+        self.key = ("client", "wiki")
+
+    def test_unknown(self):
+        """Clients that don't know a version get the whole list."""
+
+        self.assertEqual(self.versions.change(self.key, None, ["a"]), ["a"])
+
+    def test_unchanged(self):
+        self.versions.change(self.key, None, ["a"])
+
+        self.assertEqual(
+            self.versions.change(self.key, versions.digest(["a"]), ["a"]),
+            { "base": versions.digest(["a"]) })
+
+    def test_changed(self):
+        self.versions.change(self.key, None, ["a", "b"])
+
+        change = self.versions.change(self.key, versions.digest(["a", "b"]),
+                                      ["b", "c"])
+
+        self.assertEqual(change, { "base": versions.digest(["a", "b"]),
+                                   "added": ["c"], "removed": ["a"] })
+        self.assertEqual(versions.apply_change(["a", "b"], change), ["b", "c"])
+
+    def test_reordered(self):
+        """Changes can't reorder locations, so the whole list is sent."""
+
+        self.versions.change(self.key, None, ["a", "b"])
+
+        self.assertEqual(
+            self.versions.change(self.key, versions.digest(["a", "b"]),
+                                 ["b", "a"]),
+            ["b", "a"])
+
+    def test_forgotten_version(self):
+        """Only the last few versions are remembered."""
+
+        for locations in (["a"], ["a", "b"], ["a", "b", "c"]):
+            self.versions.change(self.key, None, locations)
+
+        self.assertEqual(
+            self.versions.change(self.key, versions.digest(["a"]), ["a", "b"]),
+            ["a", "b"])
+
+    def test_bounded(self):
+        for service in ("a", "b", "c"):
+            self.versions.change(("client", service), None, ["x"])
+
+        self.assertEqual(list(self.versions.versions),
+                         [("client", "b"), ("client", "c")])
+
+    def test_is_change(self):
+        self.assertTrue(versions.is_change({ "base": "ab", "added": ["x"] }))
+        self.assertFalse(versions.is_change({ "base": "ab", "added": "x" }))
+        self.assertFalse(versions.is_change({ "added": ["x"] }))
+        self.assertFalse(versions.is_change(["x"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
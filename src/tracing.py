@@ -0,0 +1,132 @@
+"""Structured, nearly free debug tracing.
+
+Each trace is an event name and a handful of fields::
+
+    tracing.trace("request.unpacked", host=host, service=service)
+
+When no sink wants the event (by default, when the root logger isn't logging
+DEBUG messages), ``trace`` returns before doing any work at all.  Fields are
+only formatted when an event is actually recorded, and any field that's
+callable is only called then, so expensive values can be deferred::
+
+    tracing.trace("reply.handled", consuming=lambda: dict(self.consuming))
+
+The caller's file, function, and line are only looked up for events traced
+with ``caller=True``.
+
+Events go to every sink attached to the tracer: a ``LoggingSink`` by default,
+and optionally a ``RingBuffer`` that keeps the most recent events in memory.
+
+"""
+
+import collections
+import logging
+import sys
+import time
+
+
+class LoggingSink(object):
+    """Writes events to a logger, as ``event: key=value, key=value``."""
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger()
+        self.level = level
+
+    def enabled(self):
+        return self.logger.isEnabledFor(self.level)
+
+    def record(self, event):
+        self.logger.log(self.level, "%s", LoggingSink.format(event))
+
+    @classmethod
+    def format(cls, event):
+        fields = ", ".join("{0}={1!r}".format(key, value) for key, value in
+                           sorted(event["fields"].iteritems()))
+        location = ("{0}.{1}.{2}: ".format(*event["caller"])
+                    if event["caller"] else "")
+
+        return "{0}{1}: {2}: {3}".format(location, event["time"],
+                                         event["event"], fields)
+
+class RingBuffer(object):
+    """Keeps the most recent ``size`` events in memory.
+
+    Field values are stored as their ``repr``, so later changes to the traced
+    objects don't change the record.
+
+    """
+    def __init__(self, size=1000):
+        self.events = collections.deque(maxlen=int(size))
+
+    def enabled(self):
+        return True
+
+    def record(self, event):
+        event = dict(event)
+        event["fields"] = dict((key, repr(value)) for key, value in
+                               event["fields"].iteritems())
+        self.events.append(event)
+
+    def __iter__(self):
+        return iter(list(self.events))
+
+class Tracer(object):
+    """Sends events to its sinks, when any of them are listening."""
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks) if sinks is not None else [LoggingSink()]
+
+    def enabled(self):
+        """Whether any sink would record an event right now."""
+
+        for sink in self.sinks:
+            if sink.enabled():
+                return True
+
+        return False
+
+    def trace(self, event, caller=False, **fields):
+        """Record an event with its fields.
+
+        Callable fields are called first.  If ``caller`` is set, the calling
+        function's file, name and line are recorded too.
+
+        """
+        return self._trace(event, 2 if caller else 0, fields)
+
+    def _trace(self, event, depth, fields):
+        """Record the event, with the caller ``depth`` frames up, if any."""
+
+        listening = [sink for sink in self.sinks if sink.enabled()]
+        if not listening:
+            return
+
+        for key, value in fields.iteritems():
+            if callable(value):
+                fields[key] = value()
+
+        caller = None
+        if depth:
+            frame = sys._getframe(depth)
+            caller = (frame.f_code.co_filename, frame.f_code.co_name,
+                      frame.f_lineno)
+            del frame
+
+        record = { "event": event, "time": time.time(),
+                   "caller": caller, "fields": fields }
+
+        for sink in listening:
+            sink.record(record)
+
+
+tracer = Tracer()
+
+def trace(event, caller=False, **fields):
+    """Trace an event through the module's tracer."""
+
+    return tracer._trace(event, 2 if caller else 0, fields)
+
+def enabled():
+    """Whether the module's tracer is recording anything."""
+
+    return tracer.enabled()
@@ -1,9 +1,11 @@
 """Shared utilities.
 
-Currently contains a bunch of errors and config-file shortcuts.
+Currently contains a bunch of errors, config-file shortcuts, and the ordered
+set used to store service locations.
 
 """
 
+from collections import OrderedDict
 import ConfigParser as configparser
 
 
@@ -46,3 +48,75 @@ class UnwillingHostError(SignatureError):
     """The current process isn't willing to host a service for the client."""
 
     pass
+
+
+class OrderedSet(object):
+    """A set that remembers the order its items were added in.
+
+    Service locations are kept in these: order matters (the first location is
+    the preferred one), but checking, adding, and removing locations should
+    take constant time, no matter how many locations a service has.
+
+    It compares equal to lists and tuples with the same items in the same order,
+    so it can stand in for the lists locations used to be stored in.
+
+    >>> locations = OrderedSet(["https://a", "https://b", "https://a"])
+    >>> locations.add("https://c")
+    >>> locations.discard("https://a")
+    >>> locations == ["https://b", "https://c"]
+    True
+
+    """
+    def __init__(self, items=()):
+        self.items = OrderedDict()
+
+        for item in items:
+            self.items[item] = None
+
+    def add(self, item):
+        self.items[item] = None
+
+    def discard(self, item):
+        self.items.pop(item, None)
+
+    def remove(self, item):
+        """Remove the item, raising a KeyError if it's missing."""
+
+        del self.items[item]
+
+    def update(self, items):
+        for item in items:
+            self.items[item] = None
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __reversed__(self):
+        return reversed(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        """Return the item at the index.  Slow: prefer iterating."""
+
+        return list(self.items)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (OrderedSet, list, tuple)):
+            return list(self) == list(other)
+
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{0}({1!r})".format(self.__class__.__name__, list(self))
@@ -0,0 +1,179 @@
+"""A cache of gpg verification and decryption outcomes.
+
+The same signed or encrypted data gets checked again and again: journal
+blocks, retransmitted requests from peers that didn't hear back, and so on.
+Each check starts a gpg process.  Instead, the outcome of each successful check
+is kept, keyed by a digest of the armored data, and reused until it's pushed
+out by newer outcomes or the keyring changes::
+
+    >>> cache = VerificationCache(1024, keyring_files())
+    >>> cache.call("verify", gpg.verify, signed_data).valid
+    True
+    >>> cache.stats()["misses"]
+    1
+
+Only valid outcomes are kept, so garbage can't push real outcomes out of the
+cache, and data that fails now is checked again later.
+
+Decrypted plaintext is kept in memory, so size the cache to match.
+
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+
+def keyring_files(gnupghome=None, keyring=None):
+    """The files that change when gpg's keyring or trust database does.
+
+    Uses the same defaults as ``gnupg.GPG``.
+
+    """
+    if gnupghome is None:
+        gnupghome = os.environ.get("GNUPGHOME",
+                                   os.path.expanduser("~/.gnupg"))
+
+    files = [os.path.join(gnupghome, name)
+             for name in ("pubring.gpg", "pubring.kbx", "trustdb.gpg")]
+
+    if isinstance(keyring, basestring):
+        keyring = [keyring]
+
+    for ring in keyring or ():
+        files.append(ring if os.path.isabs(ring)
+                     else os.path.join(gnupghome, ring))
+
+    return files
+
+class Verification(object):
+    """The parts of a gpg result that matter, without the gpg process.
+
+    Looks enough like a ``gnupg.Verify`` or ``gnupg.Crypt`` to stand in for
+    one: it's true when the original was and its string is the plaintext.
+
+    """
+    def __init__(self, result, keep_data=True):
+        self.valid = result.valid
+        self.fingerprint = getattr(result, "fingerprint", None)
+        self.key_id = getattr(result, "key_id", None)
+        self.username = getattr(result, "username", None)
+        self.truth = bool(result)
+        self.data = str(result) if keep_data else ""
+
+    def __nonzero__(self):
+        return self.truth
+
+    def __str__(self):
+        return self.data
+
+class VerificationCache(object):
+    """A bounded, least-recently-used cache of valid gpg outcomes."""
+
+    def __init__(self, size=1024, keyrings=()):
+        """Create the cache.
+
+        :size: the most outcomes to keep.
+
+        :keyrings: the files whose changes make every outcome stale.
+
+        """
+        self.size = int(size)
+        self.keyrings = list(keyrings)
+        self.outcomes = OrderedDict()
+        self.lock = threading.Lock()
+        self.signature = self.keyring_signature()
+        self.hits = self.misses = self.invalidations = 0
+
+    @classmethod
+    def digest(cls, operation, data):
+        """The key for the outcome of the operation on the armored data."""
+
+        return hashlib.sha256(operation + "\0" + data).hexdigest()
+
+    def get(self, digest):
+        """Return the outcome for the digest, or None."""
+
+        self.check_keyrings()
+
+        with self.lock:
+            outcome = self.outcomes.pop(digest, None)
+
+            if outcome is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.outcomes[digest] = outcome
+
+        return outcome
+
+    def put(self, digest, result, keep_data=True):
+        """Keep the gpg result, if it's valid, and return what was kept.
+
+        Invalid results are returned as they are.
+
+        """
+        if not (result and result.valid) or self.size < 1:
+            return result
+
+        outcome = Verification(result, keep_data)
+
+        with self.lock:
+            self.outcomes.pop(digest, None)
+            self.outcomes[digest] = outcome
+
+            while len(self.outcomes) > self.size:
+                self.outcomes.popitem(last=False)
+
+        return outcome
+
+    def call(self, operation, function, data, keep_data=True, **kwargs):
+        """Return the cached outcome of ``function(data, **kwargs)``.
+
+        The function's only called on a miss.  Without ``keep_data``, the
+        plaintext isn't kept (signed data carries its own).
+
+        """
+        digest = VerificationCache.digest(operation, data)
+        outcome = self.get(digest)
+
+        if outcome is None:
+            outcome = self.put(digest, function(data, **kwargs), keep_data)
+
+        return outcome
+
+    def keyring_signature(self):
+        signature = list()
+
+        for path in self.keyrings:
+            try:
+                status = os.stat(path)
+            except OSError:
+                signature.append(None)
+            else:
+                signature.append((status.st_mtime, status.st_size))
+
+        return signature
+
+    def check_keyrings(self):
+        """Forget every outcome if a keyring has changed."""
+
+        signature = self.keyring_signature()
+
+        if signature != self.signature:
+            with self.lock:
+                self.signature = signature
+                self.outcomes.clear()
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.outcomes.clear()
+
+    def stats(self):
+        with self.lock:
+            return { "hits": self.hits,
+                     "misses": self.misses,
+                     "invalidations": self.invalidations,
+                     "size": len(self.outcomes) }
@@ -0,0 +1,133 @@
+"""Location-set versions, so unchanged locations needn't be sent again.
+
+Clients that already know a service's locations send the version they know,
+a digest of the locations, with their requests.  The host answers with a
+change from that version, instead of the whole list::
+
+    >>> versions = LocationVersions()
+    >>> versions.change(("client", "wiki"), "", ["https://a"])
+    ['https://a']
+    >>> known = digest(["https://a"])
+    >>> versions.change(("client", "wiki"), known, ["https://a", "https://b"])
+    {'base': '...', 'added': ['https://b']}
+    >>> versions.change(("client", "wiki"), digest(["https://a", "https://b"]),
+    ...                 ["https://a", "https://b"])
+    {'base': '...'}
+
+A change names its ``base`` version and lists the locations ``added`` and
+``removed`` since then.  If nothing changed, it only names its base.  The host
+keeps the last few versions of each service it's sent, and sends the whole
+list when the client's version is older than those, or when a change can't
+reproduce the list's order.
+
+"""
+
+from collections import OrderedDict, deque
+import hashlib
+import json
+import threading
+
+
+def digest(locations):
+    """The version of a list of locations."""
+
+    return hashlib.sha256(
+        json.dumps(list(locations), separators=(",", ":"))).hexdigest()[:16]
+
+def apply_change(locations, change):
+    """Return the locations after the change.
+
+    Removed locations are dropped and added ones appended, in order.
+
+    """
+    removed = set(change.get("removed", ()))
+    result = [location for location in locations if location not in removed]
+
+    return result + [location for location in change.get("added", ())
+                     if location not in result]
+
+def is_change(value):
+    """Whether a reply's locations are a change, instead of the whole list."""
+
+    return (type(value) == dict and
+            isinstance(value.get("base"), basestring) and
+            False not in [type(value.get(key, [])) == list
+                          for key in ("added", "removed")])
+
+class LocationVersions(object):
+    """The last few versions of each service's locations that were sent."""
+
+    def __init__(self, depth=4, size=1024):
+        """Prepare the history.
+
+        :depth: the most versions to remember of each service.
+
+        :size: the most services to remember versions of.  The least recently
+          sent are forgotten first.
+
+        """
+        self.depth = max(1, int(depth))
+        self.size = max(1, int(size))
+
+        self.versions = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = { "full": 0, "changed": 0, "unchanged": 0 }
+
+    def change(self, key, known, locations):
+        """What to send a client that knows the ``known`` version.
+
+        Returns the whole list of locations, or a change from the known
+        version.  Either way, the current version is remembered.
+
+        """
+        locations = list(locations)
+        current = digest(locations)
+
+        with self.lock:
+            history = self.versions.pop(key, None) or deque(maxlen=self.depth)
+            self.versions[key] = history
+
+            if not history or history[-1][0] != current:
+                history.append((current, locations))
+
+            while len(self.versions) > self.size:
+                self.versions.popitem(last=False)
+
+            if known == current:
+                self.counters["unchanged"] += 1
+                return { "base": known }
+
+            for version, old in history:
+                if version == known:
+                    break
+            else:
+                self.counters["full"] += 1
+                return locations
+
+            change = { "base": known }
+            added = [place for place in locations if place not in old]
+            removed = [place for place in old if place not in locations]
+
+            if added:
+                change["added"] = added
+            if removed:
+                change["removed"] = removed
+
+            # changes can't reorder locations.
+            if apply_change(old, change) != locations:
+                self.counters["full"] += 1
+                return locations
+
+            self.counters["changed"] += 1
+            return change
+
+    def clear(self):
+        with self.lock:
+            self.versions.clear()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self.versions)
+
+        return stats
@@ -12,4 +12,23 @@ python tests/test_pgpprocessor.py
 python tests/test_santiago.py
 python tests/test_santiago_listener.py
 python tests/test_gnupg.py
+python tests/test_gpgpool.py
+python tests/test_inbound.py
+python tests/test_fanout.py
+python tests/test_tracing.py
+python tests/test_journal.py
+python tests/test_registry.py
+python tests/test_serviceindex.py
+python tests/test_utilities.py
+python tests/test_verifycache.py
+python tests/test_pgppackets.py
+python tests/test_dedup.py
+python tests/test_scheduler.py
+python tests/test_pending.py
+python tests/test_singleflight.py
+python tests/test_versions.py
+python tests/test_expiry.py
 python connectors/https/test_controller.py
+python connectors/https/test_pool.py
+python connectors/https/test_templatecache.py
+python connectors/https/test_admission.py